@@ -1,22 +1,31 @@
 """Shared alert utilities used by all scanners."""
-from datetime import datetime, timedelta
+from functools import lru_cache
 import logging
-import requests
+import os
+import time
+import orjson
+from http_session import SESSION
 
 logger = logging.getLogger(__name__)
 
 
+@lru_cache(maxsize=16)
+def _hhmm_minutes(hhmm):
+    """'HH:MM' → minutes since midnight (parsed once per distinct setting)."""
+    h, m = map(int, hhmm.split(':'))
+    return h * 60 + m
+
+
 def is_in_schedule(schedule_start, schedule_end, utc_offset=0):
-    """Return True if current local time (UTC+offset) is within the configured window."""
+    """Return True if current local time (UTC+offset) is within the configured window.
+    Runs on every WS tick: the local minute of day is plain epoch-float math,
+    no datetime/timedelta objects."""
     if not schedule_start or not schedule_end:
         return True
     try:
-        now = datetime.utcnow() + timedelta(hours=utc_offset)
-        sh, sm = map(int, schedule_start.split(':'))
-        eh, em = map(int, schedule_end.split(':'))
-        now_m   = now.hour * 60 + now.minute
-        start_m = sh * 60 + sm
-        end_m   = eh * 60 + em
+        now_m   = int((time.time() + utc_offset * 3600) // 60) % 1440
+        start_m = _hhmm_minutes(schedule_start)
+        end_m   = _hhmm_minutes(schedule_end)
         if start_m <= end_m:
             return start_m <= now_m <= end_m
         return now_m >= start_m or now_m <= end_m
@@ -48,6 +57,28 @@ def mtf_link(symbol, base_url=''):
     return name
 
 
+_LINKS_TEMPLATE = ('<a href="https://www.bybit.com/trade/usdt/{sym}">- View Bybit</a>\n'
+                   '<a href="{base}/mtf?symbol={sym}">- View Desktop</a>\n'
+                   '<a href="{base}/trade?symbol={sym}">- View Mobile</a>')
+
+
+@lru_cache(maxsize=1024)
+def alert_links(symbol, base_url=''):
+    """Bybit / Desktop / Mobile link block closing every alert caption (cached per symbol)."""
+    base = (base_url or 'https://cryptoscannerpro.com').rstrip('/')
+    return _LINKS_TEMPLATE.format(sym=symbol, base=base)
+
+
+_CAPTION_SEP      = '-' * 48
+_CAPTION_TEMPLATE = '{header}\n\n' + _CAPTION_SEP + '\n{rows}\n' + _CAPTION_SEP + '\n\n{links}'
+
+
+def alert_caption(header, rows, symbol, base_url=''):
+    """Standard alert caption: header, the '- Key: value' rows between two separator
+    lines, then the link block. One format() of a prebuilt template."""
+    return _CAPTION_TEMPLATE.format(header=header, rows='\n'.join(rows),
+                                    links=alert_links(symbol, base_url))
+
 
 def log_alert(symbol, alert_type, emoji='🔔', note='', tf=None, screenshot=None):
     """Write an alert entry to the daily log (resets at UTC midnight)."""
@@ -58,23 +89,101 @@ def log_alert(symbol, alert_type, emoji='🔔', note='', tf=None, screenshot=Non
         logger.warning(f'daily_log error: {e}')
 
 
+def _multipart(fields, files):
+    """
+    multipart/form-data body for text `fields` and PNG `files` ({name: (filename, bytes)}).
+    The PNGs are copied exactly once, by the final join; requests' own `files=`
+    encoder writes each one into a BytesIO and copies that buffer out again.
+    Returns (body, content_type).
+    """
+    boundary = os.urandom(16).hex()
+    parts = []
+    for name, value in fields.items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"'
+                     f'\r\n\r\n{value}\r\n'.encode())
+    for name, (filename, data) in files.items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; '
+                     f'filename="{filename}"\r\nContent-Type: image/png\r\n\r\n'.encode())
+        parts.append(data)
+        parts.append(b'\r\n')
+    parts.append(f'--{boundary}--\r\n'.encode())
+    return b''.join(parts), f'multipart/form-data; boundary={boundary}'
+
+
+def _telegram_ok(r, method):
+    """True if a Bot API reply is a success; otherwise log Telegram's description."""
+    try:
+        data = orjson.loads(r.content)
+    except orjson.JSONDecodeError:
+        data = {}
+    if r.ok and data.get('ok'):
+        return True
+    logger.error(f'Telegram {method} failed ({r.status_code}): {data.get("description", r.reason)}')
+    return False
+
+
 def send_photo(token, chat_id, image_bytes, caption):
-    """Send a Telegram photo with HTML caption."""
+    """Send a Telegram photo with HTML caption. Returns True if Telegram accepted it."""
     try:
-        requests.post(
+        body, ctype = _multipart(
+            {'chat_id': chat_id, 'caption': caption, 'parse_mode': 'HTML'},
+            {'photo': ('chart.png', image_bytes)},
+        )
+        r = SESSION.post(
             f'https://api.telegram.org/bot{token}/sendPhoto',
-            files={'photo': ('chart.png', image_bytes, 'image/png')},
-            data={'chat_id': chat_id, 'caption': caption, 'parse_mode': 'HTML'},
-            timeout=30,
+            data=body, headers={'Content-Type': ctype}, timeout=30,
         )
+        return _telegram_ok(r, 'sendPhoto')
     except Exception as e:
         logger.error(f'Telegram photo error: {e}')
+        return False
+
+
+MEDIA_GROUP_MAX = 10   # Telegram's sendMediaGroup album limit
+
+
+def send_photos(token, chat_id, photos):
+    """
+    Send (image_bytes, caption) pairs as Telegram albums: one sendMediaGroup
+    POST per MEDIA_GROUP_MAX photos instead of one sendPhoto each. Every photo
+    keeps its own HTML caption; a lone photo goes through send_photo.
+    A rejected album (one bad caption, a 400, a 429 past its retries) would lose
+    every alert in it, so its items are then resent one by one, falling back to
+    a text message for any photo Telegram still refuses.
+    """
+    for start in range(0, len(photos), MEDIA_GROUP_MAX):
+        chunk = photos[start:start + MEDIA_GROUP_MAX]
+        if len(chunk) > 1 and _send_media_group(token, chat_id, chunk):
+            continue
+        for img, caption in chunk:
+            if not send_photo(token, chat_id, img, caption):
+                send_text(token, chat_id, caption)
+
+
+def _send_media_group(token, chat_id, chunk):
+    """One sendMediaGroup POST for `chunk`; True if Telegram accepted the album."""
+    media = [{'type': 'photo', 'media': f'attach://photo{i}',
+              'caption': caption, 'parse_mode': 'HTML'}
+             for i, (_, caption) in enumerate(chunk)]
+    files = {f'photo{i}': (f'chart{i}.png', img)
+             for i, (img, _) in enumerate(chunk)}
+    try:
+        body, ctype = _multipart(
+            {'chat_id': chat_id, 'media': orjson.dumps(media).decode()}, files)
+        r = SESSION.post(
+            f'https://api.telegram.org/bot{token}/sendMediaGroup',
+            data=body, headers={'Content-Type': ctype}, timeout=60,
+        )
+        return _telegram_ok(r, 'sendMediaGroup')
+    except Exception as e:
+        logger.error(f'Telegram media group error: {e}')
+        return False
 
 
 def send_text(token, chat_id, text):
     """Send an HTML Telegram message."""
     try:
-        requests.post(
+        SESSION.post(
             f'https://api.telegram.org/bot{token}/sendMessage',
             json={'chat_id': chat_id, 'text': text, 'parse_mode': 'HTML'},
             timeout=10,
@@ -124,10 +233,10 @@ def get_chart(symbol, interval='30', signal=None):
     except Exception as e:
         logger.warning(f'Selenium screenshot failed for {symbol}: {e}')
 
-    # Fallback: matplotlib chart
+    # Fallback: matplotlib chart, rendered in the chart process pool
     try:
-        from chart_generator import generate_alert_chart
-        return generate_alert_chart(symbol, interval=interval, signal=signal)
+        from chart_generator import submit_chart
+        return submit_chart(symbol, interval=interval, signal=signal).result(timeout=60)
     except Exception as e:
         logger.warning(f'Matplotlib chart failed for {symbol}: {e}')
 
@@ -3,11 +3,18 @@ Crypto Scanner Professional - All-in-One
 Flask API + Scanners integrati + Dashboard
 """
 from flask import Flask, jsonify, request, send_file, session, redirect, url_for, Response
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
-from datetime import datetime, timedelta
+from flask_compress import Compress
+import numpy as np
+import orjson
+from datetime import datetime
 from functools import wraps
 import hashlib
+import heapq
+import queue
 import secrets
+import signal
 import os
 import json
 import threading
@@ -16,21 +23,40 @@ import logging
 import uuid
 import sqlite3
 import re
-from scanners.ema_touch import EMAScanner
-from scanners.ath_atl_scanner import ATHATLScanner
-from scanners.ico_levels_scanner import ICOLevelsScanner
-from scanners.double_touch import DoubleTouchScanner
-from scanners.bot_engine import BotEngine
 from ws_manager import BybitWSManager
 from private_ws_manager import BybitPrivateWSPool
+from requests import RequestException
+from http_session import SESSION, get_json
+from tickers_cache import get_linear_tickers, get_usdt_tickers, ticker_columns
 import journal
 
 # Setup logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+
+
+class ORJSONProvider(DefaultJSONProvider):
+    """jsonify()/request.get_json() via orjson (Rust): molto più veloce di json stdlib
+    sui payload grossi (tickers Bybit, klines). Array e scalari NumPy sono
+    serializzati nativamente (niente .tolist() prima di jsonify); i tipi che
+    orjson non conosce (Decimal, date HTTP, ...) ricadono sul default() di Flask."""
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=self.default,
+                            option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+
 app = Flask(__name__)
+app.json = ORJSONProvider(app)
 CORS(app)
+# Compressione br/gzip delle risposte JSON/HTML/JS (tickers, klines: ~8x più piccole)
+app.config['COMPRESS_ALGORITHM'] = ['br', 'gzip']
+app.config['COMPRESS_MIN_SIZE'] = 512
+Compress(app)
 
 # Secret key per sessioni
 _sk_file = '/data/.secret_key'
@@ -68,8 +94,17 @@ def _hash_pw(pw):
 # ── USERS DB ───────────────────────────────────────────────────────────────────
 USERS_DB = '/data/users.db'
 
+def _users_db():
+    """Connessione a USERS_DB. Il DB è in WAL (impostato una volta in _init_users_db,
+    resta nel file): con synchronous=NORMAL un commit accoda al WAL senza fsync e
+    il DB resta integro anche dopo un crash; si perde al più l'ultimo commit."""
+    conn = sqlite3.connect(USERS_DB)
+    conn.execute('PRAGMA synchronous=NORMAL')
+    return conn
+
 def _init_users_db():
-    with sqlite3.connect(USERS_DB) as conn:
+    with _users_db() as conn:
+        conn.execute('PRAGMA journal_mode=WAL')
         conn.execute('''CREATE TABLE IF NOT EXISTS users (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             username TEXT UNIQUE NOT NULL,
@@ -94,7 +129,7 @@ def _init_users_db():
 
 def _db_get_user(username):
     try:
-        with sqlite3.connect(USERS_DB) as conn:
+        with _users_db() as conn:
             conn.row_factory = sqlite3.Row
             row = conn.execute('SELECT * FROM users WHERE lower(username)=lower(?)', (username,)).fetchone()
             return dict(row) if row else None
@@ -103,7 +138,7 @@ def _db_get_user(username):
 
 # ── USER PREFS (impostazioni scanner/indicatori per-account) ───────────────────
 def _init_user_prefs_db():
-    with sqlite3.connect(USERS_DB) as conn:
+    with _users_db() as conn:
         conn.execute('''CREATE TABLE IF NOT EXISTS user_prefs (
             username TEXT NOT NULL,
             pkey TEXT NOT NULL,
@@ -117,7 +152,7 @@ def _db_create_user(username, email, password_hash):
     import secrets
     token = secrets.token_urlsafe(32)
     try:
-        with sqlite3.connect(USERS_DB) as conn:
+        with _users_db() as conn:
             conn.execute(
                 'INSERT INTO users (username, email, password_hash, role, created_at, verified, verify_token) VALUES (?,?,?,?,?,?,?)',
                 (username, email.lower(), password_hash, '', datetime.utcnow().isoformat(), 0, token))
@@ -225,6 +260,8 @@ DEFAULT_CONFIG = {
         'ema_touch_threshold': 2.0,
         'touch_tolerance': 0.05,
         'scan_tfs': ['240', '60', '30', '5', '1'],
+        # Scan via REST quando il feed WS non è pronto (top 25 coin per volume)
+        'rest_fallback': False,
     },
     'bot': {
         'symbol': '',
@@ -251,6 +288,16 @@ DEFAULT_CONFIG = {
 config = DEFAULT_CONFIG.copy()
 scanners = {}
 scanner_threads = {}
+# Lock dei soli scrittori: update_config e init_scanners girano tutto sotto lock.
+# `scanners` non viene mai modificato sul posto ma sostituito con un dict nuovo,
+# quindi i lettori (thread scanner, endpoint) prendono un riferimento senza lock
+# e vedono o il vecchio o il nuovo insieme, mai uno a metà.
+_scanners_lock = threading.RLock()
+# Settato allo shutdown (SIGTERM / uscita worker gunicorn): i loop di background
+# attendono su questo Event invece di time.sleep() e si svegliano subito.
+_STOP = threading.Event()
+# Sveglia lo scheduler degli scanner: a fine scan (rischedulazione) e allo shutdown
+_SCHED_WAKE = threading.Event()
 ws_manager = BybitWSManager()
 private_ws_pool = BybitPrivateWSPool()
 
@@ -260,38 +307,69 @@ _recently_triggered = []
 _hv_klines_subscribed = set()
 _mtf_klines_subscribed = set()  # (symbol, interval) tuples for MTF live polling
 
-def _compute_ema(prices, period):
-    if len(prices) < period:
-        return None
+# numba (opzionale, come in chart_generator: wheel solo per l'immagine standalone
+# Debian, non per la base Alpine dell'add-on) compila la ricorrenza EMA così com'è;
+# senza numba resta la forma chiusa NumPy di _compute_ema_series.
+try:
+    from numba import njit as _njit
+except ImportError:
+    _njit = None
+
+def _ema_series_loop(prices, period, out):
+    """out[period-1:] = EMA seeded con la SMA dei primi `period` prezzi (ricorrenza stretta)."""
     k = 2 / (period + 1)
-    ema = sum(prices[:period]) / period
-    for p in prices[period:]:
-        ema = p * k + ema * (1 - k)
-    return round(ema, 8)
+    ema = 0.0
+    for i in range(period):
+        ema += prices[i]
+    ema /= period
+    out[period - 1] = ema
+    for i in range(period, prices.shape[0]):
+        ema = prices[i] * k + ema * (1 - k)
+        out[i] = ema
+    return out
+
+if _njit is not None:
+    # Niente fastmath: stessi risultati, bit per bit, del vecchio loop Python
+    _ema_series_loop = _njit(cache=True)(_ema_series_loop)
 
 def _compute_ema_series(prices, period):
-    if len(prices) < period:
-        return [None] * len(prices)
-    k = 2 / (period + 1)
-    series = [None] * (period - 1)
-    ema = sum(prices[:period]) / period
-    series.append(ema)
-    for p in prices[period:]:
-        ema = p * k + ema * (1 - k)
-        series.append(ema)
-    return series
-
-def _count_ema_touches_daily(klines_30m, period=60, threshold=2.0):
+    """EMA seeded con la SMA dei primi `period` prezzi: kernel numba se disponibile,
+    altrimenti NumPy invece del loop Python. La ricorrenza ema_t = ema_{t-1}*d + p_t*k (d = 1-k) in forma chiusa è
+    ema_t = d^t * (seed + k * Σ p_i / d^i): un cumsum per blocco. I blocchi ripartono
+    dall'ultimo valore ogni `step` barre, così d^-i non esce mai dal range float64."""
+    n = len(prices)
+    if n < period:
+        return [None] * n
+    prices = np.asarray(prices, dtype=np.float64)
+    if _njit is not None:
+        out = _ema_series_loop(prices, period, np.empty(n))
+        return [None] * (period - 1) + out[period - 1:].tolist()
+    k    = 2 / (period + 1)
+    d    = 1 - k
+    tail = prices[period:]
+    seed = float(prices[:period].sum() / period)
+    out  = np.empty(len(tail))
+    step = max(1, int(200 / -np.log(d)))
+    ema  = seed
+    for a in range(0, len(tail), step):
+        chunk = tail[a:a + step]
+        pw    = d ** np.arange(1, len(chunk) + 1)
+        out[a:a + len(chunk)] = pw * (ema + k * np.cumsum(chunk / pw))
+        ema = out[a + len(chunk) - 1]
+    return [None] * (period - 1) + [seed] + out.tolist()
+
+def _count_ema_touches_daily(klines_30m, period=60, threshold=2.0, ema_series=None):
     """Count 30m candles since midnight UTC where wick crosses EMA (low<=EMA<=high).
-    Each candle counts as 1 touch. Resets at midnight UTC."""
+    Each candle counts as 1 touch. Resets at midnight UTC.
+    `ema_series` (already computed on the same klines) avoids a second EMA pass."""
     import calendar, datetime
     past = klines_30m
     if len(past) < period:
         return None
     now = datetime.datetime.utcnow()
     midnight_ts = calendar.timegm((now.year, now.month, now.day, 0, 0, 0, 0, 0, 0))
-    closes = [k['close'] for k in past]
-    ema_series = _compute_ema_series(closes, period)
+    if ema_series is None:
+        ema_series = _compute_ema_series([k['close'] for k in past], period)
     count = 0
     for i, k in enumerate(past):
         if k['time'] < midnight_ts:
@@ -309,8 +387,8 @@ def load_config():
     try:
         # Load saved config
         if os.path.exists(CONFIG_FILE):
-            with open(CONFIG_FILE, 'r') as f:
-                saved = json.load(f)
+            with open(CONFIG_FILE, 'rb') as f:
+                saved = orjson.loads(f.read())
                 config.update(saved)
                 # config.update() è shallow: una config salvata PRIMA dell'introduzione di
                 # min_var_pct_24h manca la chiave dentro 'general' e la sovrascrive col vecchio
@@ -334,27 +412,63 @@ def load_config():
 
     except Exception as e:
         logger.error(f"❌ Error loading config: {e}")
+    finally:
+        _invalidate_config_cache()
+
+# Body JSON di GET /scanner-api/config: serializzato una volta e riusato finché la
+# config non cambia (save_config/load_config lo invalidano), servito con ETag.
+_config_cache = {'body': None, 'etag': None}
+_config_cache_lock = threading.Lock()
+
+
+def _invalidate_config_cache():
+    with _config_cache_lock:
+        _config_cache['body'] = None
+        _config_cache['etag'] = None
+
+
+def _json_etag_response(body, etag):
+    """Risposta JSON con ETag; 304 senza body se il client ha già questa versione."""
+    # flask-compress suffissa l'ETag delle risposte compresse (":gzip"/":br")
+    if etag in {t.split(':', 1)[0] for t in request.if_none_match.as_set()}:
+        resp = Response(status=304)
+    else:
+        resp = Response(body, mimetype='application/json')
+    resp.set_etag(etag)
+    return resp
+
 
 def save_config():
     """Save config to file"""
+    _invalidate_config_cache()
     try:
         os.makedirs(os.path.dirname(CONFIG_FILE), exist_ok=True)
-        with open(CONFIG_FILE, 'w') as f:
-            json.dump(config, f, indent=2)
+        with open(CONFIG_FILE, 'wb') as f:
+            f.write(orjson.dumps(config, option=orjson.OPT_INDENT_2))
         logger.info(f"✅ Config saved to {CONFIG_FILE}")
         return True
     except Exception as e:
         logger.error(f"❌ Error saving config: {e}")
         return False
 
+# Firma (telegram + kwargs) con cui è stato costruito ogni scanner: un salvataggio
+# config ricostruisce solo gli scanner la cui sezione è cambiata, gli altri
+# mantengono cache calde, cooldown in memoria e thread di precompute.
+_scanner_sigs = {}
+
+
 def init_scanners():
-    """Initialize all scanners"""
+    """Initialize scanners — rebuilds only those whose config changed"""
     global scanners
-
-    # Remove all old WS callbacks before registering new ones.
-    # Without this, every config save accumulates additional callbacks and
-    # causes duplicate alerts even when a scanner is toggled off.
-    ws_manager.clear_callbacks()
+    # Import dei moduli scanner qui e non in testa al file: i loro thread/pool a
+    # livello di modulo nascono solo nel worker (post_worker_init → init_scanners),
+    # non nel master gunicorn né a ogni semplice import di app; dalla seconda
+    # chiamata sono già in sys.modules
+    from scanners.ema_touch import EMAScanner
+    from scanners.ath_atl_scanner import ATHATLScanner
+    from scanners.ico_levels_scanner import ICOLevelsScanner
+    from scanners.double_touch import DoubleTouchScanner
+    from scanners.bot_engine import BotEngine
 
     telegram_config = {
         'token': config['telegram']['token'],
@@ -368,111 +482,131 @@ def init_scanners():
         logger.warning("Configure via: Dashboard → Telegram tab → Save, or env vars TELEGRAM_TOKEN / TELEGRAM_CHAT_ID")
     else:
         logger.info(f"✅ Telegram configured: {telegram_config['chat_id'][:8]}...")
-    
-    try:
-        scanners['ath_atl'] = ATHATLScanner(
-            telegram_config=telegram_config,
-            ws_manager=ws_manager,
-            live_config=config,
-            **config['ath_atl'],
-            **config['general']
-        )
-
-        scanners['ico_levels'] = ICOLevelsScanner(
-            telegram_config=telegram_config,
-            ws_manager=ws_manager,
-            live_config=config,
-            **config['ico_levels'],
-            **config['general']
-        )
-
-        scanners['double_touch'] = DoubleTouchScanner(
-            telegram_config=telegram_config,
-            ws_manager=ws_manager,
-            live_config=config,
-            **config['double_touch'],
-            **{k: v for k, v in config['general'].items() if k in ('min_volume_24h', 'max_coins_per_alert', 'min_var_pct_24h')}
-        )
-
-        scanners['ema_touch'] = EMAScanner(
-            telegram_config=telegram_config,
-            ws_manager=ws_manager,
-            live_config=config,
-            **config['ema_touch'],
-            **{k: v for k, v in config['general'].items()
-               if k in ('min_volume_24h', 'max_coins_per_alert', 'min_var_pct_24h') and k not in config['ema_touch']}
-        )
 
-        scanners['bot'] = BotEngine(
-            telegram_config=telegram_config,
-            ws_manager=ws_manager,
-            live_config=config,
-            trade_client=_bot_trade_client,
-            **config['bot']
-        )
+    general_subset = {k: v for k, v in config['general'].items()
+                      if k in ('min_volume_24h', 'max_coins_per_alert', 'min_var_pct_24h')}
+    specs = {
+        'ath_atl':      (ATHATLScanner,      {**config['ath_atl'], **config['general']}),
+        'ico_levels':   (ICOLevelsScanner,   {**config['ico_levels'], **config['general']}),
+        'double_touch': (DoubleTouchScanner, {**config['double_touch'], **general_subset}),
+        'ema_touch':    (EMAScanner,         {**config['ema_touch'],
+                                              **{k: v for k, v in general_subset.items()
+                                                 if k not in config['ema_touch']}}),
+        'bot':          (BotEngine,          dict(config['bot'])),
+    }
 
-        logger.info("✅ Scanners initialized")
+    try:
+        rebuilt = []
+        with _scanners_lock:
+            new_scanners = dict(scanners)
+            for key, (cls, kwargs) in specs.items():
+                sig = orjson.dumps([telegram_config, kwargs], option=orjson.OPT_SORT_KEYS)
+                if key in new_scanners and _scanner_sigs.get(key) == sig:
+                    continue
+                # Remove the old instance's WS callbacks before registering the new ones.
+                # Without this, every config save accumulates additional callbacks and
+                # causes duplicate alerts even when a scanner is toggled off.
+                old = new_scanners.get(key)
+                if old is not None:
+                    ws_manager.remove_callbacks(old)
+                    # Scanners with their own worker threads expose close() to end them
+                    close = getattr(old, 'close', None)
+                    if close is not None:
+                        close()
+                extra = {'trade_client': _bot_trade_client} if key == 'bot' else {}
+                new_scanners[key] = cls(
+                    telegram_config=telegram_config,
+                    ws_manager=ws_manager,
+                    live_config=config,
+                    **kwargs,
+                    **extra
+                )
+                _scanner_sigs[key] = sig
+                rebuilt.append(key)
+            scanners = new_scanners
+
+        logger.info(f"✅ Scanners initialized ({', '.join(rebuilt) or 'no changes'})")
     except Exception as e:
         logger.error(f"❌ Error initializing scanners: {e}")
 
 def _is_in_schedule():
     """Return True if current local time (UTC+offset) is within the configured window."""
+    # Stessa finestra (con overnight 22:00 → 06:00) degli scanner: calcolo su float epoch
+    from alert_utils import is_in_schedule
     start_str = config['general'].get('schedule_start', '')
     end_str   = config['general'].get('schedule_end', '')
     if not start_str or not end_str:
         return True
     try:
         utc_offset = float(config['general'].get('utc_offset') or 2)
-        now = datetime.utcnow() + timedelta(hours=utc_offset)
-        sh, sm = map(int, start_str.split(':'))
-        eh, em = map(int, end_str.split(':'))
-        now_m   = now.hour * 60 + now.minute
-        start_m = sh * 60 + sm
-        end_m   = eh * 60 + em
-        if start_m <= end_m:
-            return start_m <= now_m <= end_m
-        # overnight window e.g. 22:00 → 06:00
-        return now_m >= start_m or now_m <= end_m
     except Exception:
         return True
+    return is_in_schedule(start_str, end_str, utc_offset)
 
 
-def run_scanner(config_name, scanner_key, interval_minutes):
-    """Run scanner in loop — looks up scanner dynamically so reinit is picked up."""
-    while True:
-        try:
-            scanner = scanners.get(scanner_key)
-            if scanner and config.get(config_name, {}).get('enabled', True):
-                if _is_in_schedule():
-                    logger.info(f"🔄 Running {config_name} scanner...")
-                    scanner.scan()
-                else:
-                    logger.info(f"⏸ {config_name} fuori orario, skip")
-        except Exception as e:
-            logger.error(f"❌ Error in {config_name} scanner: {e}")
+def _run_scan(config_name, scanner_key):
+    """Una scan di `scanner_key`, cercato ad ogni giro così un reinit viene visto."""
+    try:
+        scanner = scanners.get(scanner_key)
+        if scanner and config.get(config_name, {}).get('enabled', True):
+            if _is_in_schedule():
+                logger.info(f"🔄 Running {config_name} scanner...")
+                scanner.scan()
+            else:
+                logger.info(f"⏸ {config_name} fuori orario, skip")
+    except Exception as e:
+        logger.error(f"❌ Error in {config_name} scanner: {e}")
+
 
-        time.sleep(interval_minutes * 60)
+def run_scanners(jobs):
+    """Un solo thread di scheduling per tutti gli scanner in polling: heap di
+    scadenze monotone (config_name, scanner_key, interval_minutes) dei job fermi.
+    Ogni scan scaduta va al pool e il thread torna subito allo heap: una scan
+    ATH/ATL lunga (backfill storico) non ritarda ICO e Terzo Tocco. Un job rientra
+    nello heap dal proprio add_done_callback appena la sua scan finisce, senza
+    aspettare le altre partite insieme, quindi non si sovrappone mai a se stesso.
+    _STOP (via _SCHED_WAKE) interrompe subito l'attesa."""
+    from concurrent.futures import ThreadPoolExecutor
+    heap = [(time.monotonic(), i, name, key, minutes * 60)
+            for i, (name, key, minutes) in enumerate(jobs)]
+    heapq.heapify(heap)
+    finished = queue.SimpleQueue()
+
+    def _on_done(job):
+        def cb(_fut):
+            finished.put(job)
+            _SCHED_WAKE.set()
+        return cb
+
+    with ThreadPoolExecutor(max_workers=len(jobs) or 1, thread_name_prefix='scan') as pool:
+        while not _STOP.is_set():
+            _SCHED_WAKE.wait(heap[0][0] - time.monotonic() if heap else None)
+            _SCHED_WAKE.clear()
+            now = time.monotonic()
+            # Job appena finiti: deadline monotona dal loro ultimo avvio (niente drift),
+            # o subito se la scan è durata più dell'intervallo
+            while not finished.empty():
+                t, i, name, key, interval_s = finished.get()
+                heapq.heappush(heap, (max(t + interval_s, now), i, name, key, interval_s))
+            while heap and heap[0][0] <= now and not _STOP.is_set():
+                job = heapq.heappop(heap)
+                pool.submit(_run_scan, job[2], job[3]).add_done_callback(_on_done(job))
 
 def start_scanners():
-    """Start all scanner threads"""
+    """Start the polling scheduler thread and the price alert checker"""
     global scanner_threads
 
     # (config_name, scanner_key, interval)
-    threads_config = [
+    jobs = [
         ('ath_atl',        'ath_atl',    config['ath_atl']['scan_interval_minutes']),
         ('ico_levels',     'ico_levels',    config['ico_levels']['scan_interval_minutes']),
         ('double_touch',   'double_touch',  config['double_touch']['scan_interval_minutes']),
     ]
 
-    for config_name, scanner_key, interval in threads_config:
-        thread = threading.Thread(
-            target=run_scanner,
-            args=(config_name, scanner_key, interval),
-            daemon=True
-        )
-        thread.start()
-        scanner_threads[config_name] = thread
-        logger.info(f"✅ {config_name} thread started")
+    thread = threading.Thread(target=run_scanners, args=(jobs,), daemon=True)
+    thread.start()
+    scanner_threads['polling'] = thread
+    logger.info(f"✅ polling scheduler started ({', '.join(name for name, _, _ in jobs)})")
 
     alert_thread = threading.Thread(target=check_price_alerts, daemon=True)
     alert_thread.start()
@@ -484,8 +618,8 @@ def start_scanners():
 def health():
     """Health check"""
     telegram_configured = bool(config['telegram']['token'] and config['telegram']['chat_id'])
-    
-    return jsonify({
+
+    body = orjson.dumps({
         'status': 'ok',
         'version': '4.6.91',
         'telegram_configured': telegram_configured,
@@ -500,12 +634,19 @@ def health():
             'ema_touch': config['ema_touch']['enabled'],
         }
     })
+    return _json_etag_response(body, hashlib.blake2b(body, digest_size=8).hexdigest())
 
 @app.route('/scanner-api/config', methods=['GET'])
 def get_config():
     """Get current config"""
     logger.info("📥 GET /scanner-api/config")
-    return jsonify(config)
+    with _config_cache_lock:
+        if _config_cache['body'] is None:
+            body = orjson.dumps(config, option=orjson.OPT_NON_STR_KEYS)
+            _config_cache['body'] = body
+            _config_cache['etag'] = hashlib.blake2b(body, digest_size=8).hexdigest()
+        body, etag = _config_cache['body'], _config_cache['etag']
+    return _json_etag_response(body, etag)
 
 @app.route('/scanner-api/config', methods=['POST'])
 def update_config():
@@ -518,11 +659,16 @@ def update_config():
         if not new_config:
             return jsonify({'success': False, 'error': 'No JSON data'}), 400
         
-        config.update(new_config)
-        
-        if save_config():
-            # Reinitialize scanners with new config
-            init_scanners()
+        # `config` resta lo stesso oggetto (gli scanner lo tengono come live_config):
+        # ogni sezione viene sostituita intera, mai modificata sul posto, così un
+        # lettore vede la sezione vecchia o la nuova. Due POST non si intrecciano.
+        with _scanners_lock:
+            config.update(new_config)
+            saved = save_config()
+            if saved:
+                # Reinitialize scanners with new config
+                init_scanners()
+        if saved:
             return jsonify({'success': True, 'message': 'Config updated'})
         else:
             return jsonify({'success': False, 'error': 'Failed to save'}), 500
@@ -535,8 +681,9 @@ def manual_scan(scanner_name):
     """Trigger manual scan"""
     try:
         logger.info(f"🔄 Manual scan: {scanner_name}")
-        if scanner_name in scanners:
-            result = scanners[scanner_name].scan()
+        scanner = scanners.get(scanner_name)
+        if scanner:
+            result = scanner.scan()
             return jsonify({'success': True, 'result': result})
         else:
             return jsonify({'success': False, 'error': 'Scanner not found'}), 404
@@ -544,50 +691,60 @@ def manual_scan(scanner_name):
         logger.error(f"❌ Error in manual scan: {e}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
+# Gainers/losers della dashboard: il polling del browser (ogni pochi secondi) non
+# deve riscaricare e ri-filtrare l'intera lista tickers Bybit a ogni richiesta.
+_ath_status_cache = {'data': None, 'ts': 0}
+_ath_status_lock = threading.Lock()
+_ATH_STATUS_TTL = 5
+
 @app.route('/scanner-api/ath-atl/status', methods=['GET'])
 def get_ath_atl_status():
     """Get ATH/ATL scanner status and top monitored coins"""
     try:
-        import requests
-
-        # Get top 20 gainers + top 20 losers from Bybit
-        url = "https://api.bybit.com/v5/market/tickers?category=linear"
-        response = requests.get(url, timeout=10)
-        data = response.json()
-
-        if data['retCode'] != 0:
-            return jsonify({'success': False, 'error': 'Bybit API error'}), 500
-
-        # Filter and sort pairs (no volume filter — show all coins)
-        all_pairs = []
-
-        for item in data['result']['list']:
-            if not item['symbol'].endswith('USDT'):
-                continue
-
-            last_price = float(item['lastPrice'])
-            change_pct = float(item.get('price24hPcnt', 0)) * 100
-            volume_24h_usd = float(item.get('volume24h', 0)) * last_price
-
-            all_pairs.append({
-                'symbol': item['symbol'],
-                'price': last_price,
-                'change_24h': change_pct,
-                'volume_24h': volume_24h_usd
-            })
-
-        # Split into gainers (positive) and losers (negative)
-        top_gainers = [c for c in all_pairs if c['change_24h'] > 0]
-        top_gainers.sort(key=lambda x: x['change_24h'], reverse=True)
-        top_losers  = [c for c in all_pairs if c['change_24h'] < 0]
-        top_losers.sort(key=lambda x: x['change_24h'])  # most negative first
+        # Lock tenuto durante il fetch: richieste concorrenti a cache scaduta
+        # aspettano il primo fetch invece di colpire Bybit in parallelo.
+        with _ath_status_lock:
+            if _ath_status_cache['data'] is None or time.monotonic() - _ath_status_cache['ts'] >= _ATH_STATUS_TTL:
+                # Get top 20 gainers + top 20 losers from Bybit (lista tickers condivisa)
+                try:
+                    items = get_usdt_tickers()
+                except RuntimeError:
+                    return jsonify({'success': False, 'error': 'Bybit API error'}), 500
+
+                # Filter and sort pairs (no volume filter — show all coins).
+                # Parse/filtro/ordinamento in NumPy; i dict si costruiscono solo alla fine.
+                symbols = [i['symbol'] for i in items]
+                prices, changes, volumes = ticker_columns(items, 'lastPrice', 'price24hPcnt', 'volume24h')
+                changes *= 100
+                volumes *= prices
+
+                # Split into gainers (positive) and losers (negative)
+                gi = np.flatnonzero(changes > 0)
+                gi = gi[np.argsort(-changes[gi], kind='stable')]
+                li = np.flatnonzero(changes < 0)
+                li = li[np.argsort(changes[li], kind='stable')]  # most negative first
+
+                sym_l, px_l, ch_l, vol_l = symbols, prices.tolist(), changes.tolist(), volumes.tolist()
+
+                def _rows(idx):
+                    return [{'symbol': sym_l[i], 'price': px_l[i],
+                             'change_24h': ch_l[i], 'volume_24h': vol_l[i]} for i in idx.tolist()]
+
+                top_gainers = _rows(gi)
+                top_losers  = _rows(li)
+
+                _ath_status_cache['data'] = {
+                    'top_gainers': top_gainers,
+                    'top_losers': top_losers,
+                    'total_pairs': len(sym_l)
+                }
+                _ath_status_cache['ts'] = time.monotonic()
+            cached = _ath_status_cache['data']
 
         return jsonify({
             'success': True,
             'config': config.get('ath_atl', {}),
-            'top_gainers': top_gainers,
-            'top_losers': top_losers,
-            'total_pairs': len(all_pairs)
+            **cached
         })
 
     except Exception as e:
@@ -659,16 +816,16 @@ def get_screenshot_file(filename):
     path = f'/data/screenshots/{filename}'
     if not os.path.exists(path):
         return '', 404
-    with open(path, 'rb') as f:
-        return Response(f.read(), mimetype='image/png',
-                        headers={'Cache-Control': 'public, max-age=86400'})
+    # send_file: stream dal disco + ETag/Last-Modified → 304 sulle richieste ripetute
+    resp = send_file(path, mimetype='image/png', conditional=True, etag=True, max_age=86400)
+    resp.cache_control.public = True
+    return resp
 
 _news_cache = {'data': None, 'ts': 0}
 _news_lock = threading.Lock()
 
 @app.route('/api/news', methods=['GET'])
 def get_bybit_news():
-    import requests as req
     CATEGORIES = [
         ('new_crypto',          'Listing'),
         ('delistings',          'Delisting'),
@@ -681,12 +838,12 @@ def get_bybit_news():
     try:
         result = {}
         for key, label in CATEGORIES:
-            resp = req.get(
+            resp = SESSION.get(
                 'https://api.bybit.com/v5/announcements/index',
                 params={'locale': 'en-US', 'type': key, 'limit': 50},
                 timeout=8
             )
-            data = resp.json()
+            data = orjson.loads(resp.content)
             items = []
             if data.get('retCode') == 0:
                 for item in data['result']['list']:
@@ -725,13 +882,12 @@ def _google_translate_unofficial(text, target, source='en'):
     if not text:
         return ''
     try:
-        import requests as req
-        resp = req.get(
+        resp = SESSION.get(
             'https://translate.googleapis.com/translate_a/single',
             params={'client': 'gtx', 'sl': source, 'tl': target, 'dt': 't', 'q': text},
             timeout=8,
         )
-        data = resp.json()
+        data = orjson.loads(resp.content)
         return ''.join(seg[0] for seg in data[0] if seg and seg[0])
     except Exception as e:
         logger.warning(f"Google Translate fallback fallito: {e}")
@@ -742,7 +898,6 @@ def get_coin_info():
     """Descrizione + dati coin da CoinGecko: /search per trovare l'id (disambigua ticker
     duplicati per market_cap_rank), poi /coins/{id} per i dettagli. Cache 6h per simbolo+lingua
     (la descrizione cambia in base a `lang`, quindi entra nella chiave di cache)."""
-    import requests as req
     symbol = request.args.get('symbol', '').strip().upper()
     lang = request.args.get('lang', 'it').strip().lower()
     if lang not in ('it', 'en'):
@@ -758,8 +913,8 @@ def get_coin_info():
             return jsonify(cached['data'])
 
     try:
-        sresp = req.get('https://api.coingecko.com/api/v3/search', params={'query': base}, timeout=8)
-        sdata = sresp.json()
+        sresp = SESSION.get('https://api.coingecko.com/api/v3/search', params={'query': base}, timeout=8)
+        sdata = orjson.loads(sresp.content)
         candidates = [c for c in sdata.get('coins', []) if c.get('symbol', '').upper() == base]
         if not candidates:
             payload = {'success': False, 'error': 'not_found'}
@@ -767,13 +922,13 @@ def get_coin_info():
         candidates.sort(key=lambda c: (c.get('market_cap_rank') is None, c.get('market_cap_rank') or 0))
         coin_id = candidates[0]['id']
 
-        dresp = req.get(
+        dresp = SESSION.get(
             f'https://api.coingecko.com/api/v3/coins/{coin_id}',
             params={'localization': 'true', 'tickers': 'false', 'market_data': 'true',
                     'community_data': 'false', 'developer_data': 'false', 'sparkline': 'false'},
             timeout=10,
         )
-        d = dresp.json()
+        d = orjson.loads(dresp.content)
         descs = d.get('description', {}) or {}
         native_desc = (descs.get(lang) or '').strip()
         en_desc = (descs.get('en') or '').strip().split('\r\n\r\n')[0].split('\n\n')[0].strip()
@@ -814,41 +969,31 @@ def get_coin_info():
 @app.route('/api/top-coins', methods=['GET'])
 def get_top_coins():
     """Return top N coins sorted by 24h change % (gainers or losers), filtered by min volume"""
-    import requests as req
     try:
         limit = min(int(request.args.get('limit', 500)), 500)
         min_vol = float(request.args.get('min_volume', 10_000_000))
         sort = request.args.get('sort', 'gainers')  # 'gainers' | 'losers'
 
-        url = 'https://api.bybit.com/v5/market/tickers'
-        response = req.get(url, params={'category': 'linear'}, timeout=10)
-        data = response.json()
-
-        if data.get('retCode') != 0:
+        try:
+            items = get_usdt_tickers()
+        except RuntimeError:
             return jsonify({'error': 'Bybit API error'}), 502
 
-        coins = []
-        for item in data['result']['list']:
-            if not item['symbol'].endswith('USDT'):
-                continue
-            last_price = float(item['lastPrice'])
-            vol_24h = float(item.get('volume24h', 0)) * last_price
-            if vol_24h < min_vol:
-                continue
-            coins.append({
-                'symbol': item['symbol'],
-                'price': last_price,
-                'change_24h': round(float(item.get('price24hPcnt', 0)) * 100, 2),
-                'volume_24h': vol_24h,
-            })
-
-        if sort == 'gainers':
-            coins = [c for c in coins if c['change_24h'] > 0]
-            coins.sort(key=lambda x: x['change_24h'], reverse=True)
-        else:
-            coins = [c for c in coins if c['change_24h'] < 0]
-            coins.sort(key=lambda x: x['change_24h'], reverse=False)
-        return jsonify({'success': True, 'data': coins[:limit]})
+        # Parse, filtro e ordinamento in NumPy come per /api/ath-status: i dict si
+        # costruiscono solo per le righe che finiscono nella risposta
+        price, chg, vol = ticker_columns(items, 'lastPrice', 'price24hPcnt', 'volume24h')
+        change  = np.round(chg * 100, 2)
+        vol_usd = vol * price
+        gainers = sort == 'gainers'
+        idx = np.flatnonzero(((change > 0) if gainers else (change < 0)) & (vol_usd >= min_vol))
+        # stable: a parità di variazione resta l'ordine di Bybit, come con list.sort
+        idx = idx[np.argsort(-change[idx] if gainers else change[idx], kind='stable')][:limit]
+
+        coins = [{'symbol': items[i]['symbol'], 'price': px,
+                  'change_24h': ch, 'volume_24h': v}
+                 for i, px, ch, v in zip(idx.tolist(), price[idx].tolist(),
+                                         change[idx].tolist(), vol_usd[idx].tolist())]
+        return jsonify({'success': True, 'data': coins})
     except Exception as e:
         logger.error(f"Error fetching top coins: {e}")
         return jsonify({'error': str(e)}), 500
@@ -858,7 +1003,6 @@ def get_top_coins():
 def get_high_volume():
     """Return all USDT perpetuals with 24h volume >= min_volume, sorted by volume desc.
     Uses ws_manager in-memory cache when ready; falls back to Bybit REST otherwise."""
-    import requests as req
     try:
         min_vol = float(request.args.get('min_volume', config['general'].get('min_volume_24h', 10_000_000)))
         extra_symbols = set(s.strip() for s in request.args.get('extra_symbols', '').split(',') if s.strip())
@@ -882,14 +1026,11 @@ def get_high_volume():
                 })
                 seen.add(symbol)
         else:
-            response = req.get('https://api.bybit.com/v5/market/tickers',
-                               params={'category': 'linear'}, timeout=10)
-            data = response.json()
-            if data.get('retCode') != 0:
+            try:
+                items = get_usdt_tickers()
+            except RuntimeError:
                 return jsonify({'error': 'Bybit API error'}), 502
-            for item in data['result']['list']:
-                if not item['symbol'].endswith('USDT'):
-                    continue
+            for item in items:
                 last_price = float(item['lastPrice'])
                 vol_24h    = float(item.get('volume24h', 0)) * last_price
                 if vol_24h < min_vol and item['symbol'] not in extra_symbols:
@@ -906,20 +1047,16 @@ def get_high_volume():
         missing = extra_symbols - seen
         if missing:
             try:
-                r = req.get('https://api.bybit.com/v5/market/tickers',
-                            params={'category': 'linear'}, timeout=8)
-                d = r.json()
-                if d.get('retCode') == 0:
-                    for item in d['result']['list']:
-                        if item['symbol'] not in missing:
-                            continue
-                        lp = float(item['lastPrice'])
-                        coins.append({
-                            'symbol':     item['symbol'],
-                            'price':      lp,
-                            'change_24h': round(float(item.get('price24hPcnt', 0)) * 100, 2),
-                            'volume_24h': float(item.get('volume24h', 0)) * lp,
-                        })
+                for item in get_linear_tickers():
+                    if item['symbol'] not in missing:
+                        continue
+                    lp = float(item['lastPrice'])
+                    coins.append({
+                        'symbol':     item['symbol'],
+                        'price':      lp,
+                        'change_24h': round(float(item.get('price24hPcnt', 0)) * 100, 2),
+                        'volume_24h': float(item.get('volume24h', 0)) * lp,
+                    })
             except Exception:
                 pass
 
@@ -931,30 +1068,40 @@ def get_high_volume():
             ws_manager.subscribe_klines(new_syms, intervals=['30'])
             _hv_klines_subscribed.update(new_syms)
 
-        # Attach EMA60(30m), daily touch count, ATH/ATL distances
-        ath_scanner = scanners.get('ath_atl')
-        for coin in coins:
-            klines_30m = ws_manager.get_klines(coin['symbol'], '30')
+        def _klines_30m(symbol):
+            klines_30m = ws_manager.get_klines(symbol, '30')
             if len(klines_30m) < 60:
                 try:
-                    import requests as _req
-                    r = _req.get('https://api.bybit.com/v5/market/kline',
-                        params={'category':'linear','symbol':coin['symbol'],'interval':'30','limit':200},
+                    d = get_json('https://api.bybit.com/v5/market/kline',
+                        params={'category':'linear','symbol':symbol,'interval':'30','limit':200},
                         timeout=5)
-                    d = r.json()
                     if d.get('retCode') == 0:
                         klines_30m = [{'time':int(k[0])//1000,'open':float(k[1]),'high':float(k[2]),
                             'low':float(k[3]),'close':float(k[4]),'volume':float(k[5])}
                             for k in reversed(d['result']['list'])]
                         with ws_manager._lock:
-                            ws_manager._klines[(coin['symbol'],'30')] = klines_30m
+                            ws_manager._klines[(symbol,'30')] = klines_30m
                 except Exception as _fe:
-                    logger.error(f'kline fallback {coin["symbol"]}: {_fe}')
-            closes = [k['close'] for k in klines_30m]
-            ema = _compute_ema(closes, 60)
+                    logger.error(f'kline fallback {symbol}: {_fe}')
+            return klines_30m
+
+        # Fallback REST in parallelo: le coin appena sottoscritte (cache WS ancora vuota)
+        # sovrappongono i round trip invece di attenderli uno dopo l'altro
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers=10) as pool:
+            all_klines = list(pool.map(_klines_30m, [c['symbol'] for c in coins]))
+
+        # Attach EMA60(30m), daily touch count, ATH/ATL distances
+        ath_scanner = scanners.get('ath_atl')
+        for coin, klines_30m in zip(coins, all_klines):
+            # Una sola passata: l'ultimo valore della serie EMA60 è l'EMA corrente,
+            # e la stessa serie serve al conteggio dei tocchi giornalieri
+            ema_series = _compute_ema_series([k['close'] for k in klines_30m], 60)
+            ema = round(ema_series[-1], 8) if ema_series and ema_series[-1] is not None else None
             coin['ema60_30m'] = ema
             coin['ema60_dist'] = round((coin['price'] - ema) / ema * 100, 2) if ema else None
-            coin['ema_touch_count'] = _count_ema_touches_daily(klines_30m, period=60, threshold=2.0)
+            coin['ema_touch_count'] = _count_ema_touches_daily(klines_30m, period=60, threshold=2.0,
+                                                               ema_series=ema_series)
             aa = ath_scanner.get_ath_atl(coin['symbol']) if ath_scanner else None
             if aa:
                 p = coin['price']
@@ -991,23 +1138,25 @@ def get_ath_atl_symbol():
 @app.route('/api/new-listings', methods=['GET'])
 def get_new_listings():
     """Return recently listed USDT perpetuals on Bybit, sorted by listing date desc"""
-    import requests as req
     try:
         days  = int(request.args.get('days', 90))
         limit = min(int(request.args.get('limit', 500)), 500)
         cutoff_ms = (time.time() - days * 86400) * 1000
 
-        resp_i = req.get('https://api.bybit.com/v5/market/instruments-info',
-                         params={'category': 'linear', 'limit': 1000}, timeout=15)
-        instr_data = resp_i.json()
+        resp_i = SESSION.get('https://api.bybit.com/v5/market/instruments-info',
+                             params={'category': 'linear', 'limit': 1000}, timeout=15)
+        instr_data = orjson.loads(resp_i.content)
         if instr_data.get('retCode') != 0:
             return jsonify({'error': 'Bybit instruments API error'}), 502
 
         new_symbols = {}
         for item in instr_data['result']['list']:
-            sym = item.get('symbol', '')
-            if not sym.endswith('USDT') or item.get('status') != 'Trading':
+            # Perpetual USDT dai metadati dello strumento (quoteCoin/contractType),
+            # non dal suffisso del simbolo
+            if (item.get('quoteCoin') != 'USDT' or item.get('contractType') != 'LinearPerpetual'
+                    or item.get('status') != 'Trading'):
                 continue
+            sym = item.get('symbol', '')
             if item.get('symbolType') in ('stock', 'commodity'):
                 continue
             launch = int(item.get('launchTime', 0))
@@ -1017,14 +1166,13 @@ def get_new_listings():
         if not new_symbols:
             return jsonify({'success': True, 'data': []})
 
-        resp_t = req.get('https://api.bybit.com/v5/market/tickers',
-                         params={'category': 'linear'}, timeout=10)
-        ticker_data = resp_t.json()
-        if ticker_data.get('retCode') != 0:
+        try:
+            tickers = get_linear_tickers()
+        except RuntimeError:
             return jsonify({'error': 'Bybit tickers API error'}), 502
 
         result = []
-        for item in ticker_data['result']['list']:
+        for item in tickers:
             sym = item['symbol']
             if sym not in new_symbols:
                 continue
@@ -1050,8 +1198,8 @@ FAVORITES_FILE = '/data/favorites.json'
 def _load_favorites():
     try:
         if os.path.exists(FAVORITES_FILE):
-            with open(FAVORITES_FILE, 'r') as f:
-                return json.load(f)
+            with open(FAVORITES_FILE, 'rb') as f:
+                return orjson.loads(f.read())
     except Exception:
         pass
     return []
@@ -1059,8 +1207,8 @@ def _load_favorites():
 def _save_favorites(symbols):
     try:
         os.makedirs(os.path.dirname(FAVORITES_FILE), exist_ok=True)
-        with open(FAVORITES_FILE, 'w') as f:
-            json.dump(symbols, f)
+        with open(FAVORITES_FILE, 'wb') as f:
+            f.write(orjson.dumps(symbols))
         return True
     except Exception:
         return False
@@ -1068,30 +1216,37 @@ def _save_favorites(symbols):
 @app.route('/api/favorites', methods=['GET'])
 def get_favorites():
     """Return favorites list with live ticker data from Bybit"""
-    import requests as req
     symbols = _load_favorites()
     if not symbols:
         return jsonify({'success': True, 'symbols': [], 'data': []})
     try:
-        response = req.get('https://api.bybit.com/v5/market/tickers',
-                           params={'category': 'linear'}, timeout=10)
-        data = response.json()
-        if data.get('retCode') != 0:
-            return jsonify({'error': 'Bybit API error'}), 502
-        ticker_map = {item['symbol']: item for item in data['result']['list']}
-        result = []
-        for sym in symbols:
-            item = ticker_map.get(sym)
-            if not item:
-                continue
-            last_price = float(item['lastPrice'])
-            vol_24h = float(item.get('volume24h', 0)) * last_price
-            result.append({
-                'symbol': sym,
-                'price': last_price,
-                'change_24h': round(float(item.get('price24hPcnt', 0)) * 100, 2),
-                'volume_24h': vol_24h,
-            })
+        # Ticker dal feed WS per i preferiti già sottoscritti; REST solo se ne manca qualcuno
+        live = {}
+        if ws_manager.ready.is_set():
+            for sym in symbols:
+                t = ws_manager.get_ticker(sym)
+                if t.get('price'):
+                    live[sym] = {'symbol': sym, 'price': t['price'],
+                                 'change_24h': round(t.get('change_24h', 0), 2),
+                                 'volume_24h': t.get('volume_24h', 0)}
+        if len(live) < len(symbols):
+            try:
+                tickers = get_linear_tickers()
+            except RuntimeError:
+                return jsonify({'error': 'Bybit API error'}), 502
+            wanted = set(symbols) - live.keys()
+            for item in tickers:
+                sym = item['symbol']
+                if sym not in wanted:
+                    continue
+                last_price = float(item['lastPrice'])
+                live[sym] = {
+                    'symbol': sym,
+                    'price': last_price,
+                    'change_24h': round(float(item.get('price24hPcnt', 0)) * 100, 2),
+                    'volume_24h': float(item.get('volume24h', 0)) * last_price,
+                }
+        result = [live[sym] for sym in symbols if sym in live]
         return jsonify({'success': True, 'symbols': symbols, 'data': result})
     except Exception as e:
         logger.error(f"Error fetching favorites data: {e}")
@@ -1118,8 +1273,8 @@ ALERTS_FILE = '/data/price_alerts.json'
 def _load_alerts():
     try:
         if os.path.exists(ALERTS_FILE):
-            with open(ALERTS_FILE, 'r') as f:
-                return json.load(f)
+            with open(ALERTS_FILE, 'rb') as f:
+                return orjson.loads(f.read())
     except Exception:
         pass
     return []
@@ -1127,8 +1282,8 @@ def _load_alerts():
 def _save_alerts(alerts):
     try:
         os.makedirs('/data', exist_ok=True)
-        with open(ALERTS_FILE, 'w') as f:
-            json.dump(alerts, f)
+        with open(ALERTS_FILE, 'wb') as f:
+            f.write(orjson.dumps(alerts))
         return True
     except Exception:
         return False
@@ -1141,14 +1296,13 @@ def _fmt_price(p):
 
 
 def send_telegram(text):
-    import requests as req
     token = config['telegram']['token']
     chat_id = config['telegram']['chat_id']
     if not token or not chat_id:
         logger.warning("Telegram not configured, skipping alert")
         return
     try:
-        req.post(
+        SESSION.post(
             f'https://api.telegram.org/bot{token}/sendMessage',
             json={'chat_id': chat_id, 'text': text},
             timeout=10,
@@ -1157,40 +1311,64 @@ def send_telegram(text):
         logger.error(f"Telegram send error: {e}")
 
 
-def send_telegram_photo(image_bytes, caption):
-    import requests as req
+def send_telegram_photos(photos):
+    """(image_bytes, caption) → un solo album Telegram (sendMediaGroup) invece di un
+    sendPhoto per grafico; con una sola foto alert_utils ripiega su sendPhoto.
+    Se Telegram rifiuta l'album, send_photos reinvia ogni voce da sola (foto, o
+    testo se anche la foto viene rifiutata): un caption sbagliato non fa perdere
+    tutti gli alert del giro."""
     token = config['telegram']['token']
     chat_id = config['telegram']['chat_id']
-    if not token or not chat_id:
+    if not token or not chat_id or not photos:
         return
+    from alert_utils import send_photos
+    send_photos(token, chat_id, photos)
+
+
+def _price_alert_chart(sym, price, condition):
+    """Grafico 1h di un price alert scattato, o None se non disponibile."""
     try:
-        req.post(
-            f'https://api.telegram.org/bot{token}/sendPhoto',
-            files={'photo': ('chart.png', image_bytes, 'image/png')},
-            data={'chat_id': chat_id, 'caption': caption, 'parse_mode': 'HTML'},
-            timeout=30,
-        )
-    except Exception as e:
-        logger.error(f"Telegram photo error: {e}")
+        from alert_utils import get_chart
+        return get_chart(sym, interval='60', signal={
+            'type':      'price',
+            'price':     price,
+            'condition': condition,
+        })
+    except Exception as ce:
+        logger.error(f"Chart error for price alert {sym}: {ce}")
+        return None
 
 
 def check_price_alerts():
-    import requests as req
-    while True:
-        time.sleep(60)
+    while not _STOP.wait(60):
         try:
             alerts = _load_alerts()
             active = [a for a in alerts if not a.get('triggered')]
             if not active:
                 continue
-            response = req.get('https://api.bybit.com/v5/market/tickers',
-                               params={'category': 'linear'}, timeout=10)
-            data = response.json()
-            if data.get('retCode') != 0:
-                continue
-            price_map = {item['symbol']: float(item['lastPrice'])
-                         for item in data['result']['list']}
+            wanted    = {a['symbol'] for a in active}
+            price_map = {}
+            # Prezzi dal feed WS quando è attivo; la chiamata REST (tutti i ticker
+            # linear) resta solo per i simboli fuori dai ticker sottoscritti
+            if ws_manager.ready.is_set():
+                for sym in wanted:
+                    p = ws_manager.get_ticker(sym).get('price')
+                    if p:
+                        price_map[sym] = p
+            missing = wanted - price_map.keys()
+            if missing:
+                try:
+                    tickers = get_linear_tickers()
+                except (RuntimeError, RequestException):
+                    # REST giù (errore API o di rete): si valuta comunque con i prezzi WS
+                    if not price_map:
+                        continue
+                    tickers = []
+                # Solo i simboli con alert attivi: un float() per alert, non per ticker
+                price_map.update({item['symbol']: float(item['lastPrice'])
+                                  for item in tickers if item['symbol'] in missing})
             modified = False
+            notify   = []
             for alert in alerts:
                 if alert.get('triggered'):
                     continue
@@ -1213,24 +1391,22 @@ def check_price_alerts():
                     caption   = f"{dir_word} {_fmt_price(alert['price'])}  {link}"
 
                     if alert.get('notify', 'both') != 'browser':
-                        img = None
-                        try:
-                            from alert_utils import get_chart
-                            img = get_chart(sym, interval='60', signal={
-                                'type':      'price',
-                                'price':     alert['price'],
-                                'condition': alert['condition'],
-                            })
-                        except Exception as ce:
-                            logger.error(f"Chart error for price alert {sym}: {ce}")
-                        if img:
-                            send_telegram_photo(img, caption)
-                        else:
-                            send_telegram(caption)
+                        notify.append((sym, alert['price'], alert['condition'], caption))
 
                     logger.info(f"Alert triggered: {sym} {alert['condition']} {alert['price']}")
             if modified:
                 _save_alerts(alerts)
+            # Grafici degli alert scattati resi in parallelo, poi inviati tutti in
+            # un unico album (una sola POST, con reinvio per voce se rifiutato: gli
+            # alert sono già segnati triggered); senza grafico resta il solo testo
+            if notify:
+                from concurrent.futures import ThreadPoolExecutor
+                with ThreadPoolExecutor(max_workers=min(4, len(notify))) as pool:
+                    imgs = list(pool.map(lambda n: _price_alert_chart(*n[:3]), notify))
+                send_telegram_photos([(img, n[3]) for n, img in zip(notify, imgs) if img])
+                for n, img in zip(notify, imgs):
+                    if not img:
+                        send_telegram(n[3])
         except Exception as e:
             logger.error(f"Error in check_price_alerts: {e}")
 
@@ -1324,7 +1500,6 @@ def _aggregate_candles(raw, bucket_s, tz_s):
 
 def _fetch_klines_bybit(symbol, interval, max_pages):
     """Paginated Bybit kline fetch, shared by /api/klines and the bot backtest."""
-    import requests as req
 
     utc_off = config.get('general', {}).get('utc_offset', 2)
     try:
@@ -1347,7 +1522,7 @@ def _fetch_klines_bybit(symbol, interval, max_pages):
         data = None
         for attempt in range(2):
             try:
-                data = req.get(url, params=params, timeout=8).json()
+                data = orjson.loads(SESSION.get(url, params=params, timeout=8).content)
                 break
             except Exception:
                 if attempt == 1:
@@ -1363,17 +1538,19 @@ def _fetch_klines_bybit(symbol, interval, max_pages):
             break  # reached the beginning of available data
         end_time = int(batch[-1][0]) - 1  # move window further back
 
-    # Reverse to chronological order, deduplicate by timestamp
-    all_raw.reverse()
-    seen   = set()
-    result = []
-    for k in all_raw:
-        ts = int(k[0]) // 1000 + tz_s
-        if ts in seen:
-            continue
-        seen.add(ts)
-        result.append({'time': ts, 'open': float(k[1]), 'high': float(k[2]),
-                        'low': float(k[3]), 'close': float(k[4]), 'volume': float(k[5])})
+    if not all_raw:
+        return [], tz_s
+    # Le pagine Bybit sono newest-first e contigue: un reverse dà l'ordine cronologico
+    # e un duplicato può solo ripetere la candela precedente (niente set né sort).
+    # Le stringhe decimali sono parsate in C dal costruttore dell'array, non con
+    # int()/float() per campo (fino a 5000 righe × 6 campi).
+    arr  = np.array(all_raw[::-1], dtype=np.float64)
+    ts   = (arr[:, 0] // 1000).astype(np.int64) + tz_s
+    keep = np.empty(len(ts), dtype=bool)
+    keep[0]  = True
+    keep[1:] = ts[1:] != ts[:-1]
+    result = [{'time': t, 'open': o, 'high': h, 'low': l, 'close': c, 'volume': v}
+              for t, (o, h, l, c, v) in zip(ts[keep].tolist(), arr[keep, 1:6].tolist())]
     return result, tz_s
 
 
@@ -1451,7 +1628,7 @@ def get_klines():
 def get_klines_live():
     """Return last 10 live klines for fast-TF polling.
     Uses ws_manager cache when seeded; falls back to Bybit REST immediately otherwise."""
-    import requests as req, re
+    import re
     symbol   = request.args.get('symbol', 'BTCUSDT').upper()
     interval = request.args.get('interval', '1')
 
@@ -1477,11 +1654,10 @@ def get_klines_live():
     if not klines:
         # ws_manager seed not ready yet — call Bybit REST directly
         try:
-            r = req.get('https://api.bybit.com/v5/market/kline',
-                        params={'category': 'linear', 'symbol': symbol,
-                                'interval': interval, 'limit': 10},
-                        timeout=6)
-            data = r.json()
+            data = get_json('https://api.bybit.com/v5/market/kline',
+                            params={'category': 'linear', 'symbol': symbol,
+                                    'interval': interval, 'limit': 10},
+                            timeout=6)
             if data.get('retCode') == 0:
                 klines = [{'time': int(k[0]) // 1000,
                            'open': float(k[1]), 'high': float(k[2]),
@@ -1509,15 +1685,14 @@ def get_klines_live():
 @app.route('/api/ticker', methods=['GET'])
 def get_ticker():
     """Get ticker data for a single USDT symbol."""
-    import requests as req
     symbol = request.args.get('symbol', '').upper()
     if not symbol.endswith('USDT') or len(symbol) > 20:
         return jsonify({'error': 'Invalid symbol'}), 400
     try:
-        r = req.get('https://api.bybit.com/v5/market/tickers',
-                    params={'category': 'linear', 'symbol': symbol},
-                    timeout=6)
-        d = r.json()
+        r = SESSION.get('https://api.bybit.com/v5/market/tickers',
+                        params={'category': 'linear', 'symbol': symbol},
+                        timeout=6)
+        d = orjson.loads(r.content)
         if d.get('retCode') != 0 or not d['result']['list']:
             return jsonify({'error': 'Symbol not found'}), 404
         t = d['result']['list'][0]
@@ -1596,7 +1771,7 @@ def save_settings():
     if role != 'admin':
         bk = data.get('bybit_api_key', '').strip()
         bs = data.get('bybit_api_secret', '').strip()
-        with sqlite3.connect(USERS_DB) as conn:
+        with _users_db() as conn:
             if bk:
                 conn.execute('UPDATE users SET bybit_api_key=? WHERE lower(username)=lower(?)', (_enc(bk), username))
             if bs and '●' not in bs:
@@ -1686,11 +1861,10 @@ def trade_config():
 @app.route('/api/trade/balance')
 @login_required
 def trade_balance():
-    import requests as rq
     k, s, en = _tcfg_user(session.get("username", ""))
     if not en: return jsonify({'error': 'not configured'}), 403
     qs = 'accountType=UNIFIED'
-    d = rq.get(f'{_BYB}/v5/account/wallet-balance?{qs}', headers=_bsign(k, s, qs), timeout=6).json()
+    d = SESSION.get(f'{_BYB}/v5/account/wallet-balance?{qs}', headers=_bsign(k, s, qs), timeout=6).json()
     if d.get('retCode') != 0: return jsonify({'error': d.get('retMsg'), 'code': d.get('retCode')}), 400
     for acc in d['result']['list']:
         for c in acc.get('coin', []):
@@ -1703,12 +1877,11 @@ def trade_balance():
 @app.route('/api/trade/position')
 @login_required
 def trade_position():
-    import requests as rq
     k, s, en = _tcfg_user(session.get("username", ""))
     if not en: return jsonify({'error': 'not configured'}), 403
     sym = request.args.get('symbol', '').upper()
     qs = f'category=linear&symbol={sym}'
-    d = rq.get(f'{_BYB}/v5/position/list?{qs}', headers=_bsign(k, s, qs), timeout=6).json()
+    d = SESSION.get(f'{_BYB}/v5/position/list?{qs}', headers=_bsign(k, s, qs), timeout=6).json()
     if d.get('retCode') != 0: return jsonify({'error': d.get('retMsg'), 'code': d.get('retCode')}), 400
     lst = d['result']['list']
     if not lst or float(lst[0].get('size', 0)) == 0: return jsonify({'position': None})
@@ -1722,6 +1895,11 @@ def trade_position():
         'markPrice': float(p.get('markPrice', 0)), 'liqPrice': _fv(p.get('liqPrice')),
     }})
 
+# Tetto agli stream SSE aperti insieme: ognuno tiene un thread gthread per tutta
+# la durata, il resto del pool (gunicorn_conf.threads) resta alle altre richieste
+SSE_MAX_STREAMS = 12
+_sse_slots = threading.BoundedSemaphore(SSE_MAX_STREAMS)
+
 @app.route('/api/trade/stream')
 @login_required
 def trade_stream():
@@ -1736,8 +1914,14 @@ def trade_stream():
     if not en:
         return jsonify({'error': 'not configured'}), 403
     symbol = request.args.get('symbol', '').upper()
-    conn = private_ws_pool.ensure(username, k, s)
-    q = conn.add_listener()
+    if not _sse_slots.acquire(blocking=False):
+        return jsonify({'error': 'too many open streams'}), 503
+    try:
+        conn = private_ws_pool.ensure(username, k, s)
+        q = conn.add_listener()
+    except Exception:
+        _sse_slots.release()
+        raise
 
     def gen():
         try:
@@ -1753,8 +1937,11 @@ def trade_stream():
         finally:
             conn.remove_listener(q)
 
-    return Response(stream_with_context(gen()), mimetype='text/event-stream',
-                     headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    resp = Response(stream_with_context(gen()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    # Rilascio alla chiusura della risposta, anche se il generatore non è mai partito
+    resp.call_on_close(_sse_slots.release)
+    return resp
 
 _DEFAULT_TAKER_FEE = 0.00055  # fallback standard Bybit derivati (VIP0) se manca API key
 
@@ -1763,12 +1950,11 @@ def _fetch_taker_fee_rate(k, s, en, symbol):
     Richiede una API key configurata — altrimenti ricade sul valore standard Bybit.
     Condivisa da _bybit_taker_fee_rate (utente di /api/trade/*) e
     _BotTradeClient.get_taker_fee_rate (account globale del BOT)."""
-    import requests as rq
     if not en:
         return _DEFAULT_TAKER_FEE
     try:
         qs = f'category=linear&symbol={symbol}'
-        d = rq.get(f'{_BYB}/v5/account/fee-rate?{qs}', headers=_bsign(k, s, qs), timeout=6).json()
+        d = SESSION.get(f'{_BYB}/v5/account/fee-rate?{qs}', headers=_bsign(k, s, qs), timeout=6).json()
         if d.get('retCode') != 0:
             return _DEFAULT_TAKER_FEE
         lst = d['result']['list']
@@ -1786,10 +1972,9 @@ def _bybit_taker_fee_rate(username, symbol):
 @app.route('/api/trade/instrument')
 @login_required
 def trade_instrument():
-    import requests as rq
     sym = request.args.get('symbol', '').upper()
-    d = rq.get(f'{_BYB}/v5/market/instruments-info',
-               params={'category': 'linear', 'symbol': sym}, timeout=6).json()
+    d = SESSION.get(f'{_BYB}/v5/market/instruments-info',
+                    params={'category': 'linear', 'symbol': sym}, timeout=6).json()
     if d.get('retCode') != 0 or not d['result']['list']: return jsonify({'error': 'not found'}), 404
     info = d['result']['list'][0]
     lot = info.get('lotSizeFilter', {}); lev = info.get('leverageFilter', {})
@@ -1800,7 +1985,6 @@ def trade_instrument():
 @app.route('/api/trade/orders')
 @login_required
 def trade_orders():
-    import requests as rq
     k, s, en = _tcfg_user(session.get("username", ""))
     if not en: return jsonify({'error': 'not configured'}), 403
     sym = request.args.get('symbol', '').upper()
@@ -1808,7 +1992,7 @@ def trade_orders():
     for flt in ['Order', 'StopOrder']:
         qs = f'category=linear&symbol={sym}&openOnly=0&orderFilter={flt}&limit=50'
         try:
-            d = rq.get(f'{_BYB}/v5/order/realtime?{qs}', headers=_bsign(k, s, qs), timeout=6).json()
+            d = SESSION.get(f'{_BYB}/v5/order/realtime?{qs}', headers=_bsign(k, s, qs), timeout=6).json()
         except Exception:
             continue
         if d.get('retCode') != 0:
@@ -1835,7 +2019,6 @@ def trade_orders():
 @app.route('/api/trade/cancel', methods=['POST'])
 @login_required
 def trade_cancel():
-    import requests as rq
     k, s, en = _tcfg_user(session.get("username", ""))
     if not en: return jsonify({'error': 'not configured'}), 403
     data = request.get_json() or {}
@@ -1844,14 +2027,13 @@ def trade_cancel():
     order_filter = data.get('orderFilter', 'Order')
     if not sym or not order_id: return jsonify({'error': 'missing params'}), 400
     body = json.dumps({'category': 'linear', 'symbol': sym, 'orderId': order_id, 'orderFilter': order_filter})
-    d = rq.post(f'{_BYB}/v5/order/cancel', headers=_bsign(k, s, body), data=body, timeout=10).json()
+    d = SESSION.post(f'{_BYB}/v5/order/cancel', headers=_bsign(k, s, body), data=body, timeout=10).json()
     if d.get('retCode') != 0: return jsonify({'error': d.get('retMsg'), 'code': d.get('retCode')}), 400
     return jsonify({'success': True})
 
 @app.route('/api/trade/amend', methods=['POST'])
 @login_required
 def trade_amend():
-    import requests as rq
     k, s, en = _tcfg_user(session.get("username", ""))
     if not en: return jsonify({'error': 'not configured'}), 403
     data = request.get_json() or {}
@@ -1878,14 +2060,13 @@ def trade_amend():
                 if data['tpOrderType'] == 'Limit' and data.get('tpLimitPrice') is not None:
                     body['tpLimitPrice'] = str(data['tpLimitPrice'])
     b = json.dumps(body)
-    d = rq.post(f'{_BYB}/v5/order/amend', headers=_bsign(k, s, b), data=b, timeout=10).json()
+    d = SESSION.post(f'{_BYB}/v5/order/amend', headers=_bsign(k, s, b), data=b, timeout=10).json()
     if d.get('retCode') != 0: return jsonify({'error': d.get('retMsg'), 'code': d.get('retCode')}), 400
     return jsonify({'success': True})
 
 @app.route('/api/trade/order', methods=['POST'])
 @login_required
 def trade_order():
-    import requests as rq
     k, s, en = _tcfg_user(session.get("username", ""))
     if not en: return jsonify({'error': 'not configured'}), 403
     data = request.get_json() or {}
@@ -1896,7 +2077,7 @@ def trade_order():
     trigger_price = data.get('triggerPrice')
     if not all([sym, side, qty]): return jsonify({'error': 'missing params'}), 400
     lb = json.dumps({'category': 'linear', 'symbol': sym, 'buyLeverage': lev, 'sellLeverage': lev})
-    rq.post(f'{_BYB}/v5/position/set-leverage', headers=_bsign(k, s, lb), data=lb, timeout=6)
+    SESSION.post(f'{_BYB}/v5/position/set-leverage', headers=_bsign(k, s, lb), data=lb, timeout=6)
     order = {'category': 'linear', 'symbol': sym, 'side': side, 'orderType': otype, 'qty': qty,
              'timeInForce': 'GTC' if otype == 'Limit' else 'IOC'}
     if order_filter == 'StopOrder':
@@ -1916,21 +2097,20 @@ def trade_order():
             if data['tpOrderType'] == 'Limit' and data.get('tpLimitPrice') is not None:
                 order['tpLimitPrice'] = str(data['tpLimitPrice'])
     body = json.dumps(order)
-    d = rq.post(f'{_BYB}/v5/order/create', headers=_bsign(k, s, body), data=body, timeout=10).json()
+    d = SESSION.post(f'{_BYB}/v5/order/create', headers=_bsign(k, s, body), data=body, timeout=10).json()
     if d.get('retCode') != 0: return jsonify({'error': d.get('retMsg', 'Order failed')}), 400
     return jsonify({'success': True, 'orderId': d['result'].get('orderId')})
 
 @app.route('/api/trade/close', methods=['POST'])
 @login_required
 def trade_close_pos():
-    import requests as rq
     k, s, en = _tcfg_user(session.get("username", ""))
     if not en: return jsonify({'error': 'not configured'}), 403
     data = request.get_json() or {}
     body = json.dumps({'category': 'linear', 'symbol': data.get('symbol', '').upper(),
                        'side': data.get('side'), 'orderType': 'Market',
                        'qty': str(data.get('qty', '')), 'reduceOnly': True, 'timeInForce': 'IOC'})
-    d = rq.post(f'{_BYB}/v5/order/create', headers=_bsign(k, s, body), data=body, timeout=10).json()
+    d = SESSION.post(f'{_BYB}/v5/order/create', headers=_bsign(k, s, body), data=body, timeout=10).json()
     if d.get('retCode') != 0: return jsonify({'error': d.get('retMsg'), 'code': d.get('retCode')}), 400
     return jsonify({'success': True})
 
@@ -1943,7 +2123,6 @@ def trade_reverse_pos():
     viene rilettera da Bybit qui (non dal client) per sicurezza, così l'ordine
     riflette sempre la posizione reale al momento del click, non un valore
     potenzialmente stantio mostrato in UI."""
-    import requests as rq
     from decimal import Decimal
     k, s, en = _tcfg_user(session.get("username", ""))
     if not en: return jsonify({'error': 'not configured'}), 403
@@ -1951,7 +2130,7 @@ def trade_reverse_pos():
     sym = data.get('symbol', '').upper()
     if not sym: return jsonify({'error': 'missing symbol'}), 400
     qs = f'category=linear&symbol={sym}'
-    d = rq.get(f'{_BYB}/v5/position/list?{qs}', headers=_bsign(k, s, qs), timeout=6).json()
+    d = SESSION.get(f'{_BYB}/v5/position/list?{qs}', headers=_bsign(k, s, qs), timeout=6).json()
     if d.get('retCode') != 0: return jsonify({'error': d.get('retMsg'), 'code': d.get('retCode')}), 400
     lst = d['result']['list']
     if not lst or float(lst[0].get('size', 0)) == 0:
@@ -1961,14 +2140,13 @@ def trade_reverse_pos():
     new_qty = str(Decimal(p['size']) * 2)
     body = json.dumps({'category': 'linear', 'symbol': sym, 'side': opp_side, 'orderType': 'Market',
                         'qty': new_qty, 'reduceOnly': False, 'timeInForce': 'IOC'})
-    dd = rq.post(f'{_BYB}/v5/order/create', headers=_bsign(k, s, body), data=body, timeout=10).json()
+    dd = SESSION.post(f'{_BYB}/v5/order/create', headers=_bsign(k, s, body), data=body, timeout=10).json()
     if dd.get('retCode') != 0: return jsonify({'error': dd.get('retMsg'), 'code': dd.get('retCode')}), 400
     return jsonify({'success': True, 'newSide': opp_side, 'newSize': str(Decimal(p['size']))})
 
 @app.route('/api/trade/set-sltp', methods=['POST'])
 @login_required
 def trade_set_sltp():
-    import requests as rq
     k, s, en = _tcfg_user(session.get("username", ""))
     if not en: return jsonify({'error': 'not configured'}), 403
     data = request.get_json() or {}
@@ -1989,7 +2167,7 @@ def trade_set_sltp():
                 if data['tpOrderType'] == 'Limit' and data.get('tpLimitPrice') is not None:
                     body['tpLimitPrice'] = str(data['tpLimitPrice'])
     b = json.dumps(body)
-    d = rq.post(f'{_BYB}/v5/position/trading-stop', headers=_bsign(k, s, b), data=b, timeout=6).json()
+    d = SESSION.post(f'{_BYB}/v5/position/trading-stop', headers=_bsign(k, s, b), data=b, timeout=6).json()
     if d.get('retCode') != 0: return jsonify({'error': d.get('retMsg'), 'code': d.get('retCode')}), 400
     return jsonify({'success': True})
 
@@ -2005,13 +2183,12 @@ class _BotTradeClient:
         """Fill reali dell'exchange (non i segnali calcolati dal motore) — mostrati
         nella UI come "Alert Bybit" per confrontare cosa dice il motore con cosa è
         realmente successo sull'account (entrata/chiusura eseguita, SL/TP scattato)."""
-        import requests as rq
         k, s, en = _tcfg()
         if not en:
             return []
         qs = f'category=linear&symbol={symbol}&limit={limit}'
         try:
-            d = rq.get(f'{_BYB}/v5/execution/list?{qs}', headers=_bsign(k, s, qs), timeout=6).json()
+            d = SESSION.get(f'{_BYB}/v5/execution/list?{qs}', headers=_bsign(k, s, qs), timeout=6).json()
         except Exception:
             return []
         if d.get('retCode') != 0:
@@ -2040,13 +2217,12 @@ class _BotTradeClient:
         return _fetch_taker_fee_rate(k, s, en, symbol)
 
     def get_position(self, symbol):
-        import requests as rq
         k, s, en = _tcfg()
         if not en:
             return None
         qs = f'category=linear&symbol={symbol}'
         try:
-            d = rq.get(f'{_BYB}/v5/position/list?{qs}', headers=_bsign(k, s, qs), timeout=6).json()
+            d = SESSION.get(f'{_BYB}/v5/position/list?{qs}', headers=_bsign(k, s, qs), timeout=6).json()
         except Exception:
             return None
         if d.get('retCode') != 0:
@@ -2059,13 +2235,12 @@ class _BotTradeClient:
                 'positionIdx': int(p.get('positionIdx', 0))}
 
     def get_balance(self):
-        import requests as rq
         k, s, en = _tcfg()
         if not en:
             return {'available': 0.0, 'equity': 0.0}
         qs = 'accountType=UNIFIED'
         try:
-            d = rq.get(f'{_BYB}/v5/account/wallet-balance?{qs}', headers=_bsign(k, s, qs), timeout=6).json()
+            d = SESSION.get(f'{_BYB}/v5/account/wallet-balance?{qs}', headers=_bsign(k, s, qs), timeout=6).json()
         except Exception:
             return {'available': 0.0, 'equity': 0.0}
         if d.get('retCode') != 0:
@@ -2079,10 +2254,9 @@ class _BotTradeClient:
         return {'available': 0.0, 'equity': 0.0}
 
     def get_instrument(self, symbol):
-        import requests as rq
         try:
-            d = rq.get(f'{_BYB}/v5/market/instruments-info',
-                       params={'category': 'linear', 'symbol': symbol}, timeout=6).json()
+            d = SESSION.get(f'{_BYB}/v5/market/instruments-info',
+                            params={'category': 'linear', 'symbol': symbol}, timeout=6).json()
         except Exception:
             return {'qtyStep': 0.001, 'minOrderQty': 0.001, 'maxLeverage': 100.0}
         if d.get('retCode') != 0 or not d['result']['list']:
@@ -2094,14 +2268,13 @@ class _BotTradeClient:
                 'maxLeverage': float(lev.get('maxLeverage', 100))}
 
     def place_order(self, symbol, side, qty, leverage=1, stop_loss=None, take_profit=None):
-        import requests as rq
         k, s, en = _tcfg()
         if not en:
             return False, None, 'trading non configurato'
         lev = str(int(leverage or 1))
         lb = json.dumps({'category': 'linear', 'symbol': symbol, 'buyLeverage': lev, 'sellLeverage': lev})
         try:
-            rq.post(f'{_BYB}/v5/position/set-leverage', headers=_bsign(k, s, lb), data=lb, timeout=6)
+            SESSION.post(f'{_BYB}/v5/position/set-leverage', headers=_bsign(k, s, lb), data=lb, timeout=6)
         except Exception:
             pass
         order = {'category': 'linear', 'symbol': symbol, 'side': side, 'orderType': 'Market',
@@ -2112,7 +2285,7 @@ class _BotTradeClient:
             order['takeProfit'] = str(round(take_profit, 8))
         body = json.dumps(order)
         try:
-            d = rq.post(f'{_BYB}/v5/order/create', headers=_bsign(k, s, body), data=body, timeout=10).json()
+            d = SESSION.post(f'{_BYB}/v5/order/create', headers=_bsign(k, s, body), data=body, timeout=10).json()
         except Exception as e:
             return False, None, str(e)
         if d.get('retCode') != 0:
@@ -2120,7 +2293,6 @@ class _BotTradeClient:
         return True, d['result'].get('orderId'), None
 
     def close_position(self, symbol, position_side, qty):
-        import requests as rq
         k, s, en = _tcfg()
         if not en:
             return False, 'trading non configurato'
@@ -2129,7 +2301,7 @@ class _BotTradeClient:
                            'orderType': 'Market', 'qty': str(qty), 'reduceOnly': True,
                            'timeInForce': 'IOC'})
         try:
-            d = rq.post(f'{_BYB}/v5/order/create', headers=_bsign(k, s, body), data=body, timeout=10).json()
+            d = SESSION.post(f'{_BYB}/v5/order/create', headers=_bsign(k, s, body), data=body, timeout=10).json()
         except Exception as e:
             return False, str(e)
         if d.get('retCode') != 0:
@@ -2139,14 +2311,13 @@ class _BotTradeClient:
     def modify_stop_loss(self, symbol, stop_loss, position_idx=0):
         """Sposta lo SL di una posizione aperta (es. a breakeven dopo TP1) — riusa
         lo stesso endpoint di /api/trade/set-sltp, senza toccare il take profit."""
-        import requests as rq
         k, s, en = _tcfg()
         if not en:
             return False, 'trading non configurato'
         body = json.dumps({'category': 'linear', 'symbol': symbol, 'positionIdx': int(position_idx or 0),
                            'stopLoss': str(round(stop_loss, 8)), 'slTriggerBy': 'MarkPrice'})
         try:
-            d = rq.post(f'{_BYB}/v5/position/trading-stop', headers=_bsign(k, s, body), data=body, timeout=6).json()
+            d = SESSION.post(f'{_BYB}/v5/position/trading-stop', headers=_bsign(k, s, body), data=body, timeout=6).json()
         except Exception as e:
             return False, str(e)
         if d.get('retCode') != 0:
@@ -2456,7 +2627,7 @@ def login_page():
 @app.route('/verify/<token>')
 def verify_email(token):
     try:
-        with sqlite3.connect(USERS_DB) as conn:
+        with _users_db() as conn:
             row = conn.execute('SELECT username FROM users WHERE verify_token=?', (token,)).fetchone()
             if not row:
                 return '<h2 style=font-family:sans-serif;color:#f87171;text-align:center;margin-top:100px>Link non valido o gia usato.</h2>', 400
@@ -2486,7 +2657,7 @@ def recover_password():
     username = None
     new_pw = None
     try:
-        with sqlite3.connect(USERS_DB) as conn:
+        with _users_db() as conn:
             row = conn.execute('SELECT username FROM users WHERE email=?', (email,)).fetchone()
             if row:
                 username = row[0]
@@ -2564,7 +2735,7 @@ def save_profile():
         username = session.get('username', '')
         if 'email' in data:
             try:
-                with sqlite3.connect(USERS_DB) as conn:
+                with _users_db() as conn:
                     conn.execute('UPDATE users SET email=? WHERE lower(username)=lower(?)',
                                  (data['email'].strip().lower(), username))
                     conn.commit()
@@ -2577,7 +2748,7 @@ def get_prefs():
     if not session.get('logged_in'):
         return jsonify({'logged_in': False, 'username': None, 'prefs': {}})
     username = session.get('username', '')
-    with sqlite3.connect(USERS_DB) as conn:
+    with _users_db() as conn:
         rows = conn.execute('SELECT pkey, value FROM user_prefs WHERE username=?', (username,)).fetchall()
     return jsonify({'logged_in': True, 'username': username, 'prefs': {k: v for k, v in rows}})
 
@@ -2591,7 +2762,7 @@ def put_pref(pkey):
         return jsonify({'error': 'missing value'}), 400
     if not isinstance(value, str):
         value = json.dumps(value)
-    with sqlite3.connect(USERS_DB) as conn:
+    with _users_db() as conn:
         conn.execute(
             'INSERT INTO user_prefs (username, pkey, value, updated_at) VALUES (?,?,?,?) '
             'ON CONFLICT(username, pkey) DO UPDATE SET value=excluded.value, updated_at=excluded.updated_at',
@@ -2603,7 +2774,7 @@ def put_pref(pkey):
 @login_required
 def delete_pref(pkey):
     username = session.get('username', '')
-    with sqlite3.connect(USERS_DB) as conn:
+    with _users_db() as conn:
         conn.execute('DELETE FROM user_prefs WHERE username=? AND pkey=?', (username, pkey))
         conn.commit()
     return jsonify({'success': True})
@@ -2616,7 +2787,7 @@ def flush_prefs():
     if not isinstance(items, list):
         return jsonify({'error': 'invalid body'}), 400
     now = datetime.utcnow().isoformat()
-    with sqlite3.connect(USERS_DB) as conn:
+    with _users_db() as conn:
         for it in items:
             pkey = it.get('pkey')
             if not pkey:
@@ -2669,7 +2840,7 @@ def change_password():
         if len(new_pw) < 6:
             return jsonify({'success': False, 'error': 'Password troppo corta (min 6 caratteri)'}), 400
         try:
-            with sqlite3.connect(USERS_DB) as conn:
+            with _users_db() as conn:
                 conn.execute('UPDATE users SET password_hash=? WHERE lower(username)=lower(?)',
                              (_hash_pw(new_pw), username))
                 conn.commit()
@@ -2842,22 +3013,20 @@ def index():
 
 def _prefetch_klines_30m():
     """Pre-fetch 30m klines for top 200 coins at startup, 5 at a time."""
-    import requests as _req, time as _time
     try:
-        r = _req.get('https://api.bybit.com/v5/market/tickers',
-                     params={'category': 'linear'}, timeout=10)
-        symbols = [item['symbol'] for item in r.json().get('result', {}).get('list', [])
-                   if item.get('symbol', '').endswith('USDT')][:200]
+        # Slice first: only the 200 symbols kept are touched (USDT filter done once in the cache)
+        symbols = [item['symbol'] for item in get_usdt_tickers()[:200]]
     except Exception as e:
         logger.error(f'prefetch: failed to get symbols: {e}')
         return
     logger.info(f'Prefetching 30m klines for {len(symbols)} symbols...')
     def fetch_one(sym):
         try:
-            r = _req.get('https://api.bybit.com/v5/market/kline',
+            # Sessione condivisa: i 5 worker riusano le connessioni keep-alive
+            # invece di un handshake TLS per ognuna delle 200 richieste
+            d = get_json('https://api.bybit.com/v5/market/kline',
                 params={'category':'linear','symbol':sym,'interval':'30','limit':300},
                 timeout=8)
-            d = r.json()
             if d.get('retCode') == 0:
                 candles = [{'time':int(k[0])//1000,'open':float(k[1]),'high':float(k[2]),
                     'low':float(k[3]),'close':float(k[4]),'volume':float(k[5])}
@@ -2910,7 +3079,7 @@ def admin_delete_user(username):
     if username == session.get('username'):
         return jsonify({'error': 'Non puoi eliminare il tuo account'}), 400
     try:
-        with sqlite3.connect(USERS_DB) as conn:
+        with _users_db() as conn:
             row = conn.execute('SELECT role FROM users WHERE username=?', (username,)).fetchone()
             if not row:
                 return jsonify({'error': 'Utente non trovato'}), 404
@@ -2928,7 +3097,7 @@ def admin_get_users():
     if session.get('role') != 'admin':
         return jsonify({'error': 'Accesso negato'}), 403
     try:
-        with sqlite3.connect(USERS_DB) as conn:
+        with _users_db() as conn:
             conn.row_factory = sqlite3.Row
             rows = conn.execute(
                 'SELECT username, email, role, created_at FROM users ORDER BY created_at DESC'
@@ -2937,7 +3106,19 @@ def admin_get_users():
     except Exception:
         return jsonify({'users': []})
 
-if __name__ == '__main__':
+_services_started = False
+_services_lock = threading.Lock()
+
+
+def start_background_services():
+    """Avvia WS, scanner e thread di background. Chiamata una sola volta dal
+    worker gunicorn (post_worker_init) o dal blocco __main__ in sviluppo."""
+    global _services_started
+    with _services_lock:
+        if _services_started:
+            return
+        _services_started = True
+
     threading.Thread(target=_prefetch_klines_30m, daemon=True).start()
     logger.info("🚀 Crypto Scanner Professional Starting...")
 
@@ -2958,6 +3139,23 @@ if __name__ == '__main__':
     # Start polling threads (fallback / manual scan)
     start_scanners()
 
+
+def stop_background_services():
+    """Sveglia e termina i loop di background (scanner, price alerts)."""
+    _STOP.set()
+    _SCHED_WAKE.set()
+
+
+def _on_sigterm(signum, frame):
+    stop_background_services()
+    raise SystemExit(0)
+
+
+if __name__ == '__main__':
+    # Solo sviluppo: in produzione run.sh avvia gunicorn (gunicorn_conf.py)
+    signal.signal(signal.SIGTERM, _on_sigterm)
+    start_background_services()
+
     # Start Flask app
     logger.info("✅ Starting Flask on port 8080...")
     app.run(host='0.0.0.0', port=8080, debug=False, threaded=True)
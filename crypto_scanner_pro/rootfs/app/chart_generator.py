@@ -4,12 +4,19 @@ Used when Selenium/Chromium is unavailable.
 """
 import matplotlib
 matplotlib.use('Agg')
-import matplotlib.pyplot as plt
 import matplotlib.patches as mpatches
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.collections import LineCollection, PolyCollection
+from matplotlib.figure import Figure
 import numpy as np
+from PIL import Image
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import datetime
 import io
-import requests
+import multiprocessing
+import os
+import threading
+from http_session import get_json
 
 # === Colors matching chart.html ===
 _BG   = '#0B0E11'
@@ -23,39 +30,86 @@ _H    = '#22c55e'
 _L    = '#ef4444'
 
 
-def _calc_ema(closes, period):
-    k = 2 / (period + 1)
-    v = closes[0]
-    out = []
-    for c in closes:
-        v = c * k + v * (1 - k)
-        out.append(v)
+# numba is optional: it ships wheels for the Debian standalone image but not for
+# the Alpine/musl add-on base, where the same kernel runs as plain Python.
+try:
+    from numba import njit
+    _NUMBA_OK = True
+except ImportError:
+    _NUMBA_OK = False
+
+
+def _ema_multi(closes, alphas, out):
+    """out[:, j] = EMA of closes with smoothing alphas[j], seeded with closes[0].
+    Bar-major: each close is read once and updates every accumulator, and the
+    row-major out is written contiguously."""
+    m = alphas.shape[0]
+    e = np.empty(m)
+    for j in range(m):
+        e[j] = closes[0]
+    for i in range(closes.shape[0]):
+        c = closes[i]
+        for j in range(m):
+            e[j] += alphas[j] * (c - e[j])
+            out[i, j] = e[j]
     return out
 
 
+if _NUMBA_OK:
+    _ema_multi = njit(cache=True)(_ema_multi)  # no fastmath: same values as the Python fallback
+
+
+def _calc_emas(closes, periods):
+    """All EMA periods in one pass over closes -> (len(closes), len(periods)) array.
+    Seeded with the first close, same recurrence as chart.html."""
+    closes = np.ascontiguousarray(closes, dtype=np.float64)
+    alphas = 2.0 / (np.asarray(periods, dtype=np.float64) + 1.0)
+    return _ema_multi(closes, alphas, np.empty((len(closes), len(alphas))))
+
+
 def _fetch_klines(symbol, interval='30', limit=350):
     try:
-        r = requests.get(
+        d = get_json(
             'https://api.bybit.com/v5/market/kline',
             params={'category': 'linear', 'symbol': symbol,
                     'interval': interval, 'limit': limit},
             timeout=10,
         )
-        d = r.json()
         if d.get('retCode') != 0:
             return []
-        klines = [
+        # Bybit returns candles newest-first: reversing is enough, no sort needed
+        return [
             {'t': int(k[0]) // 1000, 'o': float(k[1]),
              'h': float(k[2]), 'l': float(k[3]), 'c': float(k[4])}
-            for k in d['result']['list']
+            for k in reversed(d['result']['list'])
         ]
-        klines.sort(key=lambda x: x['t'])
-        return klines
     except Exception as e:
         print(f'kline fetch error {symbol}: {e}')
         return []
 
 
+# One Figure per rendering thread, cleared and reused between charts: skips the
+# Figure/canvas/font setup of plt.subplots() on every alert and keeps pyplot's
+# global figure registry out of the multi-threaded scanners.
+_FIG_CACHE = threading.local()
+
+
+def _get_figure():
+    fig = getattr(_FIG_CACHE, 'fig', None)
+    if fig is None:
+        fig = Figure(figsize=(12.8, 6.4), dpi=100)
+        FigureCanvasAgg(fig)
+        _FIG_CACHE.fig = fig
+    else:
+        fig.clf()
+    return fig
+
+
+# Kline fetches are pure I/O: the chart TF and the daily H/L request go out
+# together instead of back to back.
+_FETCH_POOL = ThreadPoolExecutor(max_workers=8, thread_name_prefix='chart-fetch')
+
+
 def _fmt_p(p):
     if p >= 10000: return f'{p:,.0f}'
     if p >= 1:     return f'{p:.3f}'
@@ -63,7 +117,28 @@ def _fmt_p(p):
     return f'{p:.7f}'
 
 
-def generate_alert_chart(symbol, interval='30', signal=None):
+# ~3 px per candle at 1280 px: above this, adjacent candles are merged per bucket
+_MAX_BARS = 400
+
+
+def _bucket_ohlc(ohlc, dk, emas, max_bars):
+    """Merge consecutive candles into <= max_bars buckets, keeping each bucket's
+    first open, high max, low min and last close so wicks stay exact.
+    EMAs are sampled at the bucket close, timestamps at the bucket open."""
+    n      = len(ohlc)
+    step   = -(-n // max_bars)
+    starts = np.arange(0, n, step)
+    ends   = np.minimum(starts + step, n) - 1
+    merged = np.column_stack([
+        ohlc[starts, 0],
+        np.maximum.reduceat(ohlc[:, 1], starts),
+        np.minimum.reduceat(ohlc[:, 2], starts),
+        ohlc[ends, 3],
+    ])
+    return merged, [dk[i] for i in starts.tolist()], emas[ends]
+
+
+def generate_alert_chart(symbol, interval='30', signal=None, bars=80):
     """
     Generate a chart PNG matching chart.html visual style.
 
@@ -71,27 +146,35 @@ def generate_alert_chart(symbol, interval='30', signal=None):
       type      : 'ema' | 'price' | 'gainer' | 'loser' | 'flip' | 'ath' | 'atl'
       price     : float   (price alert target)
       condition : 'above' | 'below'
+    bars: visible candles (downsampled to _MAX_BARS buckets beyond that)
 
     Returns PNG bytes or None.
     """
-    klines = _fetch_klines(symbol, interval, limit=300)
+    daily_f = _FETCH_POOL.submit(_fetch_klines, symbol, 'D', 3)
+    klines = _fetch_klines(symbol, interval, limit=min(1000, max(300, bars + 223)))
     if len(klines) < 60:
         return None
-    daily = _fetch_klines(symbol, 'D', limit=3)
+    daily = daily_f.result()
 
-    N  = min(80, len(klines))
+    N  = min(bars, len(klines))
     dk = klines[-N:]
 
-    closes_all = [k['c'] for k in klines]
-    ev = {p: _calc_ema(closes_all, p)[-N:] for p in [5, 10, 60, 223]}
+    # OHLC converted once: the EMA kernel and the candle arrays are views of it
+    ohlc = np.array([(k['o'], k['h'], k['l'], k['c']) for k in klines], dtype=np.float64)
+    periods = (5, 10, 60, 223)
+    emas = _calc_emas(ohlc[:, 3], periods)[-N:]
+    view = ohlc[-N:]
+    if N > _MAX_BARS:
+        view, dk, emas = _bucket_ohlc(view, dk, emas, _MAX_BARS)
+        N = len(view)
+    ev = {p: emas[:, j] for j, p in enumerate(periods)}
 
     x = np.arange(N)
-    o = np.array([k['o'] for k in dk])
-    h = np.array([k['h'] for k in dk])
-    l = np.array([k['l'] for k in dk])
-    c = np.array([k['c'] for k in dk])
+    o, h, l, c = view.T
+    last_price = c[-1]
 
-    fig, ax = plt.subplots(figsize=(12.8, 6.4), dpi=100)
+    fig = _get_figure()
+    ax  = fig.add_subplot()
     fig.patch.set_facecolor(_BG)
     ax.set_facecolor(_BG)
     for sp in ax.spines.values():
@@ -99,17 +182,21 @@ def generate_alert_chart(symbol, interval='30', signal=None):
     ax.grid(True, color=_GRID, linewidth=0.4, zorder=0)
     ax.set_axisbelow(True)
 
-    # Candles
-    up = c >= o
-    dn = ~up
-    bw, ww = 0.55, 0.07
+    # Candles: one LineCollection for the wicks + one PolyCollection for the bodies
+    up  = c >= o
+    col = np.where(up, _CUP, _CDN)
+    bw  = 0.55
+
+    wicks = np.stack([np.column_stack([x, l]), np.column_stack([x, h])], axis=1)
+    ax.add_collection(LineCollection(wicks, colors=col, linewidths=0.8, zorder=3))
 
-    ax.bar(x[up],  c[up] - o[up],  bw, bottom=o[up],  color=_CUP, zorder=3, linewidth=0)
-    ax.bar(x[dn],  o[dn] - c[dn],  bw, bottom=c[dn],  color=_CDN, zorder=3, linewidth=0)
-    ax.bar(x[up],  h[up] - c[up],  ww, bottom=c[up],  color=_CUP, zorder=3, linewidth=0)
-    ax.bar(x[up],  o[up] - l[up],  ww, bottom=l[up],  color=_CUP, zorder=3, linewidth=0)
-    ax.bar(x[dn],  h[dn] - o[dn],  ww, bottom=o[dn],  color=_CDN, zorder=3, linewidth=0)
-    ax.bar(x[dn],  c[dn] - l[dn],  ww, bottom=l[dn],  color=_CDN, zorder=3, linewidth=0)
+    x0, x1 = x - bw / 2, x + bw / 2
+    bot, top = np.minimum(o, c), np.maximum(o, c)
+    bodies = np.stack([np.column_stack([x0, bot]), np.column_stack([x0, top]),
+                       np.column_stack([x1, top]), np.column_stack([x1, bot])], axis=1)
+    ax.add_collection(PolyCollection(bodies, facecolors=col, edgecolors='none',
+                                     linewidths=0, zorder=3))
+    ax.autoscale_view()
 
     # EMAs
     for p, lw in [(5, 2), (10, 2), (60, 2.5), (223, 2)]:
@@ -149,21 +236,23 @@ def generate_alert_chart(symbol, interval='30', signal=None):
             ax.axvspan(N - 2.5, N - 0.5, alpha=0.08,
                        color=clr_map[st], zorder=2)
 
-    # X axis ticks
+    # X axis ticks: timestamps converted in one datetime64 pass, labels sliced
+    # from the ISO strings ('YYYY-MM-DDTHH:MM') instead of strftime per tick
     step = max(1, N // 8)
-    tpos = list(range(0, N, step))
+    tpos = np.arange(0, N, step)
     tf_v = str(interval)
 
-    def _tick(k):
-        dt = datetime.utcfromtimestamp(k['t'])
-        if tf_v == 'D':
-            return dt.strftime('%m/%d')
-        if int(tf_v) >= 240:
-            return dt.strftime('%m/%d\n%Hh')
-        return dt.strftime('%m/%d\n%H:%M')
+    iso = np.datetime_as_string(
+        np.array([dk[i]['t'] for i in tpos.tolist()], dtype='datetime64[s]'), unit='m')
+    if tf_v == 'D':
+        labels = [f'{d[5:7]}/{d[8:10]}' for d in iso]
+    elif int(tf_v) >= 240:
+        labels = [f'{d[5:7]}/{d[8:10]}\n{d[11:13]}h' for d in iso]
+    else:
+        labels = [f'{d[5:7]}/{d[8:10]}\n{d[11:16]}' for d in iso]
 
     ax.set_xticks(tpos)
-    ax.set_xticklabels([_tick(dk[i]) for i in tpos], color=_TEXT, fontsize=7.5)
+    ax.set_xticklabels(labels, color=_TEXT, fontsize=7.5)
     ax.tick_params(axis='y', colors=_TEXT, labelsize=8, length=0)
     ax.tick_params(axis='x', colors=_TEXT, length=0)
     ax.yaxis.set_label_position('right')
@@ -184,18 +273,45 @@ def generate_alert_chart(symbol, interval='30', signal=None):
     fig.text(0.01, 0.977, f'{coin}/USDT', color='#E5E7EB',
              fontsize=11, fontweight='bold', va='top')
     fig.text(0.10, 0.977, tf_lbl, color='#60a5fa', fontsize=9, va='top')
-    fig.text(0.145, 0.977, _fmt_p(c[-1]), color='#E5E7EB', fontsize=9, va='top')
+    fig.text(0.145, 0.977, _fmt_p(last_price), color='#E5E7EB', fontsize=9, va='top')
     fig.text(0.99, 0.977, datetime.utcnow().strftime('%H:%M UTC'),
              color=_TEXT, fontsize=8, va='top', ha='right')
 
-    plt.tight_layout(rect=[0, 0, 1, 0.965])
+    fig.tight_layout(rect=[0, 0, 1, 0.965])
+    # Single Agg render -> RGB buffer -> PNG at zlib level 1: no bbox_inches='tight'
+    # measuring pass and a fraction of libpng's default level-6 compression time.
+    fig.canvas.draw()
+    rgb = np.asarray(fig.canvas.buffer_rgba())[..., :3]
     buf = io.BytesIO()
-    plt.savefig(buf, format='png', dpi=100, facecolor=_BG, bbox_inches='tight')
-    buf.seek(0)
-    plt.close(fig)
+    Image.fromarray(rgb).save(buf, format='PNG', compress_level=1)
     return buf.getvalue()
 
 
+# Rendering is CPU-bound Python holding the GIL: charts requested by the scanner
+# threads are fanned out to worker processes (own GIL, own cached Figure).
+# 'spawn' so the workers don't fork a copy of the app's WS/scanner threads.
+_CHART_POOL = None
+_CHART_POOL_LOCK = threading.Lock()
+
+
+def _init_chart_worker():
+    from matplotlib import font_manager
+    font_manager.findfont('DejaVu Sans')
+
+
+def submit_chart(symbol, interval='30', signal=None):
+    """Render generate_alert_chart() in the chart process pool -> Future[bytes | None]."""
+    global _CHART_POOL
+    with _CHART_POOL_LOCK:
+        if _CHART_POOL is None:
+            _CHART_POOL = ProcessPoolExecutor(
+                max_workers=min(4, os.cpu_count() or 1),
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_chart_worker,
+            )
+        return _CHART_POOL.submit(generate_alert_chart, symbol, interval, signal)
+
+
 def generate_chart_for_coin(symbol, ema_period=60):
     """Backward-compatible wrapper."""
     return generate_alert_chart(symbol, interval='30')
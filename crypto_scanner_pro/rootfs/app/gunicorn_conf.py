@@ -0,0 +1,36 @@
+"""
+Gunicorn config - sostituisce il server di sviluppo Werkzeug.
+
+UN solo worker: scanner, WebSocket Bybit, pool WS privati, stream SSE e cache
+vivono in memoria nel processo, quindi più worker duplicherebbero i feed e
+servirebbero stato divergente. La concorrenza HTTP arriva dai thread (gthread):
+le route bloccanti su Bybit/Telegram rilasciano il GIL durante l'I/O.
+"""
+bind = '0.0.0.0:8080'
+workers = 1
+worker_class = 'gthread'
+# Ogni stream SSE (/api/trade/stream) occupa un thread finché resta aperto: i
+# thread sono ben più degli stream ammessi (app.SSE_MAX_STREAMS), così tab
+# dimenticate o EventSource in riconnessione non lasciano senza thread le API
+# e l'health check.
+threads = 48
+keepalive = 30
+# Le connessioni SSE (/api/trade/stream) restano aperte a lungo: il timeout
+# gthread riguarda l'heartbeat del worker, non la singola richiesta.
+timeout = 120
+# Il worker segnala il proprio heartbeat aggiornando un file temporaneo: su tmpfs
+# invece che sul layer overlay del container, così un disco lento (SD del Raspberry
+# di Home Assistant) non può far scadere il timeout e riavviare il worker.
+worker_tmp_dir = '/dev/shm'
+accesslog = None
+errorlog = '-'
+
+
+def post_worker_init(worker):
+    from app import start_background_services
+    start_background_services()
+
+
+def worker_exit(server, worker):
+    from app import stop_background_services
+    stop_background_services()
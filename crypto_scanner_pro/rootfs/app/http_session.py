@@ -0,0 +1,37 @@
+"""Shared keep-alive HTTP session for Bybit/Telegram REST calls."""
+import orjson
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# One pooled Session per process: every scanner thread reuses the kept-alive
+# TLS connections to api.bybit.com instead of paying a handshake per call.
+# Retry only covers idempotent methods (GET) — a Telegram POST is never resent.
+# Exhausted retries hand back the last 429/5xx response (raise_on_status=False)
+# so callers still see `not r.ok` / retCode instead of a RetryError, and a
+# server Retry-After is ignored in favour of the short backoff: one 429 must
+# not park a request or scanner thread for however long the server asks.
+# Compression needs no setup: requests already sends Accept-Encoding gzip/deflate
+# (plus br when a brotli package is importable) and urllib3 inflates transparently,
+# so the ~100 KB tickers JSON crosses the wire gzipped.
+SESSION = requests.Session()
+SESSION.mount('https://', HTTPAdapter(
+    pool_connections=16,
+    pool_maxsize=32,
+    max_retries=Retry(total=3, backoff_factor=0.2,
+                      status_forcelist=[429, 500, 502, 503, 504],
+                      raise_on_status=False,
+                      respect_retry_after_header=False),
+))
+
+
+def get_json(url, params=None, timeout=10):
+    """
+    GET `url` on SESSION and decode the body with orjson. A non-2xx or non-JSON
+    reply (e.g. an HTML error page during a Bybit incident) returns {} without
+    being parsed, so callers' `retCode != 0` check fails fast on it.
+    """
+    r = SESSION.get(url, params=params, timeout=timeout)
+    if not r.ok or 'json' not in r.headers.get('Content-Type', ''):
+        return {}
+    return orjson.loads(r.content)
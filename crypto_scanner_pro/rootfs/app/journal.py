@@ -24,7 +24,7 @@ import time
 from collections import defaultdict
 from urllib.parse import quote
 
-import requests as rq
+from http_session import SESSION
 
 _BYB = 'https://api.bybit.com'
 JOURNAL_FILE = '/data/journal_trades.json'
@@ -81,8 +81,8 @@ def _fetch_window(bsign_fn, api_key, api_secret, start_ms, end_ms, store, max_pa
         if cursor:
             qs += f'&cursor={quote(cursor)}'
         try:
-            d = rq.get(f'{_BYB}/v5/position/closed-pnl?{qs}',
-                        headers=bsign_fn(api_key, api_secret, qs), timeout=8).json()
+            d = SESSION.get(f'{_BYB}/v5/position/closed-pnl?{qs}',
+                             headers=bsign_fn(api_key, api_secret, qs), timeout=8).json()
         except Exception:
             return
         if d.get('retCode') != 0:
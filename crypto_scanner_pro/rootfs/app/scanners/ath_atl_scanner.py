@@ -1,20 +1,194 @@
 """ATH/ATL Scanner — All-Time High/Low Monitor"""
+import atexit
+import heapq
+import queue
 import threading
-import requests
-from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import numpy as np
 import sys
 import os
-import json
+import orjson
 import time
+from operator import itemgetter
 
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+from http_session import get_json
+
 ATH_COOLDOWN_FILE = '/data/ath_cooldown.json'
 ATL_COOLDOWN_FILE = '/data/atl_cooldown.json'
 
 # Refresh ATH/ATL cache every 6 hours
 ATH_CACHE_TTL = 6 * 3600
 
+# Max wait for the WS ticker feed before falling back to the REST tickers list
+WS_READY_TIMEOUT = 15
+
+# Alert charts rendered in parallel by send_alert (each may be a Chromium screenshot)
+CHART_WORKERS = 3
+
+# Symbols (top by 24h volume) whose ATH/ATL is pre-computed
+PRECOMPUTE_TOP_N = 40
+
+# Concurrent historical kline requests per batch (Bybit public limit is generous)
+FETCH_WORKERS = 8
+
+# Long-lived fetch workers shared by batch refreshes and on-demand lookups.
+# Kept below the shared session's pool size (32), every worker keeps its kept-alive
+# TLS connection to api.bybit.com between scans instead of a fresh pool
+# (and fresh connections) per batch.
+_FETCH_POOL = ThreadPoolExecutor(max_workers=FETCH_WORKERS,
+                                 thread_name_prefix='athatl-fetch')
+
+# Real-time alerts are pipelined: the alert worker hands the Telegram upload of
+# one alert to this single thread (keeps post order) and goes on rendering the
+# next queued chart instead of waiting for Telegram's reply.
+_POST_POOL = ThreadPoolExecutor(max_workers=1, thread_name_prefix='athatl-post')
+
+# Bybit signals its IP rate limit in the body (HTTP 200, retCode 10006), which the
+# shared session's HTTP-status Retry never sees: back off and retry those here.
+RATE_LIMIT_RETCODE = 10006
+FETCH_RETRIES      = 3
+
+KLINE_URL          = 'https://api.bybit.com/v5/market/kline'
+_KLINE_PARAMS      = {'category': 'linear', 'interval': 'W'}
+
+# Cooldown maps are process-wide: loaded once and shared by every ATHATLScanner
+# instance (a config save rebuilds the scanner). mark_alerted only touches memory;
+# the files are rewritten at most every COOLDOWN_SAVE_INTERVAL s, after each
+# polling scan and at exit — not once per alert.
+COOLDOWN_SAVE_INTERVAL = 60
+_cooldowns       = {}     # filepath -> {symbol: epoch seconds}
+_cooldown_dirty  = set()  # filepaths with unsaved changes
+_cooldown_state  = {'saved_at': 0.0}
+_cooldown_lock   = threading.Lock()
+# Held across snapshot + write by _flush_cooldowns: the scan thread and the atexit
+# flush never interleave on the shared '.tmp' file, and an older snapshot cannot
+# land after a newer one. Disk I/O stays outside _cooldown_lock (mark_alerted).
+_cooldown_save_lock = threading.Lock()
+
+# Parent dirs of the cooldown files already created in this process: makedirs()
+# runs on the first flush only, survives scanner rebuilds on config save
+_DIRS_MADE = set()
+
+
+def _utc_day_start(now):
+    """Epoch seconds of the UTC midnight that opened the day containing `now`."""
+    return now - now % 86400
+
+
+def _load_cooldown(filepath):
+    """{symbol: epoch seconds} from filepath; entries older than yesterday are dropped
+    (cooldown is per UTC day), so the file never grows past a day of alerts.
+    ISO-datetime values written by older versions are still accepted."""
+    try:
+        if os.path.exists(filepath):
+            with open(filepath, 'rb') as f:
+                raw = {k: v if isinstance(v, (int, float)) else datetime.fromisoformat(v).timestamp()
+                       for k, v in orjson.loads(f.read()).items()}
+            keep_from = _utc_day_start(time.time()) - 86400
+            return {k: v for k, v in raw.items() if v >= keep_from}
+    except Exception as e:
+        print(f'⚠️ Error loading cooldown {filepath}: {e}')
+    return {}
+
+
+def _save_cooldown(filepath, alerts_dict):
+    try:
+        d = os.path.dirname(filepath)
+        if d not in _DIRS_MADE:
+            os.makedirs(d, exist_ok=True)
+            _DIRS_MADE.add(d)
+        # Write-then-rename: a crash mid-write leaves the previous file, not a
+        # truncated one that _load_cooldown would drop (re-alerting the whole day)
+        tmp = filepath + '.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(orjson.dumps(alerts_dict))
+        os.replace(tmp, filepath)
+    except Exception as e:
+        print(f'⚠️ Error saving cooldown {filepath}: {e}')
+
+
+def _cooldown_map(filepath):
+    with _cooldown_lock:
+        if filepath not in _cooldowns:
+            _cooldowns[filepath] = _load_cooldown(filepath)
+        return _cooldowns[filepath]
+
+
+def _flush_cooldowns(force=False):
+    with _cooldown_save_lock:
+        with _cooldown_lock:
+            if not _cooldown_dirty:
+                return
+            if not force and time.time() - _cooldown_state['saved_at'] < COOLDOWN_SAVE_INTERVAL:
+                return
+            snapshots = {fp: dict(_cooldowns[fp]) for fp in _cooldown_dirty}
+            _cooldown_dirty.clear()
+            _cooldown_state['saved_at'] = time.time()
+        for fp, d in snapshots.items():
+            _save_cooldown(fp, d)
+
+
+atexit.register(_flush_cooldowns, True)
+
+
+
+def _ath_atl(klines):
+    """(max high, min low) of a float64 kline array [start, open, high, low, close, ...]."""
+    return klines[:, 2].max().item(), klines[:, 3].min().item()
+
+
+def _filter_rank(symbols, price, chg, vol, min_vol, min_chg):
+    """
+    Pairs passing the volume / 24h-change filters, sorted by 24h change desc.
+    One boolean mask and one stable argsort over float64 columns replace the
+    per-ticker compare/append loop and the key-function sort. The result stays
+    columnar — (symbols, prices, changes) lists — with no per-pair dict.
+    """
+    price = np.asarray(price, dtype=np.float64)
+    chg   = np.asarray(chg, dtype=np.float64)
+    vol   = np.asarray(vol, dtype=np.float64)
+    mask  = (price > 0) & (vol >= min_vol)
+    if min_chg:
+        mask &= chg >= min_chg
+    idx = np.flatnonzero(mask)
+    idx = idx[np.argsort(-chg[idx], kind='stable')]
+    return [symbols[i] for i in idx.tolist()], price[idx].tolist(), chg[idx].tolist()
+
+
+def _entry_from_klines(klines):
+    """
+    Cache entry from a full weekly history (Bybit order: newest candle first).
+    Closed weeks are immutable, so their extremes are kept apart from the open
+    candle: a later refresh only needs the latest candles to stay exact.
+    """
+    cur, closed = klines[0], klines[1:]
+    hist_ath = closed[:, 2].max().item() if len(closed) else float('-inf')
+    hist_atl = closed[:, 3].min().item() if len(closed) else float('inf')
+    return {'ath': max(hist_ath, cur[2].item()), 'atl': min(hist_atl, cur[3].item()),
+            'hist_ath': hist_ath, 'hist_atl': hist_atl,
+            'week_start': cur[0].item(), 'computed_at': time.time()}
+
+
+def _extend_entry(prev, tail):
+    """
+    Roll a cache entry forward with the newest candles (`tail`, newest first).
+    If a new week opened, the candle tracked as current has closed and is folded
+    into the history. Returns None when more than one week was missed.
+    """
+    cur = tail[0]
+    hist_ath, hist_atl = prev['hist_ath'], prev['hist_atl']
+    if cur[0].item() != prev['week_start']:
+        if len(tail) < 2 or tail[1][0].item() != prev['week_start']:
+            return None
+        hist_ath = max(hist_ath, tail[1][2].item())
+        hist_atl = min(hist_atl, tail[1][3].item())
+    return {'ath': max(hist_ath, cur[2].item()), 'atl': min(hist_atl, cur[3].item()),
+            'hist_ath': hist_ath, 'hist_atl': hist_atl,
+            'week_start': cur[0].item(), 'computed_at': time.time()}
+
 
 class ATHATLScanner:
     def __init__(self, telegram_config, enabled=True,
@@ -41,8 +215,8 @@ class ATHATLScanner:
         self.cooldown_hours     = cooldown_hours
         self._live_config       = live_config
 
-        self.last_ath_alerts = self._load_cooldown(ATH_COOLDOWN_FILE)
-        self.last_atl_alerts = self._load_cooldown(ATL_COOLDOWN_FILE)
+        self.last_ath_alerts = _cooldown_map(ATH_COOLDOWN_FILE)
+        self.last_atl_alerts = _cooldown_map(ATL_COOLDOWN_FILE)
         self._lock           = threading.Lock()
 
         # ATH/ATL pre-computed cache: {symbol: {ath, atl, computed_at}}
@@ -50,7 +224,13 @@ class ATHATLScanner:
         self._ath_cache_lock = threading.Lock()
         self._pending_fetch  = set()
         self._pending_lock   = threading.Lock()
-        self._fetch_sem      = threading.Semaphore(5)  # max 5 concurrent REST fetches
+
+        # Chart render + Telegram upload run on a worker thread: the WS callback
+        # and the polling scan only enqueue. maxsize bounds the backlog if Telegram stalls.
+        # close() ends both background threads when a config save replaces the instance.
+        self._alert_queue = queue.Queue(maxsize=200)
+        self._closed      = threading.Event()
+        threading.Thread(target=self._alert_worker, daemon=True).start()
 
         self._ws_manager = ws_manager
         if ws_manager is not None:
@@ -61,94 +241,73 @@ class ATHATLScanner:
 
     # ── cooldown ─────────────────────────────────────────────────────────────
 
-    def _load_cooldown(self, filepath):
-        try:
-            if os.path.exists(filepath):
-                with open(filepath, 'r') as f:
-                    return {k: datetime.fromisoformat(v) for k, v in json.load(f).items()}
-        except Exception as e:
-            print(f'⚠️ Error loading cooldown {filepath}: {e}')
-        return {}
-
-    def _save_cooldown(self, filepath, alerts_dict):
-        try:
-            os.makedirs(os.path.dirname(filepath), exist_ok=True)
-            with open(filepath, 'w') as f:
-                json.dump({k: v.isoformat() for k, v in alerts_dict.items()}, f)
-        except Exception as e:
-            print(f'⚠️ Error saving cooldown {filepath}: {e}')
-
-    def is_in_cooldown(self, symbol, alert_type='ath'):
+    def is_in_cooldown(self, symbol, alert_type='ath', now=None):
+        """One alert per symbol and type per UTC day. Pass `now` to reuse one clock read per scan."""
         d = self.last_ath_alerts if alert_type == 'ath' else self.last_atl_alerts
-        if symbol not in d:
-            return False
-        from datetime import timezone
-        return d[symbol].date() == datetime.now(timezone.utc).date()
-
-    def mark_alerted(self, symbol, alert_type='ath'):
-        if alert_type == 'ath':
-            self.last_ath_alerts[symbol] = datetime.now()
-            self._save_cooldown(ATH_COOLDOWN_FILE, self.last_ath_alerts)
-        else:
-            self.last_atl_alerts[symbol] = datetime.now()
-            self._save_cooldown(ATL_COOLDOWN_FILE, self.last_atl_alerts)
+        if now is None:
+            now = time.time()
+        return d.get(symbol, 0.0) >= _utc_day_start(now)
+
+    def mark_alerted(self, symbol, alert_type='ath', now=None):
+        if now is None:
+            now = time.time()
+        with _cooldown_lock:
+            if alert_type == 'ath':
+                self.last_ath_alerts[symbol] = now
+                _cooldown_dirty.add(ATH_COOLDOWN_FILE)
+            else:
+                self.last_atl_alerts[symbol] = now
+                _cooldown_dirty.add(ATL_COOLDOWN_FILE)
+        _flush_cooldowns()
+
+    # ── tickers ───────────────────────────────────────────────────────────────
+
+    def _ws_tickers(self, timeout=WS_READY_TIMEOUT):
+        """Snapshot of the WS ticker cache, or None if the WS feed is unavailable.
+        Right after startup the precompute thread and the first polling scan run
+        before the feed is ready: wait briefly instead of downloading the full
+        REST tickers list for data the stream is about to deliver."""
+        if self._ws_manager is None or not self._ws_manager.ready.wait(timeout):
+            return None
+        return self._ws_manager.get_all_tickers()
 
     # ── ATH/ATL cache pre-computation ────────────────────────────────────────
 
     def _precompute_loop(self):
         """Pre-compute ATH/ATL for top coins; refresh every ATH_CACHE_TTL seconds."""
-        while True:
+        while not self._closed.is_set():
             try:
                 self._precompute_ath_atl()
             except Exception as e:
                 print(f'⚠️ ATH precompute error: {e}')
-            time.sleep(ATH_CACHE_TTL)
+            self._closed.wait(ATH_CACHE_TTL)
 
     def _precompute_ath_atl(self):
-        """Fetch top 40 coins by volume and compute their ATH/ATL from REST."""
+        """Fetch top PRECOMPUTE_TOP_N coins by volume and compute their ATH/ATL from REST."""
         # Wait for WS to have some data, or use REST directly
         symbols = []
-        if self._ws_manager and self._ws_manager.ready.is_set():
-            raw = self._ws_manager.get_all_tickers()
-            ranked = sorted(raw.items(), key=lambda x: x[1].get('volume_24h', 0), reverse=True)
-            symbols = [s for s, d in ranked if d.get('volume_24h', 0) >= self.min_volume_24h][:40]
+        raw = self._ws_tickers()
+        if raw:
+            # Partial top-K (O(N log K)) instead of sorting every ticker
+            pairs = [(s, d.get('volume_24h', 0)) for s, d in raw.items()
+                     if d.get('volume_24h', 0) >= self.min_volume_24h]
+            symbols = [s for s, _ in heapq.nlargest(PRECOMPUTE_TOP_N, pairs, key=itemgetter(1))]
         if not symbols:
             # Fallback: fetch from REST
             try:
-                r = requests.get('https://api.bybit.com/v5/market/tickers',
-                                 params={'category': 'linear'}, timeout=10)
-                data = r.json()
-                if data.get('retCode') == 0:
-                    pairs = []
-                    for item in data['result']['list']:
-                        if not item['symbol'].endswith('USDT'):
-                            continue
-                        price = float(item.get('lastPrice', 0) or 0)
-                        vol   = float(item.get('volume24h', 0) or 0) * price
-                        if vol >= self.min_volume_24h:
-                            pairs.append((item['symbol'], vol))
-                    pairs.sort(key=lambda x: x[1], reverse=True)
-                    symbols = [s for s, _ in pairs[:40]]
+                from tickers_cache import get_usdt_tickers
+                pairs = []
+                for item in get_usdt_tickers():
+                    price = float(item.get('lastPrice', 0) or 0)
+                    vol   = float(item.get('volume24h', 0) or 0) * price
+                    if vol >= self.min_volume_24h:
+                        pairs.append((item['symbol'], vol))
+                symbols = [s for s, _ in heapq.nlargest(PRECOMPUTE_TOP_N, pairs, key=itemgetter(1))]
             except Exception as e:
                 print(f'⚠️ ATH precompute: REST fallback error: {e}')
 
-        computed = 0
-        for sym in symbols:
-            try:
-                klines = self.fetch_historical_data(sym, self.lookback_days)
-                if not klines:
-                    continue
-                highs = [float(k[2]) for k in klines]
-                lows  = [float(k[3]) for k in klines]
-                with self._ath_cache_lock:
-                    self._ath_cache[sym] = {
-                        'ath': max(highs), 'atl': min(lows),
-                        'computed_at': time.time()
-                    }
-                computed += 1
-            except Exception:
-                pass
-        print(f'🏆 ATH/ATL cache refreshed: {computed}/{len(symbols)} symbols')
+        computed = self._refresh_many(symbols)
+        print(f'🏆 ATH/ATL cache refreshed: {len(computed)}/{len(symbols)} symbols')
 
     # ── real-time callback ────────────────────────────────────────────────────
 
@@ -169,8 +328,13 @@ class ATHATLScanner:
 
         with self._ath_cache_lock:
             aa = self._ath_cache.get(symbol)
-        if not aa:
-            return  # Not pre-computed yet
+            if not aa:
+                return  # Not pre-computed yet
+            # Roll the extremes forward with the live price (O(1)): a breakout is
+            # reflected at once, without waiting for the next REST refresh
+            if price > aa['ath'] or price < aa['atl']:
+                self._ath_cache[symbol] = {**aa, 'ath': max(aa['ath'], price),
+                                           'atl': min(aa['atl'], price)}
 
         ath_dist = (aa['ath'] - price) / aa['ath'] * 100
         atl_dist = (price - aa['atl']) / aa['atl'] * 100
@@ -181,34 +345,65 @@ class ATHATLScanner:
                 coin = {'symbol': symbol, 'price': price,
                         'ath': aa['ath'], 'distance_pct': ath_dist,
                         'is_new_ath': price >= aa['ath'], 'change_pct': data.get('change_24h', 0)}
-                threading.Thread(target=self._send_single_alert,
-                                 args=(coin, 'ath'), daemon=True).start()
+                self._queue_alert('tick', (coin, 'ath'))
 
             if self.atl_enabled and 0 <= atl_dist <= self.proximity_threshold and not self.is_in_cooldown(symbol, 'atl'):
                 self.mark_alerted(symbol, 'atl')
                 coin = {'symbol': symbol, 'price': price,
                         'atl': aa['atl'], 'distance_pct': atl_dist,
                         'is_new_atl': price <= aa['atl'], 'change_pct': data.get('change_24h', 0)}
-                threading.Thread(target=self._send_single_alert,
-                                 args=(coin, 'atl'), daemon=True).start()
+                self._queue_alert('tick', (coin, 'atl'))
+
+    # ── alert worker ─────────────────────────────────────────────────────────
+
+    def _queue_alert(self, kind, payload):
+        if self._closed.is_set():
+            return
+        try:
+            self._alert_queue.put_nowait((kind, payload))
+        except queue.Full:
+            print(f'⚠️ ATH/ATL alert queue full: dropped {kind} alert')
+
+    def close(self):
+        """Stop the background threads of a replaced instance. Alerts already queued
+        are still sent; if the queue is full (Telegram stalled) the backlog is dropped."""
+        self._closed.set()
+        try:
+            self._alert_queue.put_nowait(None)
+        except queue.Full:
+            while True:
+                try:
+                    self._alert_queue.get_nowait()
+                    self._alert_queue.task_done()
+                except queue.Empty:
+                    break
+            print('⚠️ ATH/ATL closed with a full alert queue: backlog dropped')
+            self._alert_queue.put_nowait(None)
+
+    def _alert_worker(self):
+        while True:
+            item = self._alert_queue.get()
+            if item is None:  # close() sentinel
+                self._alert_queue.task_done()
+                return
+            kind, payload = item
+            try:
+                if kind == 'scan':
+                    self.send_alert(payload)
+                else:
+                    self._send_single_alert(*payload)
+            except Exception as e:
+                print(f'❌ ATH/ATL alert worker: {e}')
+            finally:
+                self._alert_queue.task_done()
 
     def _build_caption(self, sym, label, dist_pct, change_pct, volume=0):
-        from alert_utils import fmt_vol
-        base   = (self.base_url or 'https://cryptoscannerpro.com').rstrip('/')
-        lines  = [
-            f'🔔 {label} {dist_pct:.2f}%',
-            '',
-            '------------------------------------------------',
+        from alert_utils import fmt_vol, alert_caption
+        return alert_caption(f'🔔 {label} {dist_pct:.2f}%', (
             f'- Coin: {sym}',
             f'- Var: {change_pct:+.2f}%',
             f'- Volume: {fmt_vol(volume)}',
-            '------------------------------------------------',
-            '',
-            f'<a href="https://www.bybit.com/trade/usdt/{sym}">- View Bybit</a>',
-            f'<a href="{base}/mtf?symbol={sym}">- View Desktop</a>',
-            f'<a href="{base}/trade?symbol={sym}">- View Mobile</a>',
-        ]
-        return '\n'.join(lines)
+        ), sym, self.base_url)
 
     def _send_single_alert(self, coin, alert_type):
         try:
@@ -233,12 +428,19 @@ class ATHATLScanner:
             'ath': aa.get('ath', 0),
             'atl': aa.get('atl', 0),
         })
-        if img:
-            send_photo(self.telegram_token, self.telegram_chat_id, img, caption)
-        else:
-            send_text(self.telegram_token, self.telegram_chat_id, caption)
-        log_alert(sym, label, emoji=emoji, note=f'{dist:.2f}%', screenshot=img)
-        print(f'ATH/ATL alert: {sym} ({alert_type})')
+
+        def _post():
+            try:
+                if img:
+                    send_photo(self.telegram_token, self.telegram_chat_id, img, caption)
+                else:
+                    send_text(self.telegram_token, self.telegram_chat_id, caption)
+                log_alert(sym, label, emoji=emoji, note=f'{dist:.2f}%', screenshot=img)
+                print(f'ATH/ATL alert: {sym} ({alert_type})')
+            except Exception as e:
+                print(f'❌ ATH/ATL alert post {sym}: {e}')
+
+        _POST_POOL.submit(_post)
 
     # ── public cache accessor ─────────────────────────────────────────────────
 
@@ -250,51 +452,73 @@ class ATHATLScanner:
         with self._pending_lock:
             if symbol not in self._pending_fetch:
                 self._pending_fetch.add(symbol)
-                threading.Thread(target=self._fetch_and_cache_symbol,
-                                 args=(symbol,), daemon=True).start()
+                _FETCH_POOL.submit(self._fetch_and_cache_symbol, symbol)
         return None
 
     def _fetch_and_cache_symbol(self, symbol):
-        with self._fetch_sem:
-            try:
-                klines = self.fetch_historical_data(symbol, self.lookback_days)
-                if klines:
-                    highs = [float(k[2]) for k in klines]
-                    lows  = [float(k[3]) for k in klines]
-                    with self._ath_cache_lock:
-                        self._ath_cache[symbol] = {
-                            'ath': max(highs), 'atl': min(lows),
-                            'computed_at': time.time()
-                        }
-            except Exception as e:
-                print(f'⚠️ ATH/ATL fetch {symbol}: {e}')
-            finally:
-                with self._pending_lock:
-                    self._pending_fetch.discard(symbol)
+        try:
+            self._refresh_symbol(symbol)
+        except Exception as e:
+            print(f'⚠️ ATH/ATL fetch {symbol}: {e}')
+        finally:
+            with self._pending_lock:
+                self._pending_fetch.discard(symbol)
 
     # ── historical data helpers ───────────────────────────────────────────────
 
-    def fetch_historical_data(self, symbol, days=365):
+    def fetch_historical_data(self, symbol, days=365, limit=1000):
         try:
-            r = requests.get('https://api.bybit.com/v5/market/kline',
-                             params={'category': 'linear', 'symbol': symbol,
-                                     'interval': 'W', 'limit': 1000},
-                             timeout=10)
-            data = r.json()
-            if data['retCode'] != 0:
+            params = {**_KLINE_PARAMS, 'symbol': symbol, 'limit': limit}
+            for attempt in range(FETCH_RETRIES):
+                data = get_json(KLINE_URL, params=params, timeout=10)
+                if data.get('retCode') != RATE_LIMIT_RETCODE:
+                    break
+                if attempt < FETCH_RETRIES - 1:  # no dead wait after the last try
+                    time.sleep(0.5 * 2 ** attempt)
+            if data.get('retCode') != 0:
                 return None
             klines = data['result']['list']
-            return klines if len(klines) >= 1 else None
+            if not klines:
+                return None
+            # Strings parsed once, in C, into a (n, 7) float64 array
+            return np.array(klines, dtype=np.float64)
         except Exception as e:
             print(f'❌ fetch_historical_data {symbol}: {e}')
             return None
 
+    def _refresh_symbol(self, symbol):
+        """
+        Recompute and cache the ATH/ATL entry of `symbol`; returns it (None on failure).
+        A symbol already in the cache only downloads its last 2 weekly candles — the
+        full history is fetched once per symbol, or again after a missed week.
+        """
+        with self._ath_cache_lock:
+            prev = self._ath_cache.get(symbol)
+        entry = None
+        if prev and 'week_start' in prev:
+            tail = self.fetch_historical_data(symbol, limit=2)
+            if tail is not None:
+                entry = _extend_entry(prev, tail)
+        if entry is None:
+            klines = self.fetch_historical_data(symbol, self.lookback_days)
+            if klines is None:
+                return None
+            entry = _entry_from_klines(klines)
+        with self._ath_cache_lock:
+            self._ath_cache[symbol] = entry
+        return entry
+
+    def _refresh_many(self, symbols):
+        """Refresh many symbols concurrently → {symbol: entry}.
+        I/O-bound: the requests release the GIL, so wall time is ~one RTT per batch."""
+        if not symbols:
+            return {}
+        results = _FETCH_POOL.map(self._refresh_symbol, symbols)
+        return {s: e for s, e in zip(symbols, results) if e is not None}
+
     def calculate_ath_atl(self, klines, current_price):
         try:
-            highs = [float(k[2]) for k in klines]
-            lows  = [float(k[3]) for k in klines]
-            ath   = max(highs)
-            atl   = min(lows)
+            ath, atl = _ath_atl(klines)
             return {
                 'ath': ath, 'atl': atl,
                 'ath_distance_pct': (ath - current_price) / ath * 100,
@@ -312,90 +536,84 @@ class ATHATLScanner:
 
         print(f'🏆 ATH/ATL Scanner — polling scan ({self.proximity_threshold}% threshold)...')
         try:
-            if self._ws_manager and self._ws_manager.ready.is_set():
-                raw = self._ws_manager.get_all_tickers()
-                all_pairs = [
-                    {'symbol': s, 'price': d['price'],
-                     'change_pct': d.get('change_24h', 0),
-                     'volume_24h_usd': d.get('volume_24h', 0)}
-                    for s, d in raw.items()
-                    if d.get('price', 0) > 0 and d.get('volume_24h', 0) >= self.min_volume_24h
-                    and (not self.min_var_pct_24h or d.get('change_24h', 0) >= self.min_var_pct_24h)
-                ]
+            raw = self._ws_tickers()
+            if raw:
+                symbols = list(raw)
+                vals    = list(raw.values())
+                n       = len(vals)
+                price   = np.fromiter((d.get('price', 0) for d in vals), np.float64, n)
+                chg     = np.fromiter((d.get('change_24h', 0) for d in vals), np.float64, n)
+                vol     = np.fromiter((d.get('volume_24h', 0) for d in vals), np.float64, n)
             else:
-                url = 'https://api.bybit.com/v5/market/tickers?category=linear'
-                response = requests.get(url, timeout=10)
-                data = response.json()
-                if data['retCode'] != 0:
-                    return {}
-                all_pairs = []
-                for item in data['result']['list']:
-                    if not item['symbol'].endswith('USDT'):
-                        continue
-                    last_price = float(item['lastPrice'])
-                    change_pct = float(item.get('price24hPcnt', 0)) * 100
-                    vol_usd    = float(item.get('volume24h', 0)) * last_price
-                    if vol_usd < self.min_volume_24h:
-                        continue
-                    if self.min_var_pct_24h and change_pct < self.min_var_pct_24h:
-                        continue
-                    all_pairs.append({'symbol': item['symbol'], 'price': last_price,
-                                      'change_pct': change_pct, 'volume_24h_usd': vol_usd})
-
-            all_pairs.sort(key=lambda x: x['change_pct'], reverse=True)
-            pairs_to_analyze = all_pairs
+                from tickers_cache import get_usdt_tickers, ticker_columns
+                items   = get_usdt_tickers()
+                symbols = [it['symbol'] for it in items]
+                price, chg, vol = ticker_columns(items, 'lastPrice', 'price24hPcnt', 'volume24h')
+                chg *= 100
+                vol *= price
+
+            syms, prices, changes = _filter_rank(symbols, price, chg, vol,
+                                                 self.min_volume_24h, self.min_var_pct_24h)
+
+            # Fetch every symbol missing/stale in the cache up front, in parallel
+            now = time.time()
+            with self._ath_cache_lock:
+                stale = [s for s in syms
+                         if s not in self._ath_cache
+                         or now - self._ath_cache[s]['computed_at'] >= ATH_CACHE_TTL]
+            fetched = self._refresh_many(stale)
+
+            # Loop invariants bound once: settings, the UTC day start for the inlined
+            # cooldown test, and one snapshot of the ATH cache instead of a lock per symbol
+            thr      = self.proximity_threshold
+            max_n    = self.max_coins_per_alert
+            ath_on   = self.ath_enabled
+            atl_on   = self.atl_enabled
+            midnight = _utc_day_start(now)
+            last_ath = self.last_ath_alerts
+            last_atl = self.last_atl_alerts
+            with self._ath_cache_lock:
+                cache = dict(self._ath_cache)
 
             ath_coins, atl_coins = [], []
-            for pair in pairs_to_analyze:
-                symbol = pair['symbol']
-                price  = pair['price']
+            for symbol, price, change in zip(syms, prices, changes):
 
                 # Use pre-computed cache if available and fresh
-                with self._ath_cache_lock:
-                    cached = self._ath_cache.get(symbol)
-                if cached and (time.time() - cached['computed_at']) < ATH_CACHE_TTL:
-                    aa_data = {'ath': cached['ath'], 'atl': cached['atl'],
-                               'ath_distance_pct': (cached['ath'] - price) / cached['ath'] * 100,
-                               'atl_distance_pct': (price - cached['atl']) / cached['atl'] * 100}
-                else:
-                    klines = self.fetch_historical_data(symbol, self.lookback_days)
-                    if not klines:
+                cached = cache.get(symbol)
+                if not (cached and now - cached['computed_at'] < ATH_CACHE_TTL):
+                    cached = fetched.get(symbol)
+                    if cached is None:
                         continue
-                    aa_data = self.calculate_ath_atl(klines, price)
-                    if aa_data:
-                        with self._ath_cache_lock:
-                            self._ath_cache[symbol] = {
-                                'ath': aa_data['ath'], 'atl': aa_data['atl'],
-                                'computed_at': time.time()}
-
-                if not aa_data:
-                    continue
+                ath, atl = cached['ath'], cached['atl']
+                ath_dist = (ath - price) / ath * 100
+                atl_dist = (price - atl) / atl * 100
 
                 with self._lock:
-                    if self.ath_enabled and aa_data['ath_distance_pct'] <= self.proximity_threshold \
-                            and not self.is_in_cooldown(symbol, 'ath'):
-                        self.mark_alerted(symbol, 'ath')
-                        ath_coins.append({'symbol': symbol, 'price': price,
-                                          'ath': aa_data['ath'],
-                                          'distance_pct': aa_data['ath_distance_pct'],
-                                          'is_new_ath': price >= aa_data['ath'],
-                                          'change_pct': pair['change_pct']})
-
-                    if self.atl_enabled and 0 <= aa_data['atl_distance_pct'] <= self.proximity_threshold \
-                            and not self.is_in_cooldown(symbol, 'atl'):
-                        self.mark_alerted(symbol, 'atl')
-                        atl_coins.append({'symbol': symbol, 'price': price,
-                                          'atl': aa_data['atl'],
-                                          'distance_pct': aa_data['atl_distance_pct'],
-                                          'is_new_atl': price <= aa_data['atl'],
-                                          'change_pct': pair['change_pct']})
-
-            ath_coins = ath_coins[:self.max_coins_per_alert]
-            atl_coins = atl_coins[:self.max_coins_per_alert]
-            result    = {'ath': ath_coins, 'atl': atl_coins}
-
+                    # not is_in_cooldown(): no alert of this type today
+                    # Every hit is marked; a payload dict only while under the alert cap
+                    if ath_on and ath_dist <= thr and last_ath.get(symbol, 0.0) < midnight:
+                        self.mark_alerted(symbol, 'ath', now)
+                        if len(ath_coins) < max_n:
+                            ath_coins.append({'symbol': symbol, 'price': price,
+                                              'ath': ath,
+                                              'distance_pct': ath_dist,
+                                              'is_new_ath': price >= ath,
+                                              'change_pct': change})
+
+                    if atl_on and 0 <= atl_dist <= thr and last_atl.get(symbol, 0.0) < midnight:
+                        self.mark_alerted(symbol, 'atl', now)
+                        if len(atl_coins) < max_n:
+                            atl_coins.append({'symbol': symbol, 'price': price,
+                                              'atl': atl,
+                                              'distance_pct': atl_dist,
+                                              'is_new_atl': price <= atl,
+                                              'change_pct': change})
+
+            result = {'ath': ath_coins, 'atl': atl_coins}
+
+            _flush_cooldowns(force=True)
             if ath_coins or atl_coins:
-                self.send_alert(result)
+                self._queue_alert('scan', result)
 
             return result
 
@@ -407,48 +625,52 @@ class ATHATLScanner:
         if not self.telegram_token or not self.telegram_chat_id:
             return
         try:
-            from alert_utils import send_photo, send_text, get_chart, log_alert
+            from alert_utils import send_photos, send_text, get_chart, log_alert
         except ImportError:
             return
 
-        for coin in result.get('ath', [])[:3]:
-            sym     = coin['symbol']
-            dist    = coin.get('distance_pct', 0.0)
-            change  = coin.get('change_pct', 0.0)
-            caption = self._build_caption(sym, 'ATH', dist, change)
-            with self._ath_cache_lock:
-                aa = self._ath_cache.get(sym, {})
-            img = get_chart(sym, interval=self.screenshot_tf, signal={
-                'type': 'ath', 'ath': aa.get('ath', 0), 'atl': aa.get('atl', 0),
-            })
-            if img:
-                send_photo(self.telegram_token, self.telegram_chat_id, img, caption)
-            else:
+        # All charts are submitted up front and rendered concurrently (the matplotlib
+        # fallback already runs in chart_generator's process pool); capped so at
+        # most CHART_WORKERS headless Chromium screenshots run at once.
+        jobs = []
+        with ThreadPoolExecutor(max_workers=CHART_WORKERS) as ex:
+            for key, label, emoji in (('ath', 'ATH', '🏆'), ('atl', 'ATL', '⬇️')):
+                for coin in result.get(key, [])[:3]:
+                    sym     = coin['symbol']
+                    dist    = coin.get('distance_pct', 0.0)
+                    change  = coin.get('change_pct', 0.0)
+                    caption = self._build_caption(sym, label, dist, change)
+                    with self._ath_cache_lock:
+                        aa = self._ath_cache.get(sym, {})
+                    fut = ex.submit(get_chart, sym, interval=self.screenshot_tf, signal={
+                        'type': key, 'ath': aa.get('ath', 0), 'atl': aa.get('atl', 0),
+                    })
+                    jobs.append((sym, label, emoji, dist, caption, fut))
+        items = [(sym, label, emoji, dist, caption, fut.result())
+                 for sym, label, emoji, dist, caption, fut in jobs]
+
+        # Charts go out as one album (a single POST); text-only fallbacks separately.
+        # The album is queued on _POST_POOL so its upload overlaps the fallbacks and
+        # the daily-log writes below. The alert worker (this runs off the scan thread)
+        # waits for it before taking the next queued alert, so uploads stay in order.
+        album = _POST_POOL.submit(
+            send_photos, self.telegram_token, self.telegram_chat_id,
+            [(img, caption) for _, _, _, _, caption, img in items if img])
+        for _, _, _, _, caption, img in items:
+            if not img:
                 send_text(self.telegram_token, self.telegram_chat_id, caption)
-            log_alert(sym, 'ATH', emoji='🏆', note=f'{dist:.2f}%', screenshot=img)
 
-        for coin in result.get('atl', [])[:3]:
-            sym     = coin['symbol']
-            dist    = coin.get('distance_pct', 0.0)
-            change  = coin.get('change_pct', 0.0)
-            caption = self._build_caption(sym, 'ATL', dist, change)
-            with self._ath_cache_lock:
-                aa = self._ath_cache.get(sym, {})
-            img = get_chart(sym, interval=self.screenshot_tf, signal={
-                'type': 'atl', 'ath': aa.get('ath', 0), 'atl': aa.get('atl', 0),
-            })
-            if img:
-                send_photo(self.telegram_token, self.telegram_chat_id, img, caption)
-            else:
-                send_text(self.telegram_token, self.telegram_chat_id, caption)
-            log_alert(sym, 'ATL', emoji='⬇️', note=f'{dist:.2f}%', screenshot=img)
+        for sym, label, emoji, dist, _, img in items:
+            log_alert(sym, label, emoji=emoji, note=f'{dist:.2f}%', screenshot=img)
+        album.result()
 
     # ── status ────────────────────────────────────────────────────────────────
 
     def get_today_alerts(self):
-        today = datetime.utcnow().date()
-        ath = [s for s, dt in self.last_ath_alerts.items() if dt.date() == today]
-        atl = [s for s, dt in self.last_atl_alerts.items() if dt.date() == today]
+        midnight = _utc_day_start(time.time())
+        with _cooldown_lock:
+            ath = [s for s, ts in self.last_ath_alerts.items() if ts >= midnight]
+            atl = [s for s, ts in self.last_atl_alerts.items() if ts >= midnight]
         return list(set(ath + atl))
 
     def get_monitored_count(self):
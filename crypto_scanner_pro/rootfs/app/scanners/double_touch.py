@@ -1,22 +1,55 @@
 """Double Touch / Terzo Tocco Scanner — real-time via kline WebSocket"""
+import heapq
 import threading
-import requests
 import time
-import json
+import orjson
+import numpy as np
 import os
+import operator
 import queue
 import sys
 import logging
-from datetime import datetime, timedelta, timezone
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
 
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+from http_session import get_json
+
 logger = logging.getLogger(__name__)
 
 COOLDOWN_FILE      = '/data/double_touch_cooldown.json'
 MAX_COINS          = 1000
 TOP_KLINE_SYMBOLS  = 500
 KLINE_SUB_REFRESH  = 3600
+COOLDOWN_SAVE_INTERVAL = 60
+MIN_KLINES         = 10     # closed bars needed before a series is scanned
+
+# Parsed cooldown file, keyed by path → ((st_mtime_ns, st_size), {key: epoch}).
+# A scanner rebuilt on config save reuses it instead of re-reading /data; any
+# external change to the file bumps its mtime or size and forces a fresh parse.
+_COOLDOWN_CACHE = {}
+
+# Directories already created: the data dir is made on the first save of the
+# process, not re-checked with a makedirs() stat on every write
+_DIRS_MADE = set()
+
+# Serializes cooldown file writes: flushes happen outside the instance lock, from
+# the alert worker and the scan thread, and share one tmp file
+_SAVE_LOCK = threading.Lock()
+
+# Polling scan: klines for BATCH_SYMBOLS symbols (every TF) are requested together,
+# FETCH_WORKERS at a time, with a short pause between batches for Bybit's rate limit
+BATCH_SYMBOLS      = 10
+FETCH_WORKERS      = 8
+# Charts of one alert batch rendered together, then posted as a single Telegram album
+ALERT_WORKERS      = 3
+
+
+def _stat_key(path):
+    """(st_mtime_ns, st_size) fingerprint of path; raises FileNotFoundError if absent."""
+    st = os.stat(path)
+    return st.st_mtime_ns, st.st_size
 
 
 class DoubleTouchScanner:
@@ -53,6 +86,8 @@ class DoubleTouchScanner:
         self.last_alerts      = self._load_cooldown()
         self._lock            = threading.Lock()
         self._last_save       = 0.0
+        self._cooldown_dirty  = False
+        self._closed          = False
         self._last_scan_count = 0
         self._ws_manager      = ws_manager
 
@@ -63,8 +98,9 @@ class DoubleTouchScanner:
             self._log_table[_x] = self._log_table[_x >> 1] + 1
 
         # maxsize=1000 prevents unbounded backlog if Telegram is slow
-        self._alert_queue = queue.Queue(maxsize=1000)
-        threading.Thread(target=self._alert_worker, daemon=True).start()
+        self._alert_queue  = queue.Queue(maxsize=1000)
+        self._alert_thread = threading.Thread(target=self._alert_worker, daemon=True)
+        self._alert_thread.start()
 
         if ws_manager is not None:
             ws_manager.add_kline_callback(self._on_kline)
@@ -76,55 +112,116 @@ class DoubleTouchScanner:
 
     # ── alert worker ──────────────────────────────────────────────────────────
 
+    def close(self, timeout=10):
+        """Stop the alert worker of an instance being replaced and write its pending
+        marks, so it can never flush stale last_alerts over the new instance's file.
+        Called before the replacement is built (and loads the cooldown file)."""
+        with self._lock:
+            self._closed = True
+        try:
+            self._alert_queue.put_nowait(None)
+        except queue.Full:
+            logger.warning('⚠️ Terzo Tocco: closed with a full alert queue, backlog dropped')
+            while True:
+                try:
+                    self._alert_queue.get_nowait()
+                except queue.Empty:
+                    break
+            self._alert_queue.put_nowait(None)
+        self._alert_thread.join(timeout)
+        self._flush_cooldown(force=True, closing=True)
+
     def _alert_worker(self):
         while True:
-            patterns = self._alert_queue.get()
+            try:
+                patterns = self._alert_queue.get(timeout=COOLDOWN_SAVE_INTERVAL)
+            except queue.Empty:
+                self._flush_cooldown()  # idle: persist marks left over from the last burst
+                continue
+            if patterns is None:  # close() sentinel
+                return
             try:
                 self.send_alert(patterns)
             except Exception as e:
                 logger.warning('⚠️ Terzo Tocco: alert error: %s', e)
+            self._flush_cooldown()
 
     # ── cooldown ──────────────────────────────────────────────────────────────
 
     def _load_cooldown(self):
         try:
-            if os.path.exists(COOLDOWN_FILE):
-                with open(COOLDOWN_FILE, 'r') as f:
-                    result = {}
-                    for k, v in json.load(f).items():
+            # One stat() both tests for the file and fingerprints it
+            stamp  = _stat_key(COOLDOWN_FILE)
+            cached = _COOLDOWN_CACHE.get(COOLDOWN_FILE)
+            if cached and cached[0] == stamp:
+                return dict(cached[1])
+            with open(COOLDOWN_FILE, 'rb') as f:
+                result = {}
+                for k, v in orjson.loads(f.read()).items():
+                    if isinstance(v, str):  # ISO datetime from older versions
                         dt = datetime.fromisoformat(v)
                         if dt.tzinfo is None:
                             dt = dt.replace(tzinfo=timezone.utc)
-                        result[k] = dt
-                    return result
+                        v = dt.timestamp()
+                    result[k] = v
+            _COOLDOWN_CACHE[COOLDOWN_FILE] = (stamp, dict(result))
+            return result
+        except FileNotFoundError:
+            pass
         except Exception as e:
             logger.warning('⚠️ Terzo Tocco: load cooldown: %s', e)
         return {}
 
-    def _save_cooldown(self):
-        # Must be called with self._lock held. Atomic write via tmp → replace.
+    @staticmethod
+    def _save_cooldown(alerts):
+        # Writes a snapshot, called WITHOUT self._lock. Atomic write via tmp → replace.
         try:
-            os.makedirs(os.path.dirname(COOLDOWN_FILE), exist_ok=True)
-            tmp = COOLDOWN_FILE + '.tmp'
-            with open(tmp, 'w') as f:
-                json.dump({k: v.astimezone(timezone.utc).isoformat()
-                           for k, v in self.last_alerts.items()}, f)
-            os.replace(tmp, COOLDOWN_FILE)
+            d = os.path.dirname(COOLDOWN_FILE)
+            if d not in _DIRS_MADE:
+                os.makedirs(d, exist_ok=True)
+                _DIRS_MADE.add(d)
+            payload = orjson.dumps(alerts)
+            with _SAVE_LOCK:
+                tmp = COOLDOWN_FILE + '.tmp'
+                with open(tmp, 'wb') as f:
+                    f.write(payload)
+                os.replace(tmp, COOLDOWN_FILE)
+                _COOLDOWN_CACHE[COOLDOWN_FILE] = (_stat_key(COOLDOWN_FILE), alerts)
         except Exception as e:
             logger.warning('⚠️ Terzo Tocco: save cooldown: %s', e)
 
-    def is_in_cooldown(self, key):
-        if key not in self.last_alerts:
-            return False
-        return (datetime.now(timezone.utc) - self.last_alerts[key]) < timedelta(hours=self.cooldown_hours)
-
-    def mark_alerted(self, key):
-        # Must be called with self._lock held
-        self.last_alerts[key] = datetime.now(timezone.utc)
-        now = time.time()
-        if now - self._last_save > 60:
-            self._last_save = now
-            self._save_cooldown()
+    def is_in_cooldown(self, key, now=None):
+        # last_alerts holds epoch seconds: plain float math, no datetime objects per check
+        if now is None:
+            now = time.time()
+        return now - self.last_alerts.get(key, 0.0) < self.cooldown_hours * 3600
+
+    def mark_alerted(self, key, now=None):
+        # Must be called with self._lock held. Memory only: _flush_cooldown persists.
+        if now is None:
+            now = time.time()
+        self.last_alerts[key] = now
+        self._cooldown_dirty = True
+
+    def _flush_cooldown(self, force=False, closing=False):
+        """One file write for every mark since the last flush, at most every
+        COOLDOWN_SAVE_INTERVAL s unless forced (end of a polling scan).
+        The marks are snapshotted under the lock and written outside it, so the
+        WS kline path never waits on disk. A closed instance no longer writes."""
+        with self._lock:
+            if not self._cooldown_dirty or (self._closed and not closing):
+                return
+            now = time.time()
+            if not force and now - self._last_save < COOLDOWN_SAVE_INTERVAL:
+                return
+            self._cooldown_dirty = False
+            self._last_save      = now
+            # Expired marks can never block an alert again: dropping them keeps the
+            # file, and every later load (incl. legacy ISO parsing), bounded
+            cutoff = now - self.cooldown_hours * 3600
+            self.last_alerts = {k: v for k, v in self.last_alerts.items() if v > cutoff}
+            snapshot = dict(self.last_alerts)
+        self._save_cooldown(snapshot)
 
     # ── schedule ──────────────────────────────────────────────────────────────
 
@@ -155,10 +252,11 @@ class DoubleTouchScanner:
         tickers = self._ws_manager.get_all_tickers()
         if not tickers:
             return
-        ranked = sorted(tickers.items(), key=lambda x: x[1].get('volume_24h', 0), reverse=True)
-        top = [s for s, d in ranked
-               if d.get('volume_24h', 0) >= self.min_volume_24h
-               and (not self.min_var_pct_24h or d.get('change_24h', 0) >= self.min_var_pct_24h)][:TOP_KLINE_SYMBOLS]
+        # Filter first, then partial top-K (O(N log K)) instead of sorting every ticker
+        pairs = [(s, d.get('volume_24h', 0)) for s, d in tickers.items()
+                 if d.get('volume_24h', 0) >= self.min_volume_24h
+                 and (not self.min_var_pct_24h or d.get('change_24h', 0) >= self.min_var_pct_24h)]
+        top   = [s for s, _ in heapq.nlargest(TOP_KLINE_SYMBOLS, pairs, key=operator.itemgetter(1))]
         self._ws_manager.subscribe_klines(top, intervals=self.scan_tfs)
         self._last_scan_count = len(top)
         logger.info('🔁 Terzo Tocco: subscribed klines %d symbols × %d TF', len(top), len(self.scan_tfs))
@@ -174,7 +272,7 @@ class DoubleTouchScanner:
             return
 
         klines = self._ws_manager.get_klines(symbol, interval)
-        if len(klines) < 10:
+        if len(klines) < MIN_KLINES:
             return
 
         ticker = self._ws_manager.get_all_tickers().get(symbol, {})
@@ -186,12 +284,13 @@ class DoubleTouchScanner:
         current_price = ticker.get('price') or candle['close']
         patterns = self._find_double_touches(klines, current_price)
 
+        now = time.time()
         for p in patterns:
             cooldown_key = f"{symbol}_{interval}"
             coin = None
             with self._lock:
-                if not self.is_in_cooldown(cooldown_key):
-                    self.mark_alerted(cooldown_key)
+                if not self.is_in_cooldown(cooldown_key, now):
+                    self.mark_alerted(cooldown_key, now)
                     coin = {
                         'symbol': symbol, 'tf': interval,
                         'price': current_price,
@@ -209,44 +308,39 @@ class DoubleTouchScanner:
 
     def _fetch_tickers(self):
         try:
-            r = requests.get('https://api.bybit.com/v5/market/tickers',
-                             params={'category': 'linear'}, timeout=10)
-            data = r.json()
-            if data.get('retCode') != 0:
-                return []
-            result = []
-            for item in data['result']['list']:
-                if not item['symbol'].endswith('USDT'):
-                    continue
-                price = float(item.get('lastPrice', 0) or 0)
-                vol   = float(item.get('turnover24h', 0) or 0)
-                change_pct = float(item.get('price24hPcnt', 0) or 0) * 100
-                if price <= 0 or vol < self.min_volume_24h:
-                    continue
-                if self.min_var_pct_24h and change_pct < self.min_var_pct_24h:
-                    continue
-                result.append({'symbol': item['symbol'], 'price': price, 'volume': vol,
-                               'change_pct': change_pct})
-            result.sort(key=lambda x: x['volume'], reverse=True)
-            return result[:MAX_COINS]
+            from tickers_cache import get_usdt_tickers, ticker_columns
+            items = get_usdt_tickers()
+            price, vol, chg = ticker_columns(items, 'lastPrice', 'turnover24h', 'price24hPcnt')
+            chg *= 100
+            mask = (price > 0) & (vol >= self.min_volume_24h)
+            if self.min_var_pct_24h:
+                mask &= chg >= self.min_var_pct_24h
+            idx = np.flatnonzero(mask)
+            idx = idx[np.argsort(-vol[idx], kind='stable')][:MAX_COINS]
+            return [{'symbol': items[i]['symbol'], 'price': p, 'volume': v, 'change_pct': c}
+                    for i, p, v, c in zip(idx.tolist(), price[idx].tolist(),
+                                          vol[idx].tolist(), chg[idx].tolist())]
         except Exception as e:
             logger.error('❌ Terzo Tocco: fetch tickers: %s', e)
             return []
 
     def _fetch_klines(self, symbol, tf):
         try:
-            r = requests.get('https://api.bybit.com/v5/market/kline',
-                             params={'category': 'linear', 'symbol': symbol,
-                                     'interval': tf, 'limit': 100},
-                             timeout=10)
-            data = r.json()
+            data = get_json('https://api.bybit.com/v5/market/kline',
+                            params={'category': 'linear', 'symbol': symbol,
+                                    'interval': tf, 'limit': 100},
+                            timeout=10)
             if data.get('retCode') != 0:
                 return []
-            raw = list(reversed(data['result']['list']))[:-1]
+            rows = data['result']['list']
+            # Newest first, rows[0] still open: too short a history is dropped
+            # before any bar is parsed, the rest sliced oldest-first minus rows[0]
+            if len(rows) <= MIN_KLINES:
+                return []
             return [{'time':  int(c[0]) // 1000,
                      'open':  float(c[1]), 'high': float(c[2]),
                      'low':   float(c[3]), 'close': float(c[4])}
-                    for c in raw]
+                    for c in rows[:0:-1]]
         except Exception:
             return []
 
@@ -300,6 +394,18 @@ class DoubleTouchScanner:
         LOG      = self._log_table               # pre-computed in __init__, never rebuilt
         patterns = []
 
+        # The side is fixed for the whole call: resolve every res/support branch
+        # once. beyond(x, lvl) = x at or past lvl on the breakout side, past(...)
+        # the strict version; band scales the level to the bounce threshold.
+        beyond     = operator.ge if res else operator.le
+        past       = operator.gt if res else operator.lt
+        band       = (1 - tol_frac) if res else (1 + tol_frac)
+        strict     = self.strict_mode
+        min_gap    = self.min_gap
+        max_gap    = self.max_gap
+        proximity  = self.proximity
+        prev_close = closes[-2]
+
         def rmq(l, r):                           # range max (res) or min (!res) inclusive
             if l > r: return sentinel
             k = LOG[r - l + 1]
@@ -316,57 +422,48 @@ class DoubleTouchScanner:
             eJ = extreme[j]
             cJ = closes[j]
             # strict_mode: touch bar must show rejection (close not at the extreme)
-            if self.strict_mode:
-                if res     and cJ >= eJ: continue
-                if not res and cJ <= eJ: continue
+            if strict and beyond(cJ, eJ):
+                continue
 
             j1 = j + 1
 
             for i in range(5, j - 2):
                 eI = extreme[i]
                 cI = closes[i]
-                if self.strict_mode:
-                    if res     and cI >= eI: continue
-                    if not res and cI <= eI: continue
+                if strict and beyond(cI, eI):
+                    continue
 
-                ref  = max(eI, eJ) if res else min(eI, eJ)
-                diff = abs(eI - eJ) / ref
+                diff = abs(eI - eJ) / op(eI, eJ)
                 if diff > tol_frac:
                     continue
 
                 level = (eI + eJ) / 2
-                lower = level * (1 - tol_frac)
-                upper = level * (1 + tol_frac)
-
-                if res     and (cI >= level or cJ >= level): continue
-                if not res and (cI <= level or cJ <= level): continue
+                if beyond(cI, level) or beyond(cJ, level):
+                    continue
 
                 gap = j - i
-                if gap < self.min_gap or gap > self.max_gap:
+                if gap < min_gap or gap > max_gap:
                     continue
 
                 # Proximity filter — cheapest check first
                 dist_pct = (current_price - level) / level * 100
-                if abs(dist_pct) > self.proximity:
+                if abs(dist_pct) > proximity:
                     continue
 
                 # Price must be approaching the level, not receding from it
-                prev_close = closes[-2]
                 if abs(current_price - level) > abs(prev_close - level):
                     continue
 
-                if res     and current_price >= level: continue
-                if not res and current_price <= level: continue
+                if beyond(current_price, level):
+                    continue
 
                 # All remaining checks are O(1) ─────────────────────────────
-                if res     and sfx_ext[j1] > level: continue    # [j+1, n)
-                if not res and sfx_ext[j1] < level: continue
-
-                if res     and rmq(i + 1, j - 1) >= level: continue  # (i, j)
-                if not res and rmq(i + 1, j - 1) <= level: continue
-
-                if res     and sfx_cls[j1] > lower: continue    # bounce
-                if not res and sfx_cls[j1] < upper: continue
+                if past(sfx_ext[j1], level):              # [j+1, n)
+                    continue
+                if beyond(rmq(i + 1, j - 1), level):      # (i, j)
+                    continue
+                if past(sfx_cls[j1], level * band):       # bounce
+                    continue
 
                 patterns.append({
                     'type': mode, 'level': level,
@@ -387,29 +484,36 @@ class DoubleTouchScanner:
         logger.info('🔁 Terzo Tocco Scanner — polling scan (tol=%.1f%% prox=%.1f%% tf=%s)...',
                     self.tolerance, self.proximity, ','.join(self.scan_tfs))
         found = []
+        max_n = self.max_coins_per_alert
         try:
             tickers = self._fetch_tickers()
             self._last_scan_count = len(tickers)
-            for i, ticker in enumerate(tickers):
-                symbol = ticker['symbol']
-                for tf in self.scan_tfs:
-                    candles = self._fetch_klines(symbol, tf)
-                    if len(candles) < 10:
-                        continue
-                    patterns = self._find_double_touches(candles, ticker['price'])
-                    for p in patterns:
-                        cooldown_key = f"{symbol}_{tf}"
-                        with self._lock:
-                            if not self.is_in_cooldown(cooldown_key):
-                                self.mark_alerted(cooldown_key)
-                                found.append({'symbol': symbol, 'tf': tf,
-                                              'price': ticker['price'],
-                                              'volume': ticker['volume'],
-                                              'change_pct': ticker.get('change_pct', 0.0), **p})
-                if (i + 1) % 10 == 0:
+            with ThreadPoolExecutor(max_workers=FETCH_WORKERS) as ex:
+                for b in range(0, len(tickers), BATCH_SYMBOLS):
+                    jobs = [(ticker, tf) for ticker in tickers[b:b + BATCH_SYMBOLS]
+                            for tf in self.scan_tfs]
+                    batch = ex.map(lambda j: self._fetch_klines(j[0]['symbol'], j[1]), jobs)
+                    now = time.time()
+                    for (ticker, tf), candles in zip(jobs, batch):
+                        if len(candles) < MIN_KLINES:
+                            continue
+                        symbol   = ticker['symbol']
+                        patterns = self._find_double_touches(candles, ticker['price'])
+                        for p in patterns:
+                            cooldown_key = f"{symbol}_{tf}"
+                            with self._lock:
+                                if not self.is_in_cooldown(cooldown_key, now):
+                                    self.mark_alerted(cooldown_key, now)
+                                    # Past the alert cap the pattern is only marked:
+                                    # no payload dict that the batch would drop anyway
+                                    if len(found) < max_n:
+                                        found.append({'symbol': symbol, 'tf': tf,
+                                                      'price': ticker['price'],
+                                                      'volume': ticker['volume'],
+                                                      'change_pct': ticker.get('change_pct', 0.0), **p})
                     time.sleep(0.5)
 
-            found = found[:self.max_coins_per_alert]
+            self._flush_cooldown(force=True)
             if found:
                 self.send_alert(found)
             logger.info('🔁 Terzo Tocco: %d pattern found', len(found))
@@ -425,52 +529,58 @@ class DoubleTouchScanner:
         if not self.telegram_token or not self.telegram_chat_id:
             return
         try:
-            from alert_utils import send_photo, send_text, get_chart, log_alert, fmt_vol
+            from alert_utils import send_photos, send_text, get_chart, log_alert, fmt_vol, alert_caption
         except ImportError:
             return
         TF_LABEL = {'D': '1D', '240': '4h', '60': '1h', '30': '30m', '15': '15m', '5': '5m', '1': '1m'}
-        for p in patterns[:3]:
+
+        def _render_one(p):
             sym      = p['symbol']
             tf       = p.get('tf', self.scan_tfs[0])
             tf_label = TF_LABEL.get(tf, tf)
-            segnale  = 'Long' if p['type'] == 'resistance' else 'Short'
             change   = p.get('change_pct', 0.0)
-            lines    = [
-                f'🔔 Terzo Tocco {tf_label}',
-                '',
-                '------------------------------------------------',
+            caption  = alert_caption(f'🔔 Terzo Tocco {tf_label}', (
                 f'- Coin: {sym}',
                 f'- Var: {change:+.2f}%',
                 f'- Volume: {fmt_vol(p.get("volume", 0))}',
-                '------------------------------------------------',
-            ]
-            base = (self.base_url or 'https://cryptoscannerpro.com').rstrip('/')
-            lines.append('')
-            lines.append(f'<a href="https://www.bybit.com/trade/usdt/{sym}">- View Bybit</a>')
-            lines.append(f'<a href="{base}/mtf?symbol={sym}">- View Desktop</a>')
-            lines.append(f'<a href="{base}/trade?symbol={sym}">- View Mobile</a>')
-            caption = '\n'.join(lines)
+            ), sym, self.base_url)
             img = get_chart(sym, interval=tf, signal={
                 'type': 'price',
                 'price': p['level'],
                 'condition': 'above' if p['type'] == 'resistance' else 'below',
                 'time': p.get('touchATime'),
             })
-            if img:
-                send_photo(self.telegram_token, self.telegram_chat_id, img, caption)
-            else:
-                send_text(self.telegram_token, self.telegram_chat_id, caption)
-            log_alert(sym, 'Terzo Tocco', emoji='🔁', note=segnale, tf=tf_label, screenshot=img)
-            logger.info('🔁 Terzo Tocco alert: %s %s (%s)', sym, tf_label, p['type'])
+            return caption, img
+
+        batch = patterns[:3]
+        with ThreadPoolExecutor(max_workers=ALERT_WORKERS) as ex:
+            rendered = list(ex.map(_render_one, batch))
+        # Charts go out as one album (a single POST); text-only fallbacks separately.
+        # The album POST runs on its own thread, overlapped with the fallback texts
+        # and the daily-log writes; the with-block waits for it before returning.
+        with ThreadPoolExecutor(max_workers=1) as post:
+            post.submit(send_photos, self.telegram_token, self.telegram_chat_id,
+                        [(img, caption) for caption, img in rendered if img])
+            for caption, img in rendered:
+                if not img:
+                    send_text(self.telegram_token, self.telegram_chat_id, caption)
+            for p, (_, img) in zip(batch, rendered):
+                sym      = p['symbol']
+                tf       = p.get('tf', self.scan_tfs[0])
+                tf_label = TF_LABEL.get(tf, tf)
+                segnale  = 'Long' if p['type'] == 'resistance' else 'Short'
+                log_alert(sym, 'Terzo Tocco', emoji='🔁', note=segnale, tf=tf_label, screenshot=img)
+                logger.info('🔁 Terzo Tocco alert: %s %s (%s)', sym, tf_label, p['type'])
 
     # ── status ────────────────────────────────────────────────────────────────
 
     def get_today_alerts(self):
-        today = datetime.now(timezone.utc).date()
+        now = time.time()
+        midnight = now - now % 86400  # UTC
         symbols = set()
         with self._lock:
-            for key, dt in self.last_alerts.items():
-                if dt.date() == today:
+            for key, ts in self.last_alerts.items():
+                if ts >= midnight:
                     symbols.add(key.rsplit('_', 1)[0])
         return list(symbols)
 
@@ -3,17 +3,26 @@ Architecture: one EMA per TF per symbol, each TF tracked and alerted independent
 Touch on a TF is a permanent kill signal for THAT TF only (for the rest of the day) —
 it never blocks the other TFs. Any configured TF can fire its own proximity alert.
 """
+import heapq
 import threading
+import logging
 import queue
 import time
-import json
+import orjson
 import os
 import sys
-import requests
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from operator import itemgetter
 from datetime import datetime, timezone
 
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+from http_session import get_json
+
+logger = logging.getLogger(__name__)
+
 STATE_FILE        = '/data/ema_state.json'
 TOP_KLINE_SYMBOLS = 500
 KLINE_SUB_REFRESH = 3600
@@ -22,6 +31,25 @@ MIN_SEED_BARS     = EMA_PERIOD + 5
 
 DEFAULT_SCAN_TFS  = ['240', '60', '30', '5', '1']
 
+# Polling fallback (WS not ready): off unless ema_touch.rest_fallback is set, and
+# then limited to the top REST_FALLBACK_MAX_PAIRS by volume — every pair costs one
+# REST kline call per TF per scan
+FETCH_WORKERS     = 10
+REST_FALLBACK_MAX_PAIRS = 25
+REST_KLINE_LIMIT  = 200
+# Charts of one alert batch rendered together, then posted as a single Telegram album
+ALERT_WORKERS     = 3
+
+# (UTC day start epoch, its ISO date): the date string is rebuilt once per day,
+# not with a datetime.now() + isoformat() on every state lookup
+_TODAY = [0.0, '']
+
+# Empty REST kline reply
+_NO_BARS = np.empty((0, 5), dtype=np.float64)
+
+# STATE_FILE's directory, once created: skips a makedirs() stat per state save
+_DIRS_MADE = set()
+
 
 class EMAScanner:
     def __init__(self, telegram_config, enabled=True, ema_touch_threshold=2.0,
@@ -29,7 +57,7 @@ class EMAScanner:
                  scan_interval_minutes=30, min_volume_24h=10_000_000,
                  min_var_pct_24h=5.0,
                  max_coins_per_alert=10, screenshot_tf='30',
-                 scan_tfs=None,
+                 scan_tfs=None, rest_fallback=False,
                  ws_manager=None, live_config=None, **kwargs):
 
         self.telegram_token      = telegram_config['token']
@@ -42,13 +70,20 @@ class EMAScanner:
         self.min_var_pct_24h     = min_var_pct_24h
         self.max_coins_per_alert = max_coins_per_alert
         self.screenshot_tf       = screenshot_tf
+        self.rest_fallback       = rest_fallback
         self._live_config        = live_config
 
         raw_tfs         = scan_tfs or DEFAULT_SCAN_TFS
         self.scan_tfs   = raw_tfs if isinstance(raw_tfs, list) else [raw_tfs]
 
         self._lock        = threading.Lock()
+        # REST polling fallback: last klines per (symbol, tf) as (n, 5) float64 arrays
+        # [time, open, high, low, close], extended incrementally; pruned to the pairs
+        # of the latest scan so symbols leaving the universe are dropped
+        self._rest_klines      = {}
+        self._rest_klines_lock = threading.Lock()
         self._state       = self._load_state()
+        self._state_dirty = False   # set by a polling scan's deferred touches/alerts
         self._alert_queue = queue.Queue(maxsize=200)
         threading.Thread(target=self._alert_worker, daemon=True).start()
 
@@ -57,43 +92,53 @@ class EMAScanner:
             ws_manager.add_kline_callback(self._on_kline)
             threading.Thread(target=self._init_kline_subs, daemon=True).start()
 
-        print(f'📡 EMA Proximity init — tfs={",".join(self.scan_tfs)} (indipendenti) thr={self.ema_touch_threshold}%')
+        logger.info('📡 EMA Proximity init — tfs=%s (indipendenti) thr=%s%%',
+                    ','.join(self.scan_tfs), self.ema_touch_threshold)
 
     # ── State persistence ─────────────────────────────────────────────────────
 
     def _load_state(self):
         try:
             if os.path.exists(STATE_FILE):
-                with open(STATE_FILE, 'r') as f:
-                    return json.load(f)
+                with open(STATE_FILE, 'rb') as f:
+                    return orjson.loads(f.read())
         except Exception as e:
-            print(f'⚠️ EMA: load state: {e}')
+            logger.warning('⚠️ EMA: load state: %s', e)
         return {}
 
     def _save_state(self):
+        # Serialized under the lock (one orjson pass is the snapshot), written outside it
         with self._lock:
-            snapshot = json.loads(json.dumps(self._state))
+            payload = orjson.dumps(self._state)
         try:
-            os.makedirs(os.path.dirname(STATE_FILE), exist_ok=True)
+            d = os.path.dirname(STATE_FILE)
+            if d not in _DIRS_MADE:
+                os.makedirs(d, exist_ok=True)
+                _DIRS_MADE.add(d)
             tmp = STATE_FILE + '.tmp'
-            with open(tmp, 'w') as f:
-                json.dump(snapshot, f)
+            with open(tmp, 'wb') as f:
+                f.write(payload)
             os.replace(tmp, STATE_FILE)
         except Exception as e:
-            print(f'⚠️ EMA: save state: {e}')
+            logger.warning('⚠️ EMA: save state: %s', e)
 
     # ── Utils ─────────────────────────────────────────────────────────────────
 
     @staticmethod
     def _today_utc():
-        return datetime.now(timezone.utc).date().isoformat()
+        now   = time.time()
+        start = now - now % 86400
+        if start != _TODAY[0]:
+            _TODAY[:] = [start, datetime.fromtimestamp(start, timezone.utc).date().isoformat()]
+        return _TODAY[1]
 
     def _get_state(self, symbol):
         """Return per-symbol state, auto-resetting on new day. Call inside lock.
         Per-symbol fields:
           day  — YYYY-MM-DD reset key
-          tf   — {tf: {ema, touched, alerted, recalc}} fully independent per TF
+          tf   — {tf: {ema, ema_ts, touched, alerted, recalc}} fully independent per TF
                    ema      — float, persisted across days
+                   ema_ts   — open time of the last closed bar folded into ema
                    touched  — bool: permanent kill signal for THIS tf, for today only
                    alerted  — per-approach debounce (resets when price exits zone)
                    recalc   — closed-candle counter for EMA recalibration
@@ -109,6 +154,7 @@ class EMAScanner:
                 'tf': {
                     tf: {
                         'ema':     prev_tf.get(tf, {}).get('ema', legacy_ema.get(tf)),
+                        'ema_ts':  prev_tf.get(tf, {}).get('ema_ts'),
                         'touched': False,
                         'alerted': False,
                         'recalc':  0,
@@ -122,21 +168,41 @@ class EMAScanner:
 
     # ── EMA helpers ───────────────────────────────────────────────────────────
 
+    @staticmethod
+    @lru_cache(maxsize=64)
+    def _ema_weights(m):
+        """
+        (k*(1-k)^(m-1-i) for i < m, (1-k)^m) for an m-bar tail after the seed.
+        Series lengths repeat (the WS cache / REST_KLINE_LIMIT), so each weight
+        vector is built once and reused read-only instead of a power per bar per call.
+        """
+        k = 2.0 / (EMA_PERIOD + 1)
+        w = k * (1 - k) ** np.arange(m - 1, -1, -1)
+        w.flags.writeable = False
+        return w, (1 - k) ** m
+
     @staticmethod
     def _ema_from_closes(closes):
+        """
+        EMA60 of `closes`, seeded with the SMA of the first EMA_PERIOD bars.
+        The recurrence ema = c*k + ema*(1-k) is unrolled into its closed form —
+        the seed decayed by (1-k)^m plus a dot product of the remaining m closes
+        with weights k*(1-k)^(m-1-i) — so it runs as one NumPy pass, no Python loop.
+        """
         if len(closes) < EMA_PERIOD:
             return None
-        k   = 2.0 / (EMA_PERIOD + 1)
-        ema = sum(closes[:EMA_PERIOD]) / EMA_PERIOD
-        for c in closes[EMA_PERIOD:]:
-            ema = c * k + ema * (1 - k)
-        return ema
-
-    def _seed_ema_tf(self, symbol, tf):
-        """Bootstrap EMA60 for one TF from WS kline cache."""
-        if not self._ws_manager:
-            return False
-        klines = self._ws_manager.get_klines(symbol, tf)
+        closes        = np.asarray(closes, dtype=np.float64)
+        tail          = closes[EMA_PERIOD:]
+        weights, keep = EMAScanner._ema_weights(len(tail))
+        seed          = closes[:EMA_PERIOD].mean()
+        return float(seed * keep + weights @ tail)
+
+    def _seed_ema_tf(self, symbol, tf, klines=None):
+        """Bootstrap EMA60 for one TF from `klines` (default: the WS kline cache)."""
+        if klines is None:
+            if not self._ws_manager:
+                return False
+            klines = self._ws_manager.get_klines(symbol, tf)
         closed = klines[:-1]
         if len(closed) < MIN_SEED_BARS:
             return False
@@ -148,11 +214,39 @@ class EMAScanner:
         touched_today = self._touched_today(closed, ema, tolerance)
         with self._lock:
             st = self._get_state(symbol)
-            st['tf'][tf]['ema'] = ema
+            st['tf'][tf]['ema']    = ema
+            st['tf'][tf]['ema_ts'] = closed[-1]['time']
             if touched_today:
                 st['tf'][tf]['touched'] = True
         return True
 
+    @staticmethod
+    def _advance_ema(tst, closed):
+        """
+        Fold the closed bars opened after tst['ema_ts'] into tst['ema'] with the
+        EMA recurrence — a polling scan only pays for the bars that closed since
+        the previous one, not a recompute over the whole series. Call inside lock.
+        Returns False if `closed` no longer reaches back to ema_ts (re-seed instead).
+        """
+        ema_ts = tst.get('ema_ts')
+        if ema_ts is None or not closed or closed[0]['time'] > ema_ts:
+            return False
+        new = len(closed)
+        while new and closed[new - 1]['time'] > ema_ts:
+            new -= 1
+        if new == len(closed):
+            return True
+        k   = 2.0 / (EMA_PERIOD + 1)
+        ema = prev = tst['ema']
+        for c in closed[new:]:
+            prev = ema
+            ema  = c['close'] * k + ema * (1 - k)
+        tst['ema_slope_pct'] = (ema - prev) / prev * 100.0
+        tst['prev_close']    = closed[-1]['close']
+        tst['ema']           = ema
+        tst['ema_ts']        = closed[-1]['time']
+        return True
+
     def _touched_today(self, closed_klines, ema, tolerance):
         """Retroactive check: did any already-closed candle from today cross this EMA
         (within `tolerance`%)? Approximation — uses the current (just-seeded) EMA value
@@ -161,11 +255,14 @@ class EMAScanner:
         restart, or newly promoted into the tracked top-volume list) but already crossed
         the level earlier today.
         """
-        today = self._today_utc()
-        tol   = ema * (tolerance / 100.0)
-        for k in closed_klines:
-            if datetime.fromtimestamp(k['time'], timezone.utc).date().isoformat() != today:
-                continue
+        now      = time.time()
+        midnight = now - now % 86400  # UTC
+        tol      = ema * (tolerance / 100.0)
+        # Oldest-first: walk back from the newest bar and stop at the first one
+        # before midnight, comparing epoch seconds instead of building a date per bar
+        for k in reversed(closed_klines):
+            if k['time'] < midnight:
+                break
             if k['low'] - tol <= ema <= k['high'] + tol:
                 return True
         return False
@@ -178,14 +275,71 @@ class EMAScanner:
                 seeded = True
         return seeded
 
+    def _fetch_klines_rest(self, symbol, tf, start=None):
+        """Klines from REST as an (n, 5) float64 array [time, open, high, low, close],
+        oldest first, last bar still open; (0, 5) on error.
+        `start` (epoch s) restricts the request to bars opened at or after it."""
+        params = {'category': 'linear', 'symbol': symbol,
+                  'interval': tf, 'limit': REST_KLINE_LIMIT}
+        if start is not None:
+            params['start'] = start * 1000
+        try:
+            data = get_json('https://api.bybit.com/v5/market/kline',
+                            params=params, timeout=10)
+            if data.get('retCode') != 0 or not data['result']['list']:
+                return _NO_BARS
+            bars = np.array([k[:5] for k in reversed(data['result']['list'])], dtype=np.float64)
+            bars[:, 0] //= 1000
+            return bars
+        except Exception as e:
+            logger.warning('⚠️ EMA: REST klines %s/%s: %s', symbol, tf, e)
+            return _NO_BARS
+
+    def _get_klines_rest(self, symbol, tf, since=None):
+        """
+        REST klines for the polling scan. Closed bars never change, so once a
+        series is cached only the bars from its last (open) bar onward are
+        requested and spliced in. A reply that does not start at that bar
+        (gap, or more than REST_KLINE_LIMIT new bars) triggers a full refetch.
+        `since` (the EMA's ema_ts) bounds the first fetch of a series whose EMA
+        is already seeded, e.g. restored from STATE_FILE: only the bars needed
+        to catch it up are downloaded, not the full seed window.
+        """
+        key = (symbol, tf)
+        with self._rest_klines_lock:
+            cached = self._rest_klines.get(key)
+        bars = None
+        if cached is not None:
+            last = int(cached[-1, 0])
+            tail = self._fetch_klines_rest(symbol, tf, start=last)
+            if len(tail) and tail[0, 0] == last:
+                bars = np.concatenate((cached[:-1], tail))[-REST_KLINE_LIMIT:]
+        elif since is not None:
+            tail = self._fetch_klines_rest(symbol, tf, start=since)
+            if len(tail) and tail[0, 0] == since:
+                bars = tail
+        if bars is None:
+            bars = self._fetch_klines_rest(symbol, tf)
+        if not len(bars):
+            return []
+        with self._rest_klines_lock:
+            self._rest_klines[key] = bars
+        # Dicts only for this scan's evaluation; the cache keeps the compact array
+        return [{'time': int(t), 'open': o, 'high': h, 'low': l, 'close': c}
+                for t, o, h, l, c in bars.tolist()]
+
     # ── Core logic ────────────────────────────────────────────────────────────
 
-    def _evaluate_candle(self, symbol, tf, candle, is_closed, ticker_data, threshold, tolerance):
+    def _evaluate_candle(self, symbol, tf, candle, is_closed, ticker_data, threshold, tolerance,
+                         persist=True):
         """
         Per-candle logic for one TF. Must be called WITHOUT holding self._lock.
 
         Every TF is fully independent: touch on this TF permanently silences THIS
         TF for the rest of the day, but never affects the other TFs.
+
+        persist=False only flags the state dirty instead of writing it, so a
+        polling scan evaluating many rows saves the state file once at the end.
         """
         fire_coin   = None
         save_needed = False
@@ -208,12 +362,14 @@ class EMAScanner:
                 tst['ema_slope_pct'] = (new_ema - ema) / ema * 100.0
                 tst['prev_close']    = candle['close']
                 tst['ema']    = new_ema
+                tst['ema_ts'] = candle['time']
                 tst['recalc'] += 1
                 if tst['recalc'] % 50 == 0 and self._ws_manager:
                     kl  = self._ws_manager.get_klines(symbol, tf)
                     new = self._ema_from_closes([c['close'] for c in kl[:-1]])
                     if new:
-                        tst['ema'] = new
+                        tst['ema']    = new
+                        tst['ema_ts'] = kl[-2]['time']
 
             ema = tst['ema']
             if not ema or ema <= 0:
@@ -231,13 +387,17 @@ class EMAScanner:
                 return None
 
             # ── PROXIMITY ALERT: independent per tf ───────────────────────────
+            # Zone compared in price units (threshold scaled by the EMA once), so the
+            # per-tick check is a subtraction and a compare; the percentage is only
+            # computed for a candle that actually fires.
             effective_threshold = max(threshold, 0.2)   # min 0.2%
-            distance_pct        = abs(candle['close'] - ema) / ema * 100.0
-            in_zone             = distance_pct <= effective_threshold
+            band                = ema * effective_threshold / 100.0
+            distance            = abs(candle['close'] - ema)
+            in_zone             = distance <= band
             # Hysteresis: re-arm the debounce only once price is clearly away from
             # the zone (2x threshold), not at the first tiny wobble back out of it —
             # avoids alert spam when price chops right on the zone boundary.
-            re_armed            = distance_pct > effective_threshold * 2
+            re_armed            = distance > band * 2
 
             if in_zone:
                 # Anti-spam: skip near-flat / low-conviction candles hugging the EMA
@@ -249,7 +409,7 @@ class EMAScanner:
                 # Directional check: only alert if price actually moved toward the
                 # EMA since the last closed bar (not just sitting/drifting nearby)
                 if prev_close is not None:
-                    moving_toward = abs(candle['close'] - ema) < abs(prev_close - ema)
+                    moving_toward = distance < abs(prev_close - ema)
                     if not moving_toward:
                         return None
 
@@ -270,7 +430,7 @@ class EMAScanner:
                     'tf':           tf,
                     'price':        candle['close'],
                     'ema60':        round(ema, 6),
-                    'distance_pct': round(distance_pct, 4),
+                    'distance_pct': round(distance / ema * 100.0, 4),
                     'approach':     'from_above' if candle['close'] > ema else 'from_below',
                     'volume_24h':   ticker_data.get('volume_24h', 0),
                     'change_pct':   change_pct,
@@ -279,7 +439,10 @@ class EMAScanner:
                 tst['alerted'] = False
 
         if save_needed:
-            self._save_state()
+            if persist:
+                self._save_state()
+            else:
+                self._state_dirty = True
         return fire_coin
 
     # ── Schedule ──────────────────────────────────────────────────────────────
@@ -297,7 +460,7 @@ class EMAScanner:
 
     def _init_kline_subs(self):
         if not self._ws_manager.ready.wait(timeout=120):
-            print('⚠️ EMA: WS not ready after 120s')
+            logger.warning('⚠️ EMA: WS not ready after 120s')
             return
         time.sleep(30)
         self._kline_refresh_loop()
@@ -313,11 +476,13 @@ class EMAScanner:
             time.sleep(30)
             self._refresh_kline_subs()
             return
-        ranked = sorted(tickers.items(), key=lambda x: x[1].get('volume_24h', 0), reverse=True)
-        top    = [s for s, d in ranked if d.get('volume_24h', 0) >= self.min_volume_24h
-                  and (not self.min_var_pct_24h or d.get('change_24h', 0) >= self.min_var_pct_24h)][:TOP_KLINE_SYMBOLS]
+        # Filter first, then partial top-K (O(N log K)) instead of sorting every ticker
+        pairs = [(s, d.get('volume_24h', 0)) for s, d in tickers.items()
+                 if d.get('volume_24h', 0) >= self.min_volume_24h
+                 and (not self.min_var_pct_24h or d.get('change_24h', 0) >= self.min_var_pct_24h)]
+        top   = [s for s, _ in heapq.nlargest(TOP_KLINE_SYMBOLS, pairs, key=itemgetter(1))]
         self._ws_manager.subscribe_klines(top, intervals=self.scan_tfs)
-        print(f'📡 EMA: subscribed {len(top)} symbols × {len(self.scan_tfs)} TF')
+        logger.info('📡 EMA: subscribed %d symbols × %d TF', len(top), len(self.scan_tfs))
 
     # ── WS callback ───────────────────────────────────────────────────────────
 
@@ -349,9 +514,9 @@ class EMAScanner:
                     old     = self._alert_queue.get_nowait()
                     evicted = old[0].get('symbol', '?') if old else '?'
                     self._alert_queue.put_nowait([fire_coin])
-                    print(f'⚠️ EMA queue full: evicted {evicted}, queued {symbol}')
+                    logger.warning('⚠️ EMA queue full: evicted %s, queued %s', evicted, symbol)
                 except Exception:
-                    print(f'⚠️ EMA queue full: dropped {symbol}')
+                    logger.warning('⚠️ EMA queue full: dropped %s', symbol)
 
     # ── Alert worker ──────────────────────────────────────────────────────────
 
@@ -365,16 +530,18 @@ class EMAScanner:
             except queue.Empty:
                 pass
             except Exception as e:
-                print(f'❌ EMA alert worker: {e}')
+                logger.error('❌ EMA alert worker: %s', e)
 
     # ── Polling scan ──────────────────────────────────────────────────────────
 
     def scan(self):
         if not self.enabled:
             return []
-        print(f'📡 EMA Proximity scan (tfs={",".join(self.scan_tfs)} thr={self.ema_touch_threshold}%)...')
+        logger.info('📡 EMA Proximity scan (tfs=%s thr=%s%%)...',
+                    ','.join(self.scan_tfs), self.ema_touch_threshold)
         try:
-            if self._ws_manager and self._ws_manager.ready.is_set():
+            use_ws = bool(self._ws_manager and self._ws_manager.ready.is_set())
+            if use_ws:
                 raw        = self._ws_manager.get_all_tickers()
                 ticker_map = raw
                 all_pairs  = [
@@ -384,58 +551,110 @@ class EMAScanner:
                     if d.get('volume_24h', 0) >= self.min_volume_24h
                     and (not self.min_var_pct_24h or d.get('change_24h', 0.0) >= self.min_var_pct_24h)
                 ]
+            elif not self.rest_fallback:
+                logger.info('⏸ EMA: WS not ready and rest_fallback off, skip')
+                return []
             else:
-                r = requests.get('https://api.bybit.com/v5/market/tickers',
-                                 params={'category': 'linear'}, timeout=10)
-                data = r.json()
-                if data['retCode'] != 0:
-                    return []
+                from tickers_cache import get_usdt_tickers, ticker_columns
+                items = get_usdt_tickers()
+                price, vol, chg = ticker_columns(items, 'lastPrice', 'volume24h', 'price24hPcnt')
+                vol *= price
+                chg *= 100
+                mask = vol >= self.min_volume_24h
+                if self.min_var_pct_24h:
+                    mask &= chg >= self.min_var_pct_24h
+                idx = np.flatnonzero(mask)
                 all_pairs  = []
                 ticker_map = {}
-                for item in data['result']['list']:
-                    if not item['symbol'].endswith('USDT'):
-                        continue
-                    price = float(item.get('lastPrice', 0))
-                    vol   = float(item.get('volume24h', 0)) * price
-                    change_pct = float(item.get('price24hPcnt', 0)) * 100
-                    if vol < self.min_volume_24h:
-                        continue
-                    if self.min_var_pct_24h and change_pct < self.min_var_pct_24h:
-                        continue
-                    td = {'volume_24h': vol, 'change_pct': change_pct}
-                    all_pairs.append({'symbol': item['symbol'], **td})
-                    ticker_map[item['symbol']] = td
+                for i, v, c in zip(idx.tolist(), vol[idx].tolist(), chg[idx].tolist()):
+                    td = {'volume_24h': v, 'change_pct': c}
+                    all_pairs.append({'symbol': items[i]['symbol'], **td})
+                    ticker_map[items[i]['symbol']] = td
+                all_pairs = heapq.nlargest(REST_FALLBACK_MAX_PAIRS, all_pairs,
+                                           key=itemgetter('volume_24h'))
 
             cfg       = (self._live_config or {}).get('ema_touch', {})
             threshold = float(cfg.get('ema_touch_threshold', self.ema_touch_threshold))
             tolerance = float(cfg.get('touch_tolerance', self.touch_tolerance))
             found     = []
 
+            # Without the WS cache every (symbol, TF) needs a REST call: issue them
+            # all up front, concurrently; the evaluation below stays sequential
+            rest_klines = None
+            if not use_ws:
+                jobs = [(p['symbol'], tf) for p in all_pairs for tf in self.scan_tfs]
+                since = []
+                with self._lock:
+                    for s, tf in jobs:
+                        tst = self._get_state(s)['tf'][tf]
+                        since.append(tst.get('ema_ts') if tst['ema'] is not None else None)
+                with ThreadPoolExecutor(max_workers=FETCH_WORKERS) as ex:
+                    rest_klines = dict(zip(jobs, ex.map(
+                        lambda j, t: self._get_klines_rest(*j, since=t), jobs, since)))
+                with self._rest_klines_lock:
+                    self._rest_klines = {k: v for k, v in self._rest_klines.items()
+                                         if k in rest_klines}
+
+            # Every TF is independent: collect ALL (symbol, tf) rows, not just the first hit
+            rows, bars, emas, alerted = [], [], [], []
             for p in all_pairs:
                 sym = p['symbol']
-                # Every TF is independent: evaluate ALL of them, not just the first hit
                 for tf in self.scan_tfs:
-                    with self._lock:
-                        ema = self._get_state(sym)['tf'][tf]['ema']
-                    if ema is None:
-                        if not self._seed_ema_tf(sym, tf):
-                            continue
-                    klines = self._ws_manager.get_klines(sym, tf) if self._ws_manager else []
+                    if rest_klines is not None:
+                        klines = rest_klines[(sym, tf)]
+                    else:
+                        klines = self._ws_manager.get_klines(sym, tf) if self._ws_manager else []
                     if not klines:
                         continue
-                    fc = self._evaluate_candle(sym, tf, klines[-1], False,
-                                               ticker_map.get(sym, p), threshold, tolerance)
+                    with self._lock:
+                        tst = self._get_state(sym)['tf'][tf]
+                        # REST mode has no closed-bar callback: catch the EMA up on
+                        # the bars closed since the last scan
+                        caught_up = (tst['ema'] is not None and
+                                     (rest_klines is None or self._advance_ema(tst, klines[:-1])))
+                    if not caught_up:
+                        if not self._seed_ema_tf(sym, tf, klines):
+                            continue
+                    with self._lock:
+                        tst = self._get_state(sym)['tf'][tf]
+                        if tst['touched'] or not tst['ema'] or tst['ema'] <= 0:
+                            continue  # killed for today / unusable EMA: nothing to evaluate
+                        emas.append(tst['ema'])
+                        alerted.append(tst['alerted'])
+                    c = klines[-1]
+                    bars.append((c['close'], c['low'], c['high']))
+                    rows.append((sym, tf, c, ticker_map.get(sym, p)))
+
+            # One vectorized pass picks the rows where _evaluate_candle can act:
+            # a touch, a bar inside the proximity zone, or a debounce to re-arm.
+            # Everything else is a no-op for an open candle and is skipped.
+            if rows:
+                bars  = np.asarray(bars, dtype=np.float64)
+                ema_a = np.asarray(emas, dtype=np.float64)
+                tol   = ema_a * (tolerance / 100.0)
+                touch = (bars[:, 1] - tol <= ema_a) & (ema_a <= bars[:, 2] + tol)
+                dist  = np.abs(bars[:, 0] - ema_a) / ema_a * 100.0
+                act   = touch | (dist <= max(threshold, 0.2)) | np.asarray(alerted, dtype=bool)
+                last  = None
+                for i in np.flatnonzero(act).tolist():
+                    sym, tf, candle, ticker = rows[i]
+                    if sym != last and len(found) >= self.max_coins_per_alert:
+                        break
+                    last = sym
+                    fc = self._evaluate_candle(sym, tf, candle, False, ticker, threshold, tolerance,
+                                               persist=False)
                     if fc:
                         found.append(fc)
-                if len(found) >= self.max_coins_per_alert:
-                    break
+                if self._state_dirty:
+                    self._state_dirty = False
+                    self._save_state()
 
             if found:
                 self.send_alert(found)
             return found
 
         except Exception as e:
-            print(f'❌ EMA scan: {e}')
+            logger.error('❌ EMA scan: %s', e)
             return []
 
     # ── Status helpers ────────────────────────────────────────────────────────
@@ -457,39 +676,45 @@ class EMAScanner:
         if not self.telegram_token or not self.telegram_chat_id:
             return
         try:
-            from alert_utils import send_photo, send_text, get_chart, log_alert, fmt_vol
+            from alert_utils import send_photos, send_text, get_chart, log_alert, fmt_vol, alert_caption
         except ImportError:
             return
         tf_label = {'D': '1D', '240': '4h', '60': '1h', '30': '30m', '5': '5m', '1': '1m'}
-        for coin in coins[:3]:
+
+        def _render_one(coin):
             sym      = coin['symbol']
             tf       = coin['tf']
             al       = tf_label.get(tf, tf)
             dist     = coin.get('distance_pct', 0.0)
             change   = coin.get('change_pct', 0.0)
             approach = coin.get('approach', '').replace('_', ' ')
-            base     = (self.base_url or 'https://cryptoscannerpro.com').rstrip('/')
-            lines = [
-                f'📡 EMA60 Proximity {al}',
-                '',
-                '------------------------------------------------',
+            caption  = alert_caption(f'📡 EMA60 Proximity {al}', (
                 f'- Coin: {sym}',
                 f'- Var: {change:+.2f}%',
                 f'- Distanza EMA60: {dist:.2f}%',
                 f'- Direzione: {approach}',
                 f'- Volume: {fmt_vol(coin.get("volume_24h", 0))}',
-                '------------------------------------------------',
-                '',
-                f'<a href="https://www.bybit.com/trade/usdt/{sym}">- View Bybit</a>',
-                f'<a href="{base}/mtf?symbol={sym}">- View Desktop</a>',
-                f'<a href="{base}/trade?symbol={sym}">- View Mobile</a>',
-            ]
-            caption = '\n'.join(lines)
+            ), sym, self.base_url)
             img = get_chart(sym, interval=tf, signal={'type': 'ema'})
-            if img:
-                send_photo(self.telegram_token, self.telegram_chat_id, img, caption)
-            else:
-                send_text(self.telegram_token, self.telegram_chat_id, caption)
-            log_alert(sym, 'EMA Proximity', emoji='📡',
-                      note=f'dist={dist:.2f}% tf={al}', tf=al, screenshot=img)
-            print(f'📡 EMA proximity: {sym} {al} dist={dist:.2f}% {approach}')
+            return caption, img
+
+        batch = coins[:3]
+        with ThreadPoolExecutor(max_workers=ALERT_WORKERS) as ex:
+            rendered = list(ex.map(_render_one, batch))
+        # Charts go out as one album (a single POST); text-only fallbacks separately.
+        # The album uploads in the background while the fallbacks are sent and the
+        # daily log (screenshots included) is written; leaving the block joins it.
+        with ThreadPoolExecutor(max_workers=1) as post:
+            post.submit(send_photos, self.telegram_token, self.telegram_chat_id,
+                        [(img, caption) for caption, img in rendered if img])
+            for caption, img in rendered:
+                if not img:
+                    send_text(self.telegram_token, self.telegram_chat_id, caption)
+            for coin, (_, img) in zip(batch, rendered):
+                sym      = coin['symbol']
+                al       = tf_label.get(coin['tf'], coin['tf'])
+                dist     = coin.get('distance_pct', 0.0)
+                approach = coin.get('approach', '').replace('_', ' ')
+                log_alert(sym, 'EMA Proximity', emoji='📡',
+                          note=f'dist={dist:.2f}% tf={al}', tf=al, screenshot=img)
+                logger.info('📡 EMA proximity: %s %s dist=%.2f%% %s', sym, al, dist, approach)
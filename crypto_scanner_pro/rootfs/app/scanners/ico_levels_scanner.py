@@ -6,17 +6,32 @@ Alerts when price approaches the first-candle High or Low within threshold %.
 """
 import threading
 import os
-import json
+import orjson
 import time
 import logging
-import requests
-from datetime import datetime, timedelta
+import sys
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from http_session import get_json
 
 logger = logging.getLogger(__name__)
 
 STATE_FILE    = '/data/ico_levels_state.json'
 REFRESH_SECS  = 3600  # Re-scan listings every hour
 
+# Tick callbacks and the hourly refresh save from different threads (and a
+# scanner rebuilt on config save may overlap the old one): one writer at a time
+_SAVE_LOCK = threading.Lock()
+
+
+def _to_epoch(v):
+    """Alert timestamp as epoch seconds; accepts the naive-UTC ISO strings of older state files."""
+    if isinstance(v, str):
+        return datetime.fromisoformat(v).replace(tzinfo=timezone.utc).timestamp()
+    return v
+
 
 class ICOLevelsScanner:
 
@@ -61,43 +76,61 @@ class ICOLevelsScanner:
     def _load_state(self):
         if os.path.exists(STATE_FILE):
             try:
-                with open(STATE_FILE) as f:
-                    return json.load(f)
+                with open(STATE_FILE, 'rb') as f:
+                    return orjson.loads(f.read())
             except Exception:
                 pass
         return {'discarded': [], 'alerted': {}}
 
     def _save_state(self, state):
+        # tmp + os.replace: a crash mid-write leaves the previous file intact
+        # instead of a truncated one that _load_state silently resets
+        payload = orjson.dumps(state)
         try:
-            with open(STATE_FILE, 'w') as f:
-                json.dump(state, f)
+            with _SAVE_LOCK:
+                tmp = STATE_FILE + '.tmp'
+                with open(tmp, 'wb') as f:
+                    f.write(payload)
+                os.replace(tmp, STATE_FILE)
         except Exception as e:
             logger.warning(f'ICO: save_state error: {e}')
 
     def _load_state_into_memory(self):
         state = self._load_state()
         self._discarded = set(state.get('discarded', []))
-        self._alerted   = state.get('alerted', {})
+        self._alerted   = {k: _to_epoch(v) for k, v in state.get('alerted', {}).items()}
+
+    def _persist_state(self):
+        """Write the in-memory discarded/alerted state. Memory is authoritative once
+        loaded at init (both the WS and the REST scan mark it), so the file is not
+        read back and re-parsed before each write."""
+        now      = time.time()
+        midnight = now - now % 86400  # UTC
+        with self._alerted_lock:
+            # Only today's marks are ever checked: older ones are dropped, not re-saved forever
+            self._alerted = {k: ts for k, ts in self._alerted.items() if ts >= midnight}
+            alerted = dict(self._alerted)
+        self._save_state({'discarded': list(self._discarded), 'alerted': alerted})
 
     # ── Bybit helpers ─────────────────────────────────────────────────────────
 
     def _fetch_new_listings(self):
         cutoff_ms = int((datetime.utcnow() - timedelta(days=self.new_listing_days)).timestamp() * 1000)
         try:
-            resp = requests.get(
+            data = get_json(
                 'https://api.bybit.com/v5/market/instruments-info',
                 params={'category': 'linear', 'status': 'Trading', 'limit': 1000},
                 timeout=15)
-            data = resp.json()
             if data.get('retCode') != 0:
                 return []
             symbols = []
             for item in data['result']['list']:
-                sym = item.get('symbol', '')
-                if not sym.endswith('USDT'):
+                # USDT perpetuals by instrument metadata, not by symbol suffix:
+                # dated USDT futures (BTCUSDT-27JUN25) share the quote coin.
+                if item.get('quoteCoin') != 'USDT' or item.get('contractType') != 'LinearPerpetual':
                     continue
                 if int(item.get('launchTime', 0)) >= cutoff_ms:
-                    symbols.append(sym)
+                    symbols.append(item.get('symbol', ''))
             return symbols
         except Exception as e:
             logger.error(f'ICO: fetch_new_listings: {e}')
@@ -105,18 +138,16 @@ class ICOLevelsScanner:
 
     def _fetch_daily_klines(self, symbol):
         try:
-            resp = requests.get(
+            data = get_json(
                 'https://api.bybit.com/v5/market/kline',
                 params={'category': 'linear', 'symbol': symbol, 'interval': 'D', 'limit': 200},
                 timeout=10)
-            data = resp.json()
             if data.get('retCode') != 0:
                 return []
-            bars = [{'time': int(i[0])//1000, 'open': float(i[1]),
+            # newest-first from Bybit → reversed gives oldest-first without a sort
+            return [{'time': int(i[0])//1000, 'open': float(i[1]),
                      'high': float(i[2]), 'low': float(i[3]), 'close': float(i[4])}
-                    for i in data['result']['list']]
-            bars.sort(key=lambda x: x['time'])
-            return bars
+                    for i in reversed(data['result']['list'])]
         except Exception as e:
             logger.warning(f'ICO: fetch_daily_klines {symbol}: {e}')
             return []
@@ -157,58 +188,60 @@ class ICOLevelsScanner:
             self._levels = new_levels
         self._discarded = new_discarded
 
-        state = self._load_state()
-        state['discarded'] = list(new_discarded)
-        self._save_state(state)
+        self._persist_state()
         logger.info(f'ICO: precomputed {len(new_levels)} active levels, {len(new_discarded)} discarded')
 
     # ── real-time callback ────────────────────────────────────────────────────
 
-    def _on_tick(self, symbol, data):
+    def _on_tick(self, symbol, data, persist=True):
+        """Alert on `symbol` nearing its first-candle High/Low. Returns True if an alert
+        fired; with persist=False the caller owns writing the state (one save per scan)."""
         if not self.enabled:
-            return
+            return False
         from alert_utils import is_in_schedule
         _gen = (self._live_config or {}).get('general', {})
         if not is_in_schedule(_gen.get('schedule_start',''), _gen.get('schedule_end',''), float(_gen.get('utc_offset') or 2)):
-            return
+            return False
         with self._levels_lock:
             levels = self._levels.get(symbol)
         if not levels:
-            return
+            return False
 
         price      = data.get('price', 0)
         change_pct = data.get('change_24h', 0.0)
         volume     = data.get('volume_24h', 0)
         if price <= 0:
-            return
+            return False
         if self.min_var_pct_24h and change_pct < self.min_var_pct_24h:
-            return
+            return False
         first_high = levels['first_high']
         first_low  = levels['first_low']
         dist_high  = (first_high - price) / first_high * 100
         dist_low   = (price - first_low)  / first_low  * 100
-        now        = datetime.utcnow()
+        now        = time.time()
+        midnight   = now - now % 86400  # UTC
+        fired      = False
 
         for side, dist, level in [('high', dist_high, first_high), ('low', dist_low, first_low)]:
             if dist > self.threshold or dist < 0:
                 continue
             key = f'{symbol}_{side}'
             with self._alerted_lock:
-                last_str = self._alerted.get(key)
                 # Un alert al giorno solare (UTC) per coin+lato, non un cooldown a ore: prima
                 # bastava superare cooldown_hours (2h da config generale) perché la stessa coin
                 # notificasse più volte nello stesso giorno restando vicina al livello.
-                if last_str and datetime.fromisoformat(last_str).date() == now.date():
+                if self._alerted.get(key, 0.0) >= midnight:
                     continue
-                self._alerted[key] = now.isoformat()
+                self._alerted[key] = now
 
             # Persist and send asynchronously
-            state = self._load_state()
-            state['alerted'] = dict(self._alerted)
-            self._save_state(state)
+            fired = True
+            if persist:
+                self._persist_state()
             threading.Thread(
                 target=self._send_alert, args=(symbol, side, dist, level, price, change_pct, volume),
                 daemon=True).start()
+        return fired
 
     # ── polling scan (fallback / manual) ─────────────────────────────────────
 
@@ -222,18 +255,21 @@ class ICOLevelsScanner:
             tickers = self._ws_manager.get_all_tickers()
             with self._levels_lock:
                 symbols_to_check = list(self._levels.keys())
+            fired = False
             for sym in symbols_to_check:
                 td = tickers.get(sym)
-                if td:
-                    self._on_tick(sym, td)
+                if td and self._on_tick(sym, td, persist=False):
+                    fired = True
+            # All of this scan's alerts written in one save, not one per coin
+            if fired:
+                self._persist_state()
             return
 
-        # Full REST scan (original logic)
-        state     = self._load_state()
-        discarded = set(state.get('discarded', []))
-        alerted   = state.get('alerted', {})
+        # Full REST scan (original logic). Reads and marks the same in-memory
+        # discarded/alerted state as the WS path, then writes it via _persist_state
         modified  = False
-        now       = datetime.utcnow()
+        now       = time.time()
+        midnight  = now - now % 86400  # UTC
 
         try:
             symbols = self._fetch_new_listings()
@@ -244,7 +280,7 @@ class ICOLevelsScanner:
         logger.info(f'ICO levels: checking {len(symbols)} listing(s)')
 
         for sym in symbols:
-            if sym in discarded:
+            if sym in self._discarded:
                 continue
             try:
                 klines = self._fetch_daily_klines(sym)
@@ -261,7 +297,7 @@ class ICOLevelsScanner:
 
             ever_broke = any(c['high'] > first_high or c['low'] < first_low for c in klines[1:])
             if ever_broke:
-                discarded.add(sym)
+                self._discarded.add(sym)
                 modified = True
                 continue
 
@@ -271,18 +307,16 @@ class ICOLevelsScanner:
             for side, dist, level in [('high', dist_high, first_high), ('low', dist_low, first_low)]:
                 if dist > self.threshold:
                     continue
-                key      = f'{sym}_{side}'
-                last_str = alerted.get(key)
-                if last_str and datetime.fromisoformat(last_str).date() == now.date():
-                    continue
+                key = f'{sym}_{side}'
+                with self._alerted_lock:
+                    if self._alerted.get(key, 0.0) >= midnight:
+                        continue
+                    self._alerted[key] = now
                 self._send_alert(sym, side, dist, level, current_price)
-                alerted[key] = now.isoformat()
                 modified = True
 
         if modified:
-            state['discarded'] = list(discarded)
-            state['alerted']   = alerted
-            self._save_state(state)
+            self._persist_state()
 
     # ── alert ─────────────────────────────────────────────────────────────────
 
@@ -297,22 +331,12 @@ class ICOLevelsScanner:
 
         side_str = 'massimo' if side == 'high' else 'minimo'
         sig_type = 'ath' if side == 'high' else 'atl'
-        base = (self.base_url or 'https://cryptoscannerpro.com').rstrip('/')
-        from alert_utils import fmt_vol
-        lines = [
-            f'🔔 ICO {side_str} {dist:.2f}%',
-            '',
-            '------------------------------------------------',
+        from alert_utils import fmt_vol, alert_caption
+        caption = alert_caption(f'🔔 ICO {side_str} {dist:.2f}%', (
             f'- Coin: {sym}',
             f'- Var: {change_pct:+.2f}%',
             f'- Volume: {fmt_vol(volume)}',
-            '------------------------------------------------',
-            '',
-            f'<a href="https://www.bybit.com/trade/usdt/{sym}">- View Bybit</a>',
-            f'<a href="{base}/mtf?symbol={sym}">- View Desktop</a>',
-            f'<a href="{base}/trade?symbol={sym}">- View Mobile</a>',
-        ]
-        caption = '\n'.join(lines)
+        ), sym, self.base_url)
         img = get_chart(sym, interval=self.screenshot_tf, signal={'type': sig_type})
         if img:
             send_photo(self.telegram_token, self.telegram_chat_id, img, caption)
@@ -324,16 +348,11 @@ class ICOLevelsScanner:
     # ── status ────────────────────────────────────────────────────────────────
 
     def get_today_alerts(self):
-        today = datetime.utcnow().date()
-        symbols = set()
+        now      = time.time()
+        midnight = now - now % 86400  # UTC
         with self._alerted_lock:
-            for key, dt_str in self._alerted.items():
-                try:
-                    if datetime.fromisoformat(dt_str).date() == today:
-                        symbols.add(key.rsplit('_', 1)[0])
-                except Exception:
-                    pass
-        return list(symbols)
+            return list({key.rsplit('_', 1)[0] for key, ts in self._alerted.items()
+                         if ts >= midnight})
 
     def get_monitored_count(self):
         with self._levels_lock:
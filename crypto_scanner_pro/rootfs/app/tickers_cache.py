@@ -0,0 +1,58 @@
+"""Short-TTL in-process cache of the Bybit linear tickers list, shared by the scanners."""
+import threading
+import time
+
+import numpy as np
+
+from http_session import get_json
+
+TICKERS_URL = 'https://api.bybit.com/v5/market/tickers'
+
+_cache = {'data': None, 'usdt': None, 'ts': 0}
+_lock  = threading.Lock()
+
+
+def get_linear_tickers(ttl=30):
+    """
+    Return `result.list` of /v5/market/tickers?category=linear (raw Bybit dicts).
+
+    Fetched and parsed at most once per `ttl` seconds per process: scanners polling
+    in the same cycle share one HTTP round trip. The lock is held across the fetch
+    so concurrent callers on an expired cache wait instead of stampeding Bybit.
+    The returned list is shared — treat it as read-only.
+    Raises on HTTP/API errors.
+    """
+    with _lock:
+        if _cache['data'] is not None and time.monotonic() - _cache['ts'] < ttl:
+            return _cache['data']
+        data = get_json(TICKERS_URL, params={'category': 'linear'}, timeout=10)
+        if data.get('retCode') != 0:
+            raise RuntimeError(f"Bybit tickers retCode={data.get('retCode')}: {data.get('retMsg')}")
+        _cache['data'] = data['result']['list']
+        _cache['usdt'] = None
+        _cache['ts']   = time.monotonic()
+        return _cache['data']
+
+
+def get_usdt_tickers(ttl=30):
+    """
+    Same as get_linear_tickers, restricted to USDT-quoted symbols. The suffix
+    filter runs once per fetched list, not once per caller per scan.
+    """
+    tickers = get_linear_tickers(ttl)
+    with _lock:
+        if _cache['data'] is tickers and _cache['usdt'] is not None:
+            return _cache['usdt']
+        usdt = [it for it in tickers if it['symbol'].endswith('USDT')]
+        if _cache['data'] is tickers:
+            _cache['usdt'] = usdt
+        return usdt
+
+
+def ticker_columns(items, *fields):
+    """
+    One float64 array per field of the raw ticker dicts (missing / '' → 0).
+    Bybit's decimal strings are parsed in C by the array constructor, so filters
+    become vectorized masks instead of per-ticker float() calls and compares.
+    """
+    return [np.array([it.get(f) or 0 for it in items], dtype=np.float64) for f in fields]
@@ -11,11 +11,15 @@ Usage:
     mgr.subscribe_klines(['BTCUSDT'], intervals=['30'])
     mgr.start()
 """
+import heapq
 import json
 import time
 import threading
 import logging
-import requests
+from operator import itemgetter
+
+from http_session import get_json
+from tickers_cache import get_usdt_tickers, ticker_columns
 
 logger = logging.getLogger(__name__)
 
@@ -65,6 +69,14 @@ class BybitWSManager:
         self._tick_callbacks.clear()
         self._kline_callbacks.clear()
 
+    def remove_callbacks(self, owner):
+        """Remove the callbacks bound to `owner` (a scanner being replaced).
+        Lists are rebound, not mutated: a dispatch loop already running keeps its snapshot."""
+        self._tick_callbacks  = [cb for cb in self._tick_callbacks
+                                 if getattr(cb, '__self__', None) is not owner]
+        self._kline_callbacks = [cb for cb in self._kline_callbacks
+                                 if getattr(cb, '__self__', None) is not owner]
+
     def subscribe_klines(self, symbols, intervals=('30',)):
         """Subscribe to kline streams and pre-seed cache from REST."""
         new_topics = []
@@ -122,21 +134,13 @@ class BybitWSManager:
 
     def _fetch_top_symbols(self):
         try:
-            r = requests.get('https://api.bybit.com/v5/market/tickers',
-                             params={'category': 'linear'}, timeout=10)
-            data = r.json()
-            if data.get('retCode') != 0:
-                return []
-            pairs = []
-            for item in data['result']['list']:
-                sym = item.get('symbol', '')
-                if not sym.endswith('USDT'):
-                    continue
-                price = float(item.get('lastPrice', 0) or 0)
-                vol   = float(item.get('volume24h', 0) or 0) * price
-                pairs.append((sym, vol))
-            pairs.sort(key=lambda x: x[1], reverse=True)
-            syms = [s for s, _ in pairs[:TOP_N_TICKERS]]
+            # Shared tickers cache: the decimal strings are parsed column-wise in C by
+            # ticker_columns, not with two float() calls per ticker
+            items = get_usdt_tickers()
+            price, vol = ticker_columns(items, 'lastPrice', 'volume24h')
+            pairs = zip([it['symbol'] for it in items], (vol * price).tolist())
+            # Only the top TOP_N_TICKERS by USD volume are needed: partial selection, no full sort
+            syms = [s for s, _ in heapq.nlargest(TOP_N_TICKERS, pairs, key=itemgetter(1))]
             logger.info(f'WS: subscribing to {len(syms)} ticker streams')
             return syms
         except Exception as e:
@@ -147,12 +151,11 @@ class BybitWSManager:
         """Pre-fill kline cache from REST so EMA can be computed immediately."""
         _seed_semaphore.acquire()
         try:
-            r = requests.get(
+            data = get_json(
                 'https://api.bybit.com/v5/market/kline',
                 params={'category': 'linear', 'symbol': symbol,
                         'interval': interval, 'limit': limit},
                 timeout=10)
-            data = r.json()
             if data.get('retCode') != 0:
                 return
             candles = []
@@ -167,7 +170,7 @@ class BybitWSManager:
                 })
             with self._lock:
                 self._klines[(symbol, interval)] = candles
-            logger.debug(f'WS: seeded {len(candles)} klines {symbol}/{interval}')
+            logger.debug('WS: seeded %d klines %s/%s', len(candles), symbol, interval)
         except Exception as e:
             logger.warning(f'WS: seed_klines {symbol}/{interval}: {e}')
         finally:
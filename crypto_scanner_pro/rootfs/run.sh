@@ -4,4 +4,5 @@ set -e
 echo "🚀 Starting Crypto Scanner Pro..."
 
 cd /app
-python3 -u app.py
+export PYTHONUNBUFFERED=1
+exec gunicorn --config gunicorn_conf.py app:app